@@ -0,0 +1,409 @@
+"""
+Live recording sessions: audio is uploaded and decoded while it is recorded.
+
+The recorder page sends MediaRecorder chunks as they are produced. Each take
+is a session directory under AUDIO_RECORDER_LIVE_DIR:
+
+  owner      id of the user recording it; other users can't touch the take
+  input      the chunks, appended in order (by whichever web worker gets them)
+  finished   written when recording stops; holds the final input size
+  alive      touched by the live decoder while it waits for more input
+  pcm.f32    the decoded take: mono float32 at LIVE_FRAME_RATE
+  pcm.json   written once pcm.f32 is complete (frames, peak)
+
+The worker that starts a session also starts a long-running ffmpeg that
+tails `input` and decodes it as it grows, so by the time recording stops
+there is little left to do. Live decoders come from their own bounded pool;
+if none is free, or the worker that ran it went away, the take is decoded
+from `input` when it is first needed instead.
+
+Rendering the download (render_takes) mirrors what the page does with its
+AudioBuffer: each take is peak-normalised, trimmed and concatenated, then
+encoded to MP3 through the recorder's transcoding pool.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .transcoder import STREAM_CHUNK_SIZE, Transcoder, TranscoderBusy, get_transcoder
+
+LIVE_FRAME_RATE = 48000
+DECODE_COMMAND = [
+    "ffmpeg", "-hide_banner", "-loglevel", "error",
+    "-i", "pipe:0",
+    "-ac", "1", "-ar", str(LIVE_FRAME_RATE),
+    "-f", "f32le", "pipe:1",
+]
+ENCODE_COMMAND = [
+    "ffmpeg", "-hide_banner", "-loglevel", "error",
+    "-f", "f32le", "-ac", "1", "-ar", str(LIVE_FRAME_RATE), "-i", "pipe:0",
+    "-codec:a", "libmp3lame",
+    "-f", "mp3", "pipe:1",
+]
+
+# Seconds between checks for new input while a live decoder waits
+POLL_INTERVAL = 0.1
+# A live decoder that has not checked in for this long is assumed gone
+ALIVE_TIMEOUT = 5.0
+# Frames per block when normalising and streaming takes to the encoder
+RENDER_BLOCK_FRAMES = 64 * 1024
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class TooManySessions(Exception):
+    """The user already has AUDIO_RECORDER_LIVE_SESSIONS_PER_USER takes recording."""
+
+
+class TakeTooLarge(Exception):
+    """A chunk or the whole take is over its size limit."""
+
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Chunk does not start at the current offset ({offset})")
+        self.offset = offset
+
+
+def live_dir():
+    return getattr(settings, 'AUDIO_RECORDER_LIVE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'live'))
+
+
+def idle_timeout():
+    return getattr(settings, 'AUDIO_RECORDER_LIVE_IDLE_TIMEOUT', 60)
+
+
+def max_chunk_bytes():
+    return getattr(settings, 'AUDIO_RECORDER_LIVE_MAX_CHUNK_BYTES', 2 * 1024 * 1024)
+
+
+def max_take_bytes():
+    return getattr(settings, 'AUDIO_RECORDER_LIVE_MAX_TAKE_BYTES', 100 * 1024 * 1024)
+
+
+def sessions_per_user():
+    return getattr(settings, 'AUDIO_RECORDER_LIVE_SESSIONS_PER_USER', 3)
+
+
+_decoders = None
+_decoders_lock = threading.Lock()
+
+
+def get_decoder_pool():
+    """
+    Pool for the long-running live decoders. They never queue: a session
+    that finds the pool full is simply decoded when it is first needed.
+    """
+    global _decoders
+    with _decoders_lock:
+        if _decoders is None:
+            _decoders = Transcoder(
+                workers=getattr(settings, 'AUDIO_RECORDER_LIVE_DECODERS', 16),
+                max_queue=0,
+                timeout=0,
+            )
+        return _decoders
+
+
+# -------------------------
+# Sessions
+# -------------------------
+def session_path(session_id, name=''):
+    # session_id comes from the URL; uuid.UUID() rejects anything path-like
+    try:
+        session_id = str(uuid.UUID(str(session_id)))
+    except ValueError:
+        raise SessionNotFound(session_id)
+    return os.path.join(live_dir(), session_id, name)
+
+
+def _session_owner(session_id):
+    try:
+        with open(session_path(session_id, 'owner')) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _existing_session_path(session_id, owner_id, name=''):
+    """
+    A file of a session owned by owner_id; anyone else's sessions are
+    reported as not found.
+    """
+    path = session_path(session_id, name)
+    if _session_owner(session_id) != str(owner_id):
+        raise SessionNotFound(session_id)
+    return path
+
+
+def open_sessions(owner_id):
+    """
+    How many of the owner's takes are still recording: not finished, and
+    sent a chunk within the idle timeout.
+    """
+    cutoff = time.time() - idle_timeout()
+    count = 0
+    try:
+        entries = list(os.scandir(live_dir()))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if (os.path.getmtime(os.path.join(entry.path, 'input')) >= cutoff
+                    and not os.path.exists(os.path.join(entry.path, 'finished'))
+                    and _session_owner(entry.name) == str(owner_id)):
+                count += 1
+        except (OSError, SessionNotFound):
+            continue
+    return count
+
+
+def start_session(owner_id):
+    """
+    Create a session for the user owner_id and start its live decoder if
+    the pool has room. Returns the session id. Raises TooManySessions if
+    the user already has sessions_per_user() takes recording.
+    """
+    discard_stale_sessions()
+    if open_sessions(owner_id) >= sessions_per_user():
+        raise TooManySessions(f"At most {sessions_per_user()} recordings at a time")
+    session_id = str(uuid.uuid4())
+    os.makedirs(session_path(session_id))
+    _write_atomic(session_path(session_id, 'owner'), str(owner_id).encode('ascii'))
+    open(session_path(session_id, 'input'), 'wb').close()
+
+    try:
+        pcm_chunks = get_decoder_pool().convert(_tail_input(session_id), DECODE_COMMAND)
+    except TranscoderBusy:
+        print(f"DEBUG LIVE: no free live decoder for {session_id}, will decode on finish")
+    else:
+        threading.Thread(target=_write_pcm, args=(session_id, pcm_chunks), daemon=True).start()
+    return session_id
+
+
+def append_chunk(session_id, offset, data, owner_id):
+    """
+    Append a chunk that starts at byte offset of the take. Retried chunks
+    are ignored; a gap raises OffsetMismatch with the offset to resume from.
+    Raises TakeTooLarge past max_chunk_bytes() per chunk or
+    max_take_bytes() per take. Returns the new input size.
+    """
+    path = _existing_session_path(session_id, owner_id, 'input')
+    if len(data) > max_chunk_bytes():
+        raise TakeTooLarge(f"Chunks are limited to {max_chunk_bytes()} bytes")
+    if os.path.exists(session_path(session_id, 'finished')):
+        raise OffsetMismatch(os.path.getsize(path))
+    with open(path, 'r+b') as f:
+        _lock_file(f)
+        size = f.seek(0, os.SEEK_END)
+        if offset + len(data) <= size:
+            return size  # already have it (a retry)
+        if offset != size:
+            raise OffsetMismatch(size)
+        if offset + len(data) > max_take_bytes():
+            raise TakeTooLarge(f"Recordings are limited to {max_take_bytes()} bytes")
+        f.write(data)
+        return offset + len(data)
+
+
+def finish_session(session_id, size, owner_id):
+    """
+    Mark the take as complete at size bytes.
+    """
+    path = _existing_session_path(session_id, owner_id, 'input')
+    received = os.path.getsize(path)
+    if received != size:
+        raise OffsetMismatch(received)
+    _write_atomic(session_path(session_id, 'finished'), str(size).encode('ascii'))
+
+
+def discard_stale_sessions():
+    max_age = getattr(settings, 'AUDIO_RECORDER_LIVE_MAX_AGE', 24 * 60 * 60)
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(live_dir()))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+
+
+def _write_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _read_chunks(path):
+    with open(path, 'rb') as f:
+        yield from iter(lambda: f.read(STREAM_CHUNK_SIZE), b'')
+
+
+def _lock_file(f):
+    try:
+        import fcntl
+    except ImportError:  # Windows dev machines: single process, no lock needed
+        return
+    fcntl.flock(f, fcntl.LOCK_EX)
+
+
+def _finished_size(session_id):
+    try:
+        with open(session_path(session_id, 'finished')) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+# -------------------------
+# Decoding
+# -------------------------
+def _tail_input(session_id):
+    """
+    Yield the session's input as it grows, until it is finished (or the
+    recorder has gone quiet for longer than the idle timeout).
+    """
+    input_path = session_path(session_id, 'input')
+    alive_path = session_path(session_id, 'alive')
+    offset = 0
+    last_data = time.monotonic()
+    last_alive = 0.0
+    with open(input_path, 'rb') as f:
+        while True:
+            now = time.monotonic()
+            if now - last_alive >= 1.0:
+                try:
+                    with open(alive_path, 'wb'):
+                        pass
+                except OSError:
+                    return  # session discarded
+                last_alive = now
+
+            f.seek(offset)
+            data = f.read(STREAM_CHUNK_SIZE)
+            if data:
+                offset += len(data)
+                last_data = now
+                yield data
+                continue
+
+            total = _finished_size(session_id)
+            if total is not None and offset >= total:
+                return
+            if now - last_data > idle_timeout():
+                print(f"DEBUG LIVE: {session_id} went quiet, stopping its live decoder")
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def _write_pcm(session_id, pcm_chunks):
+    """
+    Drain a decoder into pcm.f32, publishing it only if the whole take
+    was decoded.
+    """
+    part_path = session_path(session_id, f'pcm.{os.getpid()}.{threading.get_ident()}.part')
+    try:
+        with open(part_path, 'wb') as f:
+            for chunk in pcm_chunks:
+                f.write(chunk)
+        if _finished_size(session_id) is None:
+            return  # stopped before the take was finished; decode it later
+        _publish_pcm(session_id, part_path)
+    except Exception as e:
+        print(f"DEBUG LIVE: decoding {session_id} failed: {e}")
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def _publish_pcm(session_id, part_path):
+    pcm = np.fromfile(part_path, dtype='<f4')
+    peak = float(np.abs(pcm).max()) if len(pcm) else 0.0
+    os.replace(part_path, session_path(session_id, 'pcm.f32'))
+    meta = {'frames': len(pcm), 'peak': peak}
+    _write_atomic(session_path(session_id, 'pcm.json'), json.dumps(meta).encode('utf-8'))
+
+
+def _read_meta(session_id):
+    try:
+        with open(session_path(session_id, 'pcm.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _decoder_alive(session_id):
+    try:
+        return time.time() - os.path.getmtime(session_path(session_id, 'alive')) < ALIVE_TIMEOUT
+    except OSError:
+        return False
+
+
+def load_take(session_id, owner_id, timeout=30):
+    """
+    Return (pcm, meta) for a finished take, waiting for its live decoder
+    to catch up, or decoding the stored input if there is no live decoder.
+    pcm is a read-only memory-mapped float32 array.
+    """
+    _existing_session_path(session_id, owner_id)
+    if _finished_size(session_id) is None:
+        raise SessionNotFound(f"{session_id} is still recording")
+
+    deadline = time.monotonic() + timeout
+    meta = _read_meta(session_id)
+    while meta is None and _decoder_alive(session_id) and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        meta = _read_meta(session_id)
+
+    if meta is None:
+        print(f"DEBUG LIVE: decoding {session_id} from its stored input")
+        chunks = get_transcoder().convert(_read_chunks(session_path(session_id, 'input')), DECODE_COMMAND)
+        _write_pcm(session_id, chunks)
+        meta = _read_meta(session_id)
+        if meta is None:
+            raise SessionNotFound(f"{session_id} could not be decoded")
+
+    if not meta['frames']:
+        return np.zeros(0, dtype=np.float32), meta
+    return np.memmap(session_path(session_id, 'pcm.f32'), dtype='<f4', mode='r'), meta
+
+
+# -------------------------
+# Rendering
+# -------------------------
+def render_takes(takes, owner_id):
+    """
+    Encode the user owner_id's takes to MP3, yielding chunks.
+    takes is a list of (session_id, start_seconds, end_seconds) segments,
+    end None meaning the end of the take. Like the page's
+    normalizeAudioBuffer(), every take is scaled so its peak reaches full
+    scale.
+    """
+    segments = []
+    for session_id, start, end in takes:
+        pcm, meta = load_take(session_id, owner_id)
+        gain = 1.0 / min(meta['peak'], 1.0) if meta['peak'] > 0 else 1.0
+        first = min(max(int(start * LIVE_FRAME_RATE), 0), len(pcm))
+        last = len(pcm) if end is None else min(max(int(end * LIVE_FRAME_RATE), first), len(pcm))
+        segments.append((pcm, gain, first, last))
+
+    def samples():
+        for pcm, gain, first, last in segments:
+            for block_start in range(first, last, RENDER_BLOCK_FRAMES):
+                block = pcm[block_start:min(block_start + RENDER_BLOCK_FRAMES, last)]
+                yield (block * np.float32(gain)).astype('<f4').tobytes()
+
+    return get_transcoder().convert(samples(), ENCODE_COMMAND)
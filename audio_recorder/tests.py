@@ -1,3 +1,273 @@
-from django.test import TestCase
+import gc
+import io
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+import wave
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from pydub import AudioSegment
+
+from dawapp.models import MediaFile, user_upload_path
+
+from . import live, views
+from .transcoder import TranscodeError, Transcoder, TranscoderBusy
+
+
+def wav_bytes(seconds=1.0, frame_rate=22050):
+    frames = int(seconds * frame_rate)
+    samples = (int(8000 * math.sin(2 * math.pi * 440 * i / frame_rate)) for i in range(frames))
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(frame_rate)
+        f.writeframes(struct.pack(f'<{frames}h', *samples))
+    return out.getvalue()
+
+
+def chunked(data, size=4096):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+# -------------------------
+# MP3 transcoder pool
+# -------------------------
+class TranscoderTests(TestCase):
+    def test_converts_streamed_input(self):
+        transcoder = Transcoder(workers=1, max_queue=0, timeout=1)
+        mp3 = b''.join(transcoder.convert(chunked(wav_bytes())))
+        self.assertAlmostEqual(AudioSegment.from_file(io.BytesIO(mp3), format='mp3').duration_seconds, 1.0, delta=0.1)
+
+        stats = transcoder.stats()
+        self.assertEqual((stats['conversions'], stats['failures'], stats['running']), (1, 0, 0))
+        self.assertEqual(stats['recent'][0]['bytes_out'], len(mp3))
+
+    def test_busy_pool_turns_requests_away(self):
+        transcoder = Transcoder(workers=1, max_queue=0, timeout=1)
+        held = transcoder.convert(chunked(wav_bytes()))
+        with self.assertRaises(TranscoderBusy):
+            transcoder.convert(chunked(wav_bytes()))
+
+        # Closing a conversion that never started frees its slot
+        held.close()
+        transcoder.convert(chunked(wav_bytes())).close()
+        self.assertEqual(transcoder.stats()['rejected'], 1)
+
+    def test_waiting_request_times_out(self):
+        transcoder = Transcoder(workers=1, max_queue=1, timeout=0.1)
+        held = transcoder.convert(chunked(wav_bytes()))
+        with self.assertRaisesMessage(TranscoderBusy, 'in time'):
+            transcoder.convert(chunked(wav_bytes()))
+        held.close()
+
+    def test_slot_is_freed_after_use_failure_or_drop(self):
+        transcoder = Transcoder(workers=1, max_queue=0, timeout=1)
+
+        started = transcoder.convert(chunked(wav_bytes()))
+        next(started)
+        started.close()
+
+        with self.assertRaises(TranscodeError):
+            b''.join(transcoder.convert([b'not audio at all']))
+
+        transcoder.convert(chunked(wav_bytes()))  # dropped without close()
+        gc.collect()
+
+        b''.join(transcoder.convert(chunked(wav_bytes())))
+        stats = transcoder.stats()
+        self.assertEqual((stats['running'], stats['failures'], stats['rejected']), (0, 2, 0))
+
+
+class ConvertToMP3Tests(TestCase):
+    def post(self, body, content_type='audio/wav'):
+        return self.client.post(reverse('convert_to_mp3'), body, content_type=content_type)
+
+    def test_streams_the_mp3(self):
+        response = self.post(wav_bytes())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        mp3 = b''.join(response.streaming_content)
+        self.assertAlmostEqual(AudioSegment.from_file(io.BytesIO(mp3), format='mp3').duration_seconds, 1.0, delta=0.1)
+
+    def test_errors(self):
+        self.assertEqual(self.post(b'', content_type='application/json').status_code, 400)
+        self.assertEqual(self.post(b'not audio at all').status_code, 400)
+
+        busy = Transcoder(workers=1, max_queue=0, timeout=1)
+        held = busy.convert(iter([]))
+        with mock.patch.object(views, 'get_transcoder', return_value=busy):
+            response = self.post(wav_bytes())
+        held.close()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+
+# -------------------------
+# Live recording sessions
+# -------------------------
+@override_settings(AUDIO_RECORDER_LIVE_DECODERS=0, AUDIO_RECORDER_LIVE_SESSIONS_PER_USER=2)
+class LiveSessionTests(TestCase):
+    """
+    Chunk offsets, retries and resuming of live takes. No live decoders
+    run (the pool has no room), so only the upload side is exercised.
+    """
+    data = bytes(range(256)) * 16  # 4096 bytes
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='live-tests-')
+        self.settings_override = override_settings(AUDIO_RECORDER_LIVE_DIR=self.folder)
+        self.settings_override.enable()
+        live._decoders = None  # built from the settings above
+        self.owner = User.objects.create_user('recorder')
+        self.client.force_login(self.owner)
+
+    def tearDown(self):
+        live._decoders = None
+        self.settings_override.disable()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def start(self):
+        response = self.client.post(reverse('live_start'))
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def send(self, session, offset, data):
+        return self.client.post(f"{session['chunk_url']}?offset={offset}", data, content_type='application/octet-stream')
+
+    def finish(self, session, size):
+        return self.client.post(session['finish_url'], json.dumps({'size': size}), content_type='application/json')
+
+    def test_offsets_retries_and_gaps(self):
+        session = self.start()
+        self.assertEqual(self.send(session, 0, self.data[:1000]).json(), {'offset': 1000})
+
+        # A retry of a chunk the server already has just reports the offset
+        response = self.send(session, 0, self.data[:1000])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'offset': 1000})
+
+        # A gap is refused with the offset to resume from
+        response = self.send(session, 1500, self.data[1500:2000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+
+        self.assertEqual(self.send(session, 1000, self.data[1000:]).json(), {'offset': len(self.data)})
+        with open(live.session_path(session['session_id'], 'input'), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_finish_needs_every_byte(self):
+        session = self.start()
+        self.send(session, 0, self.data[:1000])
+
+        response = self.finish(session, len(self.data))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+
+        self.send(session, 1000, self.data[1000:])
+        self.assertEqual(self.finish(session, len(self.data)).status_code, 200)
+
+        # Nothing more is accepted once the take is finished
+        response = self.send(session, len(self.data), b'late')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], len(self.data))
+
+    def test_missing_offset(self):
+        session = self.start()
+        response = self.client.post(session['chunk_url'], b'x', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(AUDIO_RECORDER_LIVE_MAX_CHUNK_BYTES=1000, AUDIO_RECORDER_LIVE_MAX_TAKE_BYTES=1500)
+    def test_size_limits(self):
+        session = self.start()
+        self.assertEqual(self.send(session, 0, self.data[:1001]).status_code, 413)
+        self.assertEqual(self.send(session, 0, self.data[:1000]).status_code, 200)
+        self.assertEqual(self.send(session, 1000, self.data[1000:1600]).status_code, 413)
+        self.assertEqual(self.send(session, 1000, self.data[1000:1500]).json(), {'offset': 1500})
+
+    def test_sessions_per_user(self):
+        first = self.start()
+        self.start()
+        self.assertEqual(self.client.post(reverse('live_start')).status_code, 429)
+
+        # A finished take no longer counts
+        self.assertEqual(self.finish(first, 0).status_code, 200)
+        self.start()
+
+    def test_other_users_cannot_touch_the_take(self):
+        session = self.start()
+        self.send(session, 0, self.data)
+        self.finish(session, len(self.data))
+
+        self.client.force_login(User.objects.create_user('someone-else'))
+        self.assertEqual(self.send(session, 0, b'x').status_code, 404)
+        self.assertEqual(self.finish(session, len(self.data)).status_code, 404)
+        response = self.client.post(
+            reverse('live_render'), json.dumps({'takes': [{'id': session['session_id']}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.post(reverse('live_start'))
+        self.assertEqual(response.status_code, 302)
+
+
+# -------------------------
+# Saving recordings to the media library
+# -------------------------
+class SaveRecordingTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp(prefix='save-recording-tests-')
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.owner = User.objects.create_user('singer')
+        self.client.force_login(self.owner)
+        self.url = reverse('save_recording')
+
+    def save(self, body, filename='take', client=None, content_type='audio/wav'):
+        return (client or self.client).post(f'{self.url}?filename={filename}', body, content_type=content_type)
+
+    def leftovers(self):
+        # Recordings are encoded into a hidden part file in the user's upload folder
+        folder = os.path.join(self.media_root, os.path.dirname(user_upload_path(MediaFile(owner=self.owner), 'x')))
+        return os.listdir(folder)
+
+    def test_saves_the_encoded_recording(self):
+        response = self.save(wav_bytes())
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        media_file = MediaFile.objects.get(owner=self.owner)
+        self.assertEqual((data['id'], data['filename']), (media_file.id, 'take.mp3'))
+        self.assertAlmostEqual(data['duration'], 1.0, delta=0.1)
+        self.assertEqual(AudioSegment.from_file(media_file.file.path, format='mp3').channels, 1)
+        self.assertEqual(self.leftovers(), [])
+
+        # Students keep one upload at a time
+        self.assertEqual(self.save(wav_bytes()).status_code, 400)
+        self.assertEqual(MediaFile.objects.filter(owner=self.owner).count(), 1)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.save(b'not audio at all').status_code, 400)
+        self.assertEqual(self.save(b'{}', content_type='application/json').status_code, 400)
+        response = self.save(json.dumps({'takes': [{'id': 'no-such-take'}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(MediaFile.objects.exists())
+
+        self.client.logout()
+        self.assertEqual(self.save(wav_bytes()).status_code, 401)
+
+    def test_csrf_is_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.owner)
+        self.assertEqual(self.save(wav_bytes(), client=client).status_code, 403)
+        self.assertFalse(MediaFile.objects.exists())
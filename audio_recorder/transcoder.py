@@ -0,0 +1,214 @@
+"""
+Bounded pool of pipe-based ffmpeg encoders for recordings.
+
+Audio is streamed into ffmpeg's stdin by a feeder thread and the MP3 is read
+back from stdout as it is produced, so nothing touches the disk and the
+whole file is never held in memory. At most AUDIO_RECORDER_TRANSCODE_WORKERS
+encoders run at once per process; further requests wait (up to
+AUDIO_RECORDER_TRANSCODE_QUEUE waiting, each for at most
+AUDIO_RECORDER_TRANSCODE_TIMEOUT seconds) before being turned away.
+"""
+import subprocess
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+FFMPEG_MP3_COMMAND = [
+    "ffmpeg", "-hide_banner", "-loglevel", "error",
+    "-i", "pipe:0",
+    "-codec:a", "libmp3lame",
+    "-f", "mp3", "pipe:1",
+]
+
+# Bytes read from ffmpeg's stdout per streamed chunk
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class TranscoderBusy(Exception):
+    """No encoder became free in time (or too many requests are waiting)."""
+
+
+class TranscodeError(Exception):
+    """ffmpeg failed; the message is the tail of its stderr."""
+
+
+class Conversion:
+    """
+    The output of Transcoder.convert(): an iterator of encoded chunks that
+    holds an encoder slot. The slot is freed when the output is exhausted
+    or closed, or when it is dropped, even if it was never iterated.
+    """
+
+    def __init__(self, transcoder, chunks, command, wait_seconds):
+        self._transcoder = transcoder
+        self._output = transcoder._run(chunks, command, wait_seconds)
+        self._started = False
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise StopIteration
+        self._started = True
+        return next(self._output)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self._started:
+            self._output.close()  # _run() frees the slot on its way out
+        else:
+            self._transcoder._slots.release()
+
+    def __del__(self):
+        self.close()
+
+
+class Transcoder:
+    def __init__(self, workers, max_queue, timeout):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._timings = deque(maxlen=100)
+        self._totals = {'conversions': 0, 'failures': 0, 'rejected': 0}
+
+    def convert(self, chunks, command=FFMPEG_MP3_COMMAND):
+        """
+        Wait for a free encoder, then return a Conversion: an iterator of
+        output chunks for the input chunks. The encoder is held until it is
+        exhausted or closed; callers that may not iterate it should close()
+        it in a finally. Raises TranscoderBusy if no encoder frees up in time.
+        """
+        queued_at = time.monotonic()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    self._totals['rejected'] += 1
+                    raise TranscoderBusy("Too many conversions waiting")
+                self._waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self._totals['rejected'] += 1
+                raise TranscoderBusy("No encoder became free in time")
+        return Conversion(self, chunks, command, time.monotonic() - queued_at)
+
+    def _run(self, chunks, command, wait_seconds):
+        started = time.monotonic()
+        counts = {'in': 0, 'out': 0}
+        ok = False
+        process = None
+        threads = []
+        stderr_tail = deque(maxlen=20)
+        with self._lock:
+            self._running += 1
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            def feed():
+                try:
+                    for chunk in chunks:
+                        counts['in'] += len(chunk)
+                        process.stdin.write(chunk)
+                except (BrokenPipeError, ValueError, OSError):
+                    # ffmpeg exited early; its exit status reports why
+                    pass
+                finally:
+                    try:
+                        process.stdin.close()
+                    except OSError:
+                        pass
+
+            def drain_stderr():
+                # Keep ffmpeg from blocking on a full stderr pipe
+                for line in process.stderr:
+                    stderr_tail.append(line)
+
+            threads = [threading.Thread(target=target, daemon=True) for target in (feed, drain_stderr)]
+            for thread in threads:
+                thread.start()
+
+            while True:
+                data = process.stdout.read1(STREAM_CHUNK_SIZE)
+                if not data:
+                    break
+                counts['out'] += len(data)
+                yield data
+
+            process.wait()
+            if process.returncode != 0:
+                threads[1].join(timeout=1)
+                stderr = b''.join(stderr_tail).decode('utf-8', 'replace').strip()
+                raise TranscodeError(stderr[-500:] or f"ffmpeg exited with status {process.returncode}")
+            ok = True
+        finally:
+            if process is not None:
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+            for thread in threads:
+                thread.join(timeout=1)
+            if process is not None:
+                process.stdout.close()
+                process.stderr.close()
+            self._slots.release()
+            self._record(wait_seconds, time.monotonic() - started, counts, ok)
+
+    def _record(self, wait_seconds, encode_seconds, counts, ok):
+        timing = {
+            'wait_seconds': round(wait_seconds, 3),
+            'encode_seconds': round(encode_seconds, 3),
+            'bytes_in': counts['in'],
+            'bytes_out': counts['out'],
+            'ok': ok,
+        }
+        with self._lock:
+            self._running -= 1
+            self._timings.append(timing)
+            self._totals['conversions'] += 1
+            if not ok:
+                self._totals['failures'] += 1
+        print(f"DEBUG TRANSCODE: waited {wait_seconds:.2f}s, encoded {counts['in']} -> {counts['out']} bytes "
+              f"in {encode_seconds:.2f}s{'' if ok else ' (failed)'}")
+
+    def stats(self):
+        """
+        Pool occupancy, totals and the most recent per-conversion timings.
+        """
+        with self._lock:
+            return dict(
+                self._totals,
+                workers=self.workers,
+                running=self._running,
+                waiting=self._waiting,
+                recent=list(self._timings),
+            )
+
+
+_transcoder = None
+_transcoder_lock = threading.Lock()
+
+
+def get_transcoder():
+    global _transcoder
+    with _transcoder_lock:
+        if _transcoder is None:
+            _transcoder = Transcoder(
+                workers=getattr(settings, 'AUDIO_RECORDER_TRANSCODE_WORKERS', 2),
+                max_queue=getattr(settings, 'AUDIO_RECORDER_TRANSCODE_QUEUE', 8),
+                timeout=getattr(settings, 'AUDIO_RECORDER_TRANSCODE_TIMEOUT', 30),
+            )
+        return _transcoder
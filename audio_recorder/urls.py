@@ -5,4 +5,9 @@ from . import views
 urlpatterns = [
     path('record/', views.record_audio, name='record_audio'),
     path('convert/', views.convert_to_mp3, name='convert_to_mp3'),
+    path('save/', views.save_recording, name='save_recording'),
+    path('live/', views.live_start, name='live_start'),
+    path('live/render/', views.live_render, name='live_render'),
+    path('live/<uuid:session_id>/chunk/', views.live_chunk, name='live_chunk'),
+    path('live/<uuid:session_id>/finish/', views.live_finish, name='live_finish'),
 ]
@@ -1,45 +1,248 @@
 #audio_recorder/views.py
-import subprocess
-from django.http import HttpResponse, JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-from tempfile import NamedTemporaryFile
+import json
+import os
+from itertools import chain
+
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 
 from django.shortcuts import render
+from django.urls import reverse
+
+from dawapp.views import (
+    UPLOAD_LIMIT_ERROR, create_media_file_from_path, finish_upload, upload_limit_reached, upload_part_path,
+)
+
+from . import live
+from .transcoder import TranscodeError, TranscoderBusy, get_transcoder
+
+# Bytes read from a raw request body per chunk fed to the encoder
+REQUEST_CHUNK_SIZE = 64 * 1024
+
 
-# Render the recorder page
+# Render the recorder page (the live upload requests send its CSRF cookie back)
+@ensure_csrf_cookie
 def record_audio(request):
     return render(request, 'audio_recorder/record.html')
 
 
+def request_audio_chunks(request):
+    """
+    The uploaded audio as an iterator of chunks: either a multipart "audio"
+    file or a raw audio/* request body (read as it arrives), or None.
+    """
+    if request.content_type.startswith('audio/'):
+        return iter(lambda: request.read(REQUEST_CHUNK_SIZE), b'')
+    if request.FILES.get("audio"):
+        return request.FILES["audio"].chunks()
+    return None
+
+
 # Convert uploaded WAV to MP3
 @csrf_exempt
 def convert_to_mp3(request):
-    if request.method == "POST" and request.FILES.get("audio"):
-        audio_file = request.FILES["audio"]
-
-        # Temporary files for processing
-        with NamedTemporaryFile(delete=True, suffix=".wav") as temp_wav, \
-             NamedTemporaryFile(delete=True, suffix=".mp3") as temp_mp3:
-
-            # Write uploaded WAV to temp file
-            for chunk in audio_file.chunks():
-                temp_wav.write(chunk)
-            temp_wav.flush()
-
-            # Run system ffmpeg to convert to MP3
-            subprocess.run([
-                "ffmpeg",
-                "-y",  # overwrite output
-                "-i", temp_wav.name,
-                "-codec:a", "libmp3lame",
-                temp_mp3.name
-            ], check=True)
-
-            # Return MP3 as download
-            with open(temp_mp3.name, "rb") as f:
-                response = HttpResponse(f.read(), content_type="audio/mpeg")
-                response["Content-Disposition"] = 'attachment; filename="recording.mp3"'
-                return response
-
-    return JsonResponse({"error": "No audio uploaded"}, status=400)
+    chunks = request_audio_chunks(request) if request.method == "POST" else None
+    if chunks is None:
+        return JsonResponse({"error": "No audio uploaded"}, status=400)
+
+    # Waits for a free encoder; the pool caps how many ffmpeg processes run at once
+    try:
+        mp3_chunks = get_transcoder().convert(chunks)
+    except TranscoderBusy as e:
+        response = JsonResponse({"error": f"Converter busy: {e}"}, status=503)
+        response["Retry-After"] = "5"
+        return response
+
+    # Start encoding before responding, so input ffmpeg can't read is still
+    # reported as an error rather than an empty download
+    try:
+        first_chunk = next(mp3_chunks, b'')
+    except TranscodeError as e:
+        print(f"ERROR: Could not convert recording: {e}")
+        return JsonResponse({"error": "Could not convert audio"}, status=400)
+
+    # Stream the MP3 back as ffmpeg produces it
+    response = StreamingHttpResponse(chain([first_chunk], mp3_chunks), content_type="audio/mpeg")
+    response["Content-Disposition"] = 'attachment; filename="recording.mp3"'
+    return response
+
+
+# -------------------------
+# Live recording (see live.py)
+# -------------------------
+def live_session_data(session_id):
+    return {
+        'session_id': session_id,
+        'chunk_url': reverse('live_chunk', kwargs={'session_id': session_id}),
+        'finish_url': reverse('live_finish', kwargs={'session_id': session_id}),
+    }
+
+
+# Start a take: its chunks are decoded while recording continues
+@login_required
+def live_start(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+    try:
+        session_id = live.start_session(request.user.id)
+    except live.TooManySessions as e:
+        return JsonResponse({"error": str(e)}, status=429)
+    return JsonResponse(live_session_data(session_id), status=201)
+
+
+# Append a MediaRecorder chunk (raw body) at ?offset=<bytes already sent>
+@login_required
+def live_chunk(request, session_id):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+    try:
+        offset = int(request.GET.get('offset', ''))
+    except ValueError:
+        return JsonResponse({"error": "offset is required"}, status=400)
+    # Refuse oversized chunks before reading them
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > live.max_chunk_bytes():
+        return JsonResponse({"error": f"Chunks are limited to {live.max_chunk_bytes()} bytes"}, status=413)
+
+    try:
+        size = live.append_chunk(session_id, offset, request.body, request.user.id)
+    except live.SessionNotFound:
+        return JsonResponse({"error": "Unknown recording session"}, status=404)
+    except live.OffsetMismatch as e:
+        return JsonResponse({"error": str(e), "offset": e.offset}, status=409)
+    except live.TakeTooLarge as e:
+        return JsonResponse({"error": str(e)}, status=413)
+    return JsonResponse({"offset": size})
+
+
+# Recording stopped: {"size": total bytes sent}
+@login_required
+def live_finish(request, session_id):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+    try:
+        size = int(json.loads(request.body)['size'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "size is required"}, status=400)
+
+    try:
+        live.finish_session(session_id, size, request.user.id)
+    except live.SessionNotFound:
+        return JsonResponse({"error": "Unknown recording session"}, status=404)
+    except live.OffsetMismatch as e:
+        return JsonResponse({"error": "Recording is incomplete", "offset": e.offset}, status=409)
+    return JsonResponse({"success": True})
+
+
+def request_takes(request):
+    """
+    The (session_id, start, end) segments from a JSON body
+    {"takes": [{"id": ..., "start": s, "end": s or null}, ...]}, or None.
+    """
+    try:
+        return [
+            (str(take['id']), float(take.get('start') or 0), None if take.get('end') is None else float(take['end']))
+            for take in json.loads(request.body)['takes']
+        ]
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+# MP3 of finished takes: {"takes": [{"id": ..., "start": s, "end": s or null}, ...]}
+@login_required
+def live_render(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+    takes = request_takes(request)
+    if takes is None:
+        return JsonResponse({"error": "takes is required"}, status=400)
+    if not takes:
+        return JsonResponse({"error": "No takes to render"}, status=400)
+
+    try:
+        mp3_chunks = live.render_takes(takes, request.user.id)
+        first_chunk = next(mp3_chunks, b'')
+    except live.SessionNotFound as e:
+        return JsonResponse({"error": f"Recording not available: {e}"}, status=404)
+    except TranscoderBusy as e:
+        response = JsonResponse({"error": f"Converter busy: {e}"}, status=503)
+        response["Retry-After"] = "5"
+        return response
+    except TranscodeError as e:
+        print(f"ERROR: Could not render recording: {e}")
+        return JsonResponse({"error": "Could not convert audio"}, status=400)
+
+    response = StreamingHttpResponse(chain([first_chunk], mp3_chunks), content_type="audio/mpeg")
+    response["Content-Disposition"] = 'attachment; filename="recording.mp3"'
+    return response
+
+
+# -------------------------
+# Save to the user's media library
+# -------------------------
+# Encode a recording straight into a new MediaFile, instead of downloading
+# the MP3 and uploading it again. The body is either the finished live takes
+# (JSON, as for live_render) or the audio itself (as for convert_to_mp3);
+# ?filename= names the file. Returns the same JSON as upload_file.
+def save_recording(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=400)
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Not authenticated"}, status=401)
+
+    # Check the student limit before spending an encoder on it
+    if upload_limit_reached(request.user):
+        return JsonResponse({"error": UPLOAD_LIMIT_ERROR}, status=400)
+
+    filename = os.path.basename(request.GET.get("filename", "")) or "recording.mp3"
+    if not filename.lower().endswith(".mp3"):
+        filename += ".mp3"
+
+    try:
+        if request.content_type == "application/json":
+            takes = request_takes(request)
+            if not takes:
+                return JsonResponse({"error": "takes is required"}, status=400)
+            mp3_chunks = live.render_takes(takes, request.user.id)
+        else:
+            chunks = request_audio_chunks(request)
+            if chunks is None:
+                return JsonResponse({"error": "No audio uploaded"}, status=400)
+            mp3_chunks = get_transcoder().convert(chunks)
+    except live.SessionNotFound as e:
+        return JsonResponse({"error": f"Recording not available: {e}"}, status=404)
+    except TranscoderBusy as e:
+        response = JsonResponse({"error": f"Converter busy: {e}"}, status=503)
+        response["Retry-After"] = "5"
+        return response
+
+    # Encode into the user's upload folder, then rename it into place
+    part_path = None
+    try:
+        part_path = upload_part_path(request.user, "mp3.part")
+        with open(part_path, "wb") as f:
+            for chunk in mp3_chunks:
+                f.write(chunk)
+        if not os.path.getsize(part_path):
+            raise TranscodeError("ffmpeg produced no audio")
+
+        # Another upload may have finished while this one was encoding
+        if upload_limit_reached(request.user):
+            return JsonResponse({"error": UPLOAD_LIMIT_ERROR}, status=400)
+
+        media_file = create_media_file_from_path(request.user, filename, part_path)
+    except TranscodeError as e:
+        print(f"ERROR: Could not convert recording: {e}")
+        return JsonResponse({"error": "Could not convert audio"}, status=400)
+    finally:
+        # Frees the encoder even if the output was never (fully) read
+        mp3_chunks.close()
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
 
+    print(f"Created MediaFile from recording: {media_file.id}")
+    return JsonResponse(finish_upload(media_file))
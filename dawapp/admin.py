@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
-from .models import Profile, Project, MediaFile
+from .models import Profile, Project, ProjectClip, ProjectRevision, MediaFile, ExportJob, UploadSession
 
 class ProfileInline(admin.StackedInline):
     model = Profile
@@ -14,5 +14,9 @@ admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
 admin.site.register(Project)
+admin.site.register(ProjectClip)
+admin.site.register(ProjectRevision)
 admin.site.register(MediaFile)
+admin.site.register(ExportJob)
+admin.site.register(UploadSession)
 admin.site.register(Profile)
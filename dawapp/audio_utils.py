@@ -1,62 +1,770 @@
-from pydub import AudioSegment
+import os
+import subprocess
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
 
-def mixdown_project(project):
+import django
+import numpy as np
+from django.conf import settings
+from pydub import AudioSegment
+from pydub.utils import mediainfo
+
+from . import dsp, pcm_cache, stem_cache
+from .cache_utils import source_identity
+
+# pydub keeps PCM as signed little-endian integers of these widths
+SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+# pydub's AudioSegment.silent() defaults; the old overlay loop started from one,
+# so the mix never ends up with a lower rate, fewer channels or narrower samples
+BASE_FRAME_RATE = 11025
+BASE_CHANNELS = 1
+BASE_SAMPLE_WIDTH = 2
+
+MP3_PARAMETERS = ["-acodec", "libmp3lame", "-b:a", "128k"]
+
+# Decoded source audio: integer PCM shaped (frames, channels) plus its format
+DecodedAudio = namedtuple('DecodedAudio', ['pcm', 'frame_rate', 'channels', 'sample_width'])
+
+# A rendered mix: float32 samples shaped (frames, channels) in [-1, 1)
+Mix = namedtuple('Mix', ['samples', 'frame_rate', 'channels', 'sample_width'])
+
+
+def track_gain(track):
+    """
+    Linear gain for a track's 0–100 volume slider.
+    0 maps to -20 dB and 100 to 0 dB, the same curve the pydub path used.
+    """
+    track_volume = track.get('volume', 100)  # 0–100
+    track_gain_db = -20 + (track_volume / 100.0 * 20)
+    return 10 ** (track_gain_db / 20.0)
+
+
+def decode_source(local_path):
+    """
+    Decode an audio file into integer PCM.
+    Unchanged sources are read back from the PCM cache (memory-mapped);
+    only new or modified files are decoded with ffmpeg through pydub.
+    """
+    cached = cached_source(local_path)
+    if cached is not None:
+        return cached
+    decoded, _ = decode_and_cache(local_path)
+    return decoded
+
+
+def cached_source(local_path):
+    cached = pcm_cache.lookup(local_path)
+    if cached is None:
+        return None
+    pcm, meta = cached
+    return DecodedAudio(pcm, meta['frame_rate'], meta['channels'], meta['sample_width'])
+
+
+def decode_and_cache(local_path):
+    """
+    Decode with ffmpeg and store the result in the PCM cache.
+    Returns (decoded, stored).
+    """
+    decoded = segment_to_decoded(AudioSegment.from_file(local_path))
+    stored = pcm_cache.store(local_path, decoded.pcm, {
+        'frame_rate': decoded.frame_rate,
+        'channels': decoded.channels,
+        'sample_width': decoded.sample_width,
+    })
+    return decoded, stored
+
+
+def segment_to_decoded(segment):
+    dtype = SAMPLE_DTYPES[segment.sample_width]
+    pcm = np.frombuffer(segment.raw_data, dtype=dtype).reshape(-1, segment.channels)
+    return DecodedAudio(pcm, segment.frame_rate, segment.channels, segment.sample_width)
+
+
+def conform(decoded, frame_rate, channels, sample_width):
+    """
+    Return a source's integer PCM in the mix format.
+    Sources already in that format are used as-is (no copy, so cached sources
+    stay memory-mapped); anything else goes through pydub's own
+    resampling/channel mapping so the result matches what
+    AudioSegment.overlay() would have produced.
+    """
+    pcm = decoded.pcm
+    if (decoded.frame_rate, decoded.channels, decoded.sample_width) != (frame_rate, channels, sample_width):
+        segment = AudioSegment(
+            data=pcm.tobytes(),
+            sample_width=decoded.sample_width,
+            frame_rate=decoded.frame_rate,
+            channels=decoded.channels,
+        )
+        segment = segment.set_frame_rate(frame_rate).set_channels(channels).set_sample_width(sample_width)
+        pcm = segment_to_decoded(segment).pcm
+    return pcm
+
+
+# -------------------------
+# Parallel decode stage
+# -------------------------
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+def decode_workers():
+    return getattr(settings, 'DAW_DECODE_WORKERS', os.cpu_count() or 1)
+
+
+def _init_decode_worker():
+    # Forked workers (the Linux default) inherit the configured Django;
+    # spawned ones (macOS, Windows) need it set up to read the cache settings
+    django.setup()
+
+
+def _decode_in_worker(local_path):
+    """
+    Runs in a pool process. The decoded PCM is handed back through the PCM
+    cache rather than pickled across the process boundary; it is only
+    returned directly if it could not be cached.
+    """
+    decoded, stored = decode_and_cache(local_path)
+    return None if stored else decoded
+
+
+def get_decode_pool():
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = ProcessPoolExecutor(
+                max_workers=decode_workers(),
+                initializer=_init_decode_worker,
+            )
+        return _decode_pool
+
+
+def discard_decode_pool(pool):
+    """
+    Drop a pool that broke (a worker was OOM-killed or crashed): an
+    executor stays unusable after that, so the next get_decode_pool()
+    builds a new one.
+    """
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is pool:
+            _decode_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def load_sources(local_paths):
+    """
+    Decode each unique source path once, in parallel where it helps.
+    Returns {local_path: DecodedAudio or None if it failed to decode}.
+    Cached sources are read inline; only cache misses go to the worker pool.
+    """
+    sources = {}
+    pending = []
+    for local_path in dict.fromkeys(local_paths):
+        cached = cached_source(local_path)
+        if cached is not None:
+            sources[local_path] = cached
+        else:
+            pending.append(local_path)
+
+    if len(pending) > 1 and decode_workers() > 1:
+        pool = get_decode_pool()
+        try:
+            futures = {local_path: pool.submit(_decode_in_worker, local_path) for local_path in pending}
+        except BrokenProcessPool as e:
+            # Everything is decoded inline below; the next export gets a new pool
+            print(f"Decode pool is broken, decoding inline: {e}")
+            discard_decode_pool(pool)
+            futures = {}
+        else:
+            pending = []
+        for local_path, future in futures.items():
+            try:
+                decoded = future.result()
+                if decoded is None:
+                    # Decoded by the worker and stored in the cache; map it here
+                    decoded = cached_source(local_path)
+                sources[local_path] = decoded
+            except BrokenProcessPool as e:
+                print(f"Decode worker died while decoding {local_path}: {e}")
+                discard_decode_pool(pool)
+                sources[local_path] = None
+            except Exception as e:
+                print(f"Failed to load clip {local_path}: {e}")
+                sources[local_path] = None
+            if sources[local_path] is None:
+                # The worker failed, or its cache entry was evicted before
+                # we could map it: decode inline
+                pending.append(local_path)
+
+    for local_path in pending:
+        try:
+            sources[local_path], _ = decode_and_cache(local_path)
+        except Exception as e:
+            print(f"Failed to load clip {local_path}: {e}")
+            sources[local_path] = None
+
+    return sources
+
+
+# -------------------------
+# Partial (time-range) decoding
+# -------------------------
+# Extra seconds decoded past a window's end; ffmpeg's -t can stop a frame short
+WINDOW_DECODE_MARGIN = 0.05
+# Decode offsets are snapped down to this grid, which is a whole number of
+# frames at every common rate (8k-48k, 11025 and multiples), so resampling a
+# partial decode lines up sample for sample with resampling the whole file
+WINDOW_OFFSET_GRID = 0.04
+
+
+class PartialPCM:
+    """
+    A source that was only decoded around a render window. It behaves like
+    the full (frames, channels) PCM array for the slices the renderer takes;
+    frames outside the decoded part read as silence.
+    """
+
+    def __init__(self, pcm, offset, frames):
+        self.pcm = pcm
+        self.offset = offset
+        self.frames = max(frames, offset + len(pcm))
+        self.shape = (self.frames, pcm.shape[1])
+        self.dtype = pcm.dtype
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, key):
+        start, stop, _ = key.indices(self.frames)
+        out = np.zeros((max(stop - start, 0), self.shape[1]), dtype=self.dtype)
+        lo = max(start, self.offset)
+        hi = min(stop, self.offset + len(self.pcm))
+        if hi > lo:
+            out[lo - start:hi - start] = self.pcm[lo - self.offset:hi - self.offset]
+        return out
+
+
+def _probed(value, kind):
+    try:
+        return kind(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_metadata(local_path):
+    """
+    Duration (seconds), sample rate, channels, codec and bitrate (bits/s)
+    from ffprobe, without decoding. Anything ffprobe can't tell is None
+    ('' for the codec).
+    """
+    try:
+        info = mediainfo(local_path)
+    except OSError:
+        info = {}
+    return {
+        'duration': _probed(info.get('duration'), float),
+        'sample_rate': _probed(info.get('sample_rate'), int),
+        'channels': _probed(info.get('channels'), int),
+        'codec': info.get('codec_name') or '',
+        'bitrate': _probed(info.get('bit_rate'), int),
+    }
+
+
+def probe_duration(local_path):
+    """
+    Source duration in seconds from ffprobe (no decoding), or None.
+    """
+    return probe_metadata(local_path)['duration']
+
+
+def decode_window(local_path, start_second, duration):
+    """
+    Decode only [start_second, start_second + duration) of a source with ffmpeg.
+    """
+    segment = AudioSegment.from_file(local_path, start_second=start_second, duration=duration)
+    return segment_to_decoded(segment)
+
+
+def load_window_sources(placements, window_start_ms, window_end_ms, durations=None):
+    """
+    Decode just enough of each source to render [window_start_ms, window_end_ms).
+
+    Clips starting after the window are dropped without touching their files.
+    Sources already in the PCM cache are used whole (they are memory-mapped,
+    so only the pages the window reads are loaded). Anything else is probed
+    for its duration and, if it can still be heard in the window, decoded
+    from just before the window (enough lookback for its effects) to the
+    window's end.
+
+    durations maps source paths to durations already known from upload
+    metadata; only the rest are probed.
+
+    Returns (placements, decoded, windows) where windows maps the id of each
+    partially decoded source to (offset_seconds, total_seconds).
+    """
+    durations = durations or {}
+    kept = []
+    decoded = {}
+    windows = {}
+    for track_index, local_path, start_ms, effects in placements:
+        if start_ms >= window_end_ms:
+            continue
+
+        if local_path not in decoded:
+            cached = cached_source(local_path)
+            if cached is not None:
+                decoded[local_path] = cached
+        if decoded.get(local_path) is not None:
+            kept.append((track_index, local_path, start_ms, effects))
+            continue
+
+        duration = durations.get(local_path)
+        if duration is None:
+            duration = probe_duration(local_path)
+        clip_end_ms = start_ms + ((duration or 0) + dsp.tail_seconds(effects)) * 1000
+        if duration is not None and clip_end_ms <= window_start_ms:
+            continue
+
+        offset = max(0.0, (window_start_ms - start_ms) / 1000.0 - dsp.lookback_seconds(effects))
+        offset = round(int(offset / WINDOW_OFFSET_GRID) * WINDOW_OFFSET_GRID, 6)
+        length = (window_end_ms - start_ms) / 1000.0 - offset + WINDOW_DECODE_MARGIN
+        source_id = (local_path, offset, length)
+        if source_id not in decoded:
+            try:
+                part = decode_window(local_path, offset, length)
+            except Exception as e:
+                print(f"Failed to load clip {local_path}: {e}")
+                part = None
+            decoded[source_id] = part
+            if part is not None and len(part.pcm) < int((length - WINDOW_DECODE_MARGIN) * part.frame_rate):
+                # Decoding ran into the end of the file, which pins the exact
+                # duration (ffprobe's can be an estimate)
+                duration = offset + len(part.pcm) / part.frame_rate
+            windows[source_id] = (offset, duration or 0.0)
+        kept.append((track_index, source_id, start_ms, effects))
+
+    return kept, decoded, windows
+
+
+# -------------------------
+# Mixing
+# -------------------------
+# Everything render_block() needs: per-source PCM in the mix format and one
+# TrackPlan per non-empty track
+MixPlan = namedtuple('MixPlan', ['sources', 'tracks', 'frame_rate', 'channels', 'sample_width', 'total_frames'])
+
+# A track's linear gain, its (start_frame, local_path, chain) clip placements
+# (chain is a dsp.ClipEffects or None for a dry clip), its length in frames,
+# its cached stem (gain applied, memory-mapped) or None to render clips, and
+# a stem_cache.StemWriter collecting the rendered blocks into a new stem
+TrackPlan = namedtuple('TrackPlan', ['gain', 'clips', 'frames', 'stem', 'writer'], defaults=(None,))
+
+
+def plan_mix(project, use_stems=True, window=None, build_stems=True):
     """
-    Mix all tracks into a single AudioSegment,
+    Decode every referenced source once and lay out the timeline,
     respecting each track's volume and clip start times.
     Export only up to the last clip's end.
-    """
-    output = AudioSegment.silent(duration=0)
-    last_clip_end = 0  # in ms
 
-    tracks = project.project_json.get('tracks', [])
-    while len(tracks) < 4:
-        tracks.append({'clips': [], 'volume': 100})
+    With use_stems, every track is backed by a cached stem: unchanged tracks
+    are read back from the stem cache and changed ones are rendered into it,
+    so the mix itself is just a sum of stems. With build_stems=False the
+    missing stems aren't rendered up front: those tracks are rendered block
+    by block with the mix and their stems written as they go (see
+    finish_stems), which keeps a streaming export's first byte early.
 
-    for track in tracks:
-        track_volume = track.get('volume', 100)  # 0–100
-        # Convert volume 0–100 to dB change
-        track_gain_db = -20 + (track_volume / 100.0 * 20)
+    window=(start_ms, end_ms) plans only what is audible in that range:
+    clips outside it are skipped and uncached sources are only decoded for
+    the part that overlaps it (see load_window_sources). Stems are not used.
+    """
+    tracks = project.project_json.get('tracks', [])
 
+    # 1. Collect clip placements, then decode every referenced source once
+    placements = []  # (track_index, local_path, start_ms, effects)
+    durations = {}  # local_path -> seconds, from upload metadata
+    for track_index, track in enumerate(tracks):
         for clip in track.get('clips', []):
             local_path = clip.get('local_path')
             if not local_path:
                 print(f"Skipping clip {clip.get('filename')}: No valid path")
                 continue
 
-            try:
-                clip_audio = AudioSegment.from_file(local_path)
-
-                # Clip start time in ms
-                start_ms = int(clip.get('start_time', 0) * 1000)
+            # Uploads carry the metadata probed at upload time, so files with
+            # no audio are dropped here instead of failing in the decoder
+            source_info = clip.get('source_info')
+            if source_info:
+                if not source_info.get('duration'):
+                    print(f"Skipping clip {clip.get('filename')}: No audio in {local_path}")
+                    continue
+                durations[local_path] = source_info['duration']
 
-                # Apply track volume
-                adjusted_audio = clip_audio.apply_gain(track_gain_db)
+            # Clip start time in ms
+            start_ms = int(clip.get('start_time', 0) * 1000)
+            effects = clip.get('effects') if dsp.has_effects(clip.get('effects')) else None
+            placements.append((track_index, local_path, start_ms, effects))
 
-                # Update last clip end
-                clip_end = start_ms + len(adjusted_audio)
-                if clip_end > last_clip_end:
-                    last_clip_end = clip_end
+    windows = {}
+    if window:
+        placements, decoded, windows = load_window_sources(placements, *window, durations=durations)
+        use_stems = False
+    else:
+        decoded = load_sources(p[1] for p in placements)
+    placements = [p for p in placements if decoded[p[1]] is not None]
 
-                # Extend output if needed
-                if clip_end > len(output):
-                    output += AudioSegment.silent(duration=clip_end - len(output))
+    # 2. Pick the output format pydub would have synced every overlay to
+    used = [decoded[p[1]] for p in placements]
+    frame_rate = max([BASE_FRAME_RATE] + [s.frame_rate for s in used])
+    channels = max([BASE_CHANNELS] + [s.channels for s in used])
+    sample_width = max([BASE_SAMPLE_WIDTH] + [s.sample_width for s in used])
 
-                # Overlay clip at correct start
-                output = output.overlay(adjusted_audio, position=start_ms)
+    sources = {}
+    for source_id in {p[1] for p in placements}:
+        pcm = conform(decoded[source_id], frame_rate, channels, sample_width)
+        if source_id in windows:
+            offset_seconds, total_seconds = windows[source_id]
+            pcm = PartialPCM(pcm, int(round(offset_seconds * frame_rate)), int(round(total_seconds * frame_rate)))
+        sources[source_id] = pcm
+    full_scale = 1 << (8 * sample_width - 1)
 
-            except Exception as e:
-                print(f"Failed to load clip {local_path}: {e}")
+    # 3. Build each clip's effect chain (echo tails make a clip ring past its source)
+    plan_tracks = []
+    stem_keys = []
+    last_clip_end = 0  # in ms
+    for track_index, track in enumerate(tracks):
+        clips = []
+        stem_clips = []
+        track_frames = 0
+        for index, path, start_ms, effects in placements:
+            if index != track_index:
                 continue
+            chain = dsp.ClipEffects(effects, sources[path], frame_rate, full_scale) if effects else None
+            clip_start = int(start_ms * frame_rate / 1000)
+            clips.append((clip_start, path, chain))
+            if use_stems:
+                stem_clips.append((clip_start, source_identity(path), effects))
+
+            clip_frames = chain.length if chain else len(sources[path])
+            track_frames = max(track_frames, clip_start + clip_frames)
+            clip_ms = int(round(clip_frames * 1000.0 / frame_rate))
+            last_clip_end = max(last_clip_end, start_ms + clip_ms)
+        if clips:
+            gain = track_gain(track)
+            plan_tracks.append(TrackPlan(gain, clips, track_frames, None))
+            if use_stems:
+                stem_keys.append(stem_cache.stem_key((frame_rate, channels, sample_width), gain, stem_clips))
+
+    # 4. Export only up to the last clip's end
+    total_frames = int(last_clip_end * frame_rate / 1000)
+
+    plan = MixPlan(sources, plan_tracks, frame_rate, channels, sample_width, total_frames)
+    if use_stems:
+        plan = attach_stems(plan, stem_keys, build_stems)
+    return plan
+
+
+def attach_stems(plan, stem_keys, build=True):
+    """
+    Back every track of a plan with a stem, rendering only the missing ones,
+    or (build=False) giving them a StemWriter to fill while the mix renders.
+    """
+    tracks = []
+    hits = 0
+    for track, key in zip(plan.tracks, stem_keys):
+        stem = stem_cache.lookup(key)
+        if stem is not None:
+            hits += 1
+            tracks.append(track._replace(stem=stem))
+        elif build:
+            stem = stem_cache.build(
+                key, track.frames, plan.channels,
+                lambda out, track=track: _render_track_into(plan, track, out),
+            )
+            tracks.append(track._replace(stem=stem))
+        else:
+            tracks.append(track._replace(writer=stem_cache.StemWriter(key, track.frames, plan.channels)))
+
+    print(f"DEBUG STEMS: {hits} hit(s), {len(tracks) - hits} {'rendered' if build else 'deferred'}")
+    return plan._replace(tracks=tracks)
+
+
+def finish_stems(plan):
+    """
+    Publish the stems written while the mix rendered. Called once every
+    block has been rendered; renders any frames a track has past the end
+    of the mix first.
+    """
+    block_frames = export_block_frames()
+    for track in plan.tracks:
+        writer = track.writer
+        if writer is None:
+            continue
+        try:
+            while not writer.closed and writer.written < track.frames:
+                start = writer.written
+                writer.write(start, render_track_block(plan, track, start, min(block_frames, track.frames - start)))
+            writer.commit()
+        except Exception as e:
+            writer.discard()
+            print(f"Failed to store stem {writer.key}: {e}")
+
+
+def discard_stems(plan):
+    """
+    Drop the partly written stems of a render that didn't finish.
+    """
+    for track in plan.tracks:
+        if track.writer is not None:
+            track.writer.discard()
+
+
+def _render_track_into(plan, track, out):
+    block_frames = export_block_frames()
+    bus = np.empty((block_frames, plan.channels), dtype=np.float32)
+    for start in range(0, track.frames, block_frames):
+        frames = min(block_frames, track.frames - start)
+        out[start:start + frames] = render_track_block(plan, track, start, frames, bus[:frames])
+
+
+def render_track_block(plan, track, start, frames, bus=None):
+    """
+    Render frames [start, start + frames) of one track, gain applied.
+
+    Clips overlapping the block are summed into the track bus with vectorized
+    adds (clips with effects render just this block through their chain); the
+    bus is then scaled by the track gain (folded together with the
+    int-to-float normalisation) in a single multiply.
+    """
+    end = start + frames
+    scale = 1.0 / (1 << (8 * plan.sample_width - 1))
+
+    if bus is None:
+        bus = np.empty((frames, plan.channels), dtype=np.float32)
+    bus.fill(0.0)
+    for clip_start, path, chain in track.clips:
+        pcm = plan.sources[path]
+        lo = max(start, clip_start)
+        hi = min(end, clip_start + (chain.length if chain else len(pcm)))
+        if hi <= lo:
+            continue
+        if chain:
+            bus[lo - start:hi - start] += chain.render(lo - clip_start, hi - lo)
+        else:
+            bus[lo - start:hi - start] += pcm[lo - clip_start:hi - clip_start]
+
+    np.multiply(bus, np.float32(track.gain * scale), out=bus)
+    return bus
+
+
+def render_block(plan, start, frames):
+    """
+    Render frames [start, start + frames) of the mix as float32 samples in [-1, 1).
+    Tracks with a stem are summed straight from it; the rest are rendered.
+    """
+    end = start + frames
+    output = np.zeros((frames, plan.channels), dtype=np.float32)
+    bus = np.empty_like(output)
+    for track in plan.tracks:
+        if track.stem is None:
+            block = render_track_block(plan, track, start, frames, bus)
+            if track.writer is not None:
+                track.writer.write(start, block)
+            output += block
+            continue
+        hi = min(end, len(track.stem))
+        if hi > start:
+            output[:hi - start] += track.stem[start:hi]
+
+    return output
+
 
-    # Trim to last clip
-    output = output[:last_clip_end]
+def render_range(plan, start, frames):
+    """
+    Render frames [start, start + frames) into one buffer allocated once at
+    its final length. The range is rendered block by block so effect chains
+    never work on more than one block of a clip at a time.
+    """
+    block_frames = export_block_frames()
+    samples = np.empty((frames, plan.channels), dtype=np.float32)
+    for offset in range(0, frames, block_frames):
+        n = min(block_frames, frames - offset)
+        samples[offset:offset + n] = render_block(plan, start + offset, n)
+    return Mix(samples, plan.frame_rate, plan.channels, plan.sample_width)
+
+
+def render_mix(project):
+    """
+    Mix all tracks into one float32 buffer.
+    """
+    plan = plan_mix(project)
+    return render_range(plan, 0, plan.total_frames)
+
+
+def render_window(project, start_seconds, end_seconds):
+    """
+    Render only [start_seconds, end_seconds) of a project, for quick previews.
+    Work is proportional to the window, not the project: clips outside it are
+    skipped and uncached sources are only partly decoded.
+    """
+    window = (int(start_seconds * 1000), int(end_seconds * 1000))
+    plan = plan_mix(project, window=window)
+    start = int(window[0] * plan.frame_rate / 1000)
+    end = min(int(window[1] * plan.frame_rate / 1000), plan.total_frames)
+    return render_range(plan, start, max(end - start, 0))
+
+
+def export_mix(mix, format):
+    """
+    Encode a rendered mix as 'wav' (no encoder round-trip) or 'mp3'.
+    """
+    output = mix_to_segment(mix)
+    buffer = BytesIO()
+    if format == 'mp3':
+        output.export(buffer, format="mp3", parameters=MP3_PARAMETERS)
+    else:
+        output.export(buffer, format="wav")
+    buffer.seek(0)
+    return buffer
+
+
+def quantize(samples, sample_width):
+    """
+    Convert float samples back to integer PCM, saturating like audioop.add.
+    """
+    full_scale = 1 << (8 * sample_width - 1)
+    # float64: in float32, 2**31 - 1 rounds up to 2**31 and a clipped
+    # 32-bit peak would wrap round to full-scale negative
+    pcm = np.clip(samples.astype(np.float64) * full_scale, -full_scale, full_scale - 1)
+    return pcm.astype(SAMPLE_DTYPES[sample_width])
+
+
+def mix_to_segment(mix):
+    return AudioSegment(
+        data=quantize(mix.samples, mix.sample_width).tobytes(),
+        sample_width=mix.sample_width,
+        frame_rate=mix.frame_rate,
+        channels=mix.channels,
+    )
+
+
+def mixdown_project(project):
+    """
+    Mix all tracks into a single MP3,
+    respecting each track's volume and clip start times.
+    Export only up to the last clip's end.
+    """
+    output = mix_to_segment(render_mix(project))
 
     # Export MP3
     mp3_io = BytesIO()
-    output.export(mp3_io, format="mp3", parameters=["-acodec", "libmp3lame", "-b:a", "128k"])
+    output.export(mp3_io, format="mp3", parameters=MP3_PARAMETERS)
     mp3_io.seek(0)
 
     print(f"DEBUG MIXDOWN: {len(output)} ms, {mp3_io.getbuffer().nbytes} bytes")
     return mp3_io
+
+
+# -------------------------
+# Streaming export
+# -------------------------
+# ffmpeg raw input formats for pydub's signed little-endian sample widths
+PCM_FORMATS = {2: 's16le', 4: 's32le'}
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def export_block_frames():
+    return getattr(settings, 'DAW_EXPORT_BLOCK_FRAMES', 64 * 1024)
+
+
+def stream_mixdown(project, block_frames=None, progress=None):
+    """
+    Mix a project and return a generator of MP3 bytes.
+
+    The timeline is planned (and every source decoded) up front, so errors
+    surface before the response starts. After that it is rendered in blocks
+    of block_frames and piped through ffmpeg's stdin; encoded bytes are
+    yielded as soon as ffmpeg writes them. Memory stays at a few blocks
+    however long the project is. Cached track stems are summed as usual;
+    missing ones are written from the blocks as they render, never ahead
+    of the stream.
+
+    progress, if given, is called from the render thread as
+    progress(frames_rendered, total_frames) after each block.
+    """
+    plan = plan_mix(project, build_stems=False)
+    return _encode_blocks(plan, block_frames or export_block_frames(), progress)
+
+
+def _encode_blocks(plan, block_frames, progress=None):
+    command = [
+        AudioSegment.converter, '-hide_banner', '-loglevel', 'error',
+        '-f', PCM_FORMATS[plan.sample_width],
+        '-ar', str(plan.frame_rate),
+        '-ac', str(plan.channels),
+        '-i', 'pipe:0',
+        *MP3_PARAMETERS,
+        '-f', 'mp3', 'pipe:1',
+    ]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    failures = []
+
+    def feed():
+        rendered = False
+        try:
+            for start in range(0, plan.total_frames, block_frames):
+                block = render_block(plan, start, min(block_frames, plan.total_frames - start))
+                try:
+                    process.stdin.write(quantize(block, plan.sample_width).tobytes())
+                except (BrokenPipeError, ValueError):
+                    # Encoder went away (client disconnected or ffmpeg
+                    # failed); ffmpeg's exit status tells which
+                    return
+                if progress:
+                    progress(start + len(block), plan.total_frames)
+            rendered = True
+        except Exception as e:
+            # Closing stdin below makes ffmpeg finish a truncated file;
+            # the generator re-raises this so it is never taken as complete
+            failures.append(e)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            # Stems only need the render to be complete, not the encode
+            if rendered:
+                finish_stems(plan)
+            else:
+                discard_stems(plan)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+
+    sent = 0
+    finished = False
+    try:
+        while True:
+            chunk = process.stdout.read1(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            sent += len(chunk)
+            yield chunk
+        finished = True
+    finally:
+        process.stdout.close()
+        if not finished and process.poll() is None:
+            process.kill()
+        process.wait()
+        feeder.join()
+        print(f"DEBUG MIXDOWN (stream): {plan.total_frames} frames, {sent} bytes, ffmpeg exit {process.returncode}")
+
+    if failures:
+        raise failures[0]
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg exited with status {process.returncode} while encoding the mixdown")
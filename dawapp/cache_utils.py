@@ -0,0 +1,104 @@
+"""
+Helpers shared by the on-disk caches (PCM, stems, renders).
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+
+def source_identity(local_path):
+    """
+    (absolute path, size, mtime) for a source file; changes whenever the file does.
+    """
+    try:
+        st = os.stat(local_path)
+    except OSError:
+        return [local_path, None, None]
+    return [os.path.abspath(local_path), st.st_size, st.st_mtime_ns]
+
+
+def content_hash(path):
+    """
+    sha256 hex digest of a file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def json_hash(value):
+    """
+    sha256 hex digest of a JSON value, independent of key order.
+    """
+    canonical = json.dumps(value, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def atomic_write(path, write):
+    """
+    Call write(f) on a temp file next to path, then move it into place,
+    so readers never see a half-written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def directory_size(root, suffix):
+    """
+    Total bytes of the files ending in suffix under root.
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.endswith(suffix):
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+    return total
+
+
+def evict_lru(root, limit, suffix, companions=()):
+    """
+    Delete the least recently used (oldest mtime) files ending in suffix under
+    root until they total at most limit bytes. Files with the same stem and a
+    companion suffix are removed alongside. Returns the number evicted.
+    """
+    entries = []
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if not name.endswith(suffix):
+                continue
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+    entries.sort()
+    evicted = 0
+    for _, size, path in entries:
+        if total <= limit:
+            break
+        base = path[:-len(suffix)]
+        for victim in (path,) + tuple(base + companion for companion in companions):
+            try:
+                os.remove(victim)
+            except OSError:
+                pass
+        total -= size
+        evicted += 1
+    return evicted
@@ -0,0 +1,183 @@
+"""
+Server-side rendering of the clip effects daw.js stores in clip['effects'].
+
+Every stage is a pure function of the input with a fixed lookback, so any
+block of a clip can be rendered on its own: a block of `frames` samples needs
+the source from `start - lookback` onwards and nothing else. That keeps
+memory bounded for long clips and lets the exporter render blocks in any
+order.
+
+Stages, applied in series in this order:
+  fadeIn / fadeOut  linear gain ramps (seconds)
+  radio1910         400–2500 Hz band-pass (windowed-sinc FIR) plus light noise
+  echo              feedback delay line, 0.2 s delay and 0.3 feedback
+
+This is not how the browser preview wires them: daw.js feeds the faded
+signal to the speakers, the echo loop and the radio filters in parallel
+and sums the three. The export renders the effects as named instead: a
+radio clip is band-limited rather than dry plus filtered, and its echo
+repeats the filtered sound.
+
+Samples are float32 arrays shaped (frames, channels) in the mix's integer
+scale, so effects can be summed straight into the track bus.
+"""
+import numpy as np
+
+ECHO_DELAY = 0.2  # seconds, as in daw.js enableEcho()
+ECHO_FEEDBACK = 0.3
+ECHO_REPEATS = 6  # 0.3 ** 6 is below -60 dB; later repeats are dropped
+
+RADIO_LOW_HZ = 400.0  # as in daw.js enableRadio()
+RADIO_HIGH_HZ = 2500.0
+RADIO_TAPS = 255
+RADIO_NOISE_LEVEL = 0.02  # relative to full scale
+
+# Fixed noise table indexed by clip position, so re-rendering any block
+# (or the same block twice) gives identical output
+_NOISE_TABLE = np.random.default_rng(1910).standard_normal(1 << 16).astype(np.float32)
+
+
+def has_effects(effects):
+    # Old or hand-edited projects may hold null, a list, ... here
+    if not isinstance(effects, dict) or not effects:
+        return False
+    return bool(
+        _seconds(effects.get('fadeIn')) or _seconds(effects.get('fadeOut'))
+        or effects.get('echo') or effects.get('radio1910')
+    )
+
+
+def tail_seconds(effects):
+    """
+    How long a clip keeps sounding after its source ends.
+    """
+    if isinstance(effects, dict) and effects.get('echo'):
+        return ECHO_REPEATS * ECHO_DELAY
+    return 0.0
+
+
+def lookback_seconds(effects):
+    """
+    How much source before a block the chain needs (an upper bound, valid
+    for any frame rate the mixer uses).
+    """
+    if not isinstance(effects, dict):
+        return 0.0
+    lookback = tail_seconds(effects)
+    if effects.get('radio1910'):
+        lookback += RADIO_TAPS / 8000.0
+    return lookback
+
+
+def _seconds(value):
+    try:
+        return max(float(value or 0), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def bandpass_kernel(low_hz, high_hz, frame_rate, taps=RADIO_TAPS):
+    """
+    Linear-phase band-pass FIR: difference of two Hamming-windowed sinc low-passes.
+    """
+    n = np.arange(taps) - (taps - 1) / 2.0
+    high = 2 * high_hz / frame_rate * np.sinc(2 * high_hz / frame_rate * n)
+    low = 2 * low_hz / frame_rate * np.sinc(2 * low_hz / frame_rate * n)
+    return ((high - low) * np.hamming(taps)).astype(np.float32)
+
+
+def fft_convolve_valid(x, kernel):
+    """
+    Convolve each channel of x with kernel, returning only the samples that
+    had full input history: len(x) - len(kernel) + 1 frames.
+    """
+    taps = len(kernel)
+    size = 1 << int(np.ceil(np.log2(len(x) + taps - 1)))
+    spectrum = np.fft.rfft(x, size, axis=0) * np.fft.rfft(kernel, size)[:, None]
+    full = np.fft.irfft(spectrum, size, axis=0)
+    return full[taps - 1:len(x)].astype(np.float32)
+
+
+class ClipEffects:
+    """
+    The effect chain for one clip, rendered on demand block by block.
+
+    pcm is the clip's source in the mix format (integer samples, shaped
+    (frames, channels), possibly memory-mapped); full_scale is the mix's
+    integer full-scale value, used to level the radio noise.
+    """
+
+    def __init__(self, effects, pcm, frame_rate, full_scale):
+        self.pcm = pcm
+        self.frames = len(pcm)
+        self.frame_rate = frame_rate
+        self.full_scale = full_scale
+
+        self.fade_in = int(_seconds(effects.get('fadeIn')) * frame_rate)
+        self.fade_out = int(_seconds(effects.get('fadeOut')) * frame_rate)
+        self.radio = bool(effects.get('radio1910'))
+        self.echo = bool(effects.get('echo'))
+
+        self.kernel = bandpass_kernel(RADIO_LOW_HZ, RADIO_HIGH_HZ, frame_rate) if self.radio else None
+        self.echo_delay = int(ECHO_DELAY * frame_rate)
+
+        self.lookback = 0
+        if self.radio:
+            self.lookback += RADIO_TAPS - 1
+        if self.echo:
+            self.lookback += ECHO_REPEATS * self.echo_delay
+
+        # The echo rings on after the source ends
+        self.length = self.frames + (ECHO_REPEATS * self.echo_delay if self.echo else 0)
+
+    def _read(self, start, end):
+        """Source samples for [start, end) as float32, zero outside the clip."""
+        out = np.zeros((end - start, self.pcm.shape[1]), dtype=np.float32)
+        lo, hi = max(start, 0), min(end, self.frames)
+        if hi > lo:
+            out[lo - start:hi - start] = self.pcm[lo:hi]
+        return out
+
+    def _fade(self, x, start):
+        positions = np.arange(start, start + len(x), dtype=np.float32)
+        envelope = np.ones(len(x), dtype=np.float32)
+        if self.fade_in:
+            envelope *= np.clip(positions / self.fade_in, 0.0, 1.0)
+        if self.fade_out:
+            # A fade longer than the clip just ramps 1 -> 0 over the whole clip
+            fade_out = min(self.fade_out, self.frames)
+            envelope *= np.clip((self.frames - positions) / fade_out, 0.0, 1.0)
+        x *= envelope[:, None]
+        return x
+
+    def _noise(self, start, frames):
+        positions = np.arange(start, start + frames)
+        noise = _NOISE_TABLE[positions % len(_NOISE_TABLE)] * np.float32(RADIO_NOISE_LEVEL * self.full_scale)
+        # Only hiss while the clip itself is playing
+        noise[(positions < 0) | (positions >= self.frames)] = 0.0
+        return noise[:, None]
+
+    def render(self, start, frames):
+        """
+        Render clip-relative frames [start, start + frames) through the chain.
+        """
+        end = start + frames
+        x_start = start - self.lookback
+        x = self._fade(self._read(x_start, end), x_start)
+
+        if self.radio:
+            x = fft_convolve_valid(x, self.kernel)
+            x_start += RADIO_TAPS - 1
+            x += self._noise(x_start, len(x))
+
+        if self.echo:
+            # y[n] = x[n] + sum_k feedback^(k-1) * x[n - k*delay], a truncated
+            # feedback delay line that needs no state between blocks
+            offset = start - x_start
+            y = x[offset:].copy()
+            for k in range(1, ECHO_REPEATS + 1):
+                lag = k * self.echo_delay
+                y += np.float32(ECHO_FEEDBACK ** (k - 1)) * x[offset - lag:len(x) - lag]
+            return y
+
+        return x[start - x_start:]
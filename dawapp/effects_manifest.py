@@ -0,0 +1,100 @@
+"""
+In-memory manifest of the built-in effects library (settings.EFFECTS_ROOT).
+
+The manifest lists every effect with its duration, size and content hash.
+It is built once per process and rebuilt only when the directory (or its
+mtime) changes (a file added, removed or renamed); files whose size and mtime are
+unchanged keep their previous entry, so a rebuild only probes and hashes
+new files. Its version (a hash of the entries) and last-modified time let
+effects_list answer repeat requests with 304 Not Modified.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+
+from .audio_utils import probe_duration
+from .cache_utils import content_hash
+
+EFFECT_EXTENSION = '.mp3'
+
+# entries: list of dicts, sorted by name; version: hex digest of the entries;
+# last_modified: POSIX timestamp of the newest change to the library
+Manifest = namedtuple('Manifest', ['entries', 'version', 'last_modified'])
+
+_lock = threading.Lock()
+_manifest = None
+_dir_key = None  # (root, mtime_ns) the manifest was built from
+_entries_by_stat = {}  # (filename, size, mtime_ns) -> entry
+
+
+def effects_root():
+    return settings.EFFECTS_ROOT
+
+
+def effects_url_prefix():
+    return settings.MEDIA_URL + 'effects/'
+
+
+def _build(root):
+    global _entries_by_stat
+    entries = []
+    seen = {}
+    last_modified = os.stat(root).st_mtime
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if not entry.is_file() or not entry.name.lower().endswith(EFFECT_EXTENSION):
+            continue
+        st = entry.stat()
+        stat_key = (entry.name, st.st_size, st.st_mtime_ns)
+        item = _entries_by_stat.get(stat_key)
+        if item is None:
+            item = {
+                'name': os.path.splitext(entry.name)[0],
+                'file': effects_url_prefix() + entry.name,
+                'duration': probe_duration(entry.path),
+                'size': st.st_size,
+                'hash': content_hash(entry.path),
+            }
+        seen[stat_key] = item
+        entries.append(item)
+        last_modified = max(last_modified, st.st_mtime)
+
+    _entries_by_stat = seen
+    canonical = json.dumps(entries, sort_keys=True, separators=(',', ':'))
+    version = hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+    return Manifest(entries, version, last_modified)
+
+
+def get_manifest():
+    """
+    Return the current Manifest, rebuilding it if the directory changed.
+    A missing directory gives an empty manifest.
+    """
+    global _manifest, _dir_key
+    root = effects_root()
+    try:
+        mtime_ns = os.stat(root).st_mtime_ns
+    except OSError:
+        print("Effects directory does not exist:", root)
+        return Manifest([], hashlib.sha256(b'[]').hexdigest()[:32], 0.0)
+
+    with _lock:
+        if _manifest is None or (root, mtime_ns) != _dir_key:
+            _manifest = _build(root)
+            _dir_key = (root, mtime_ns)
+        return _manifest
+
+
+def effect_paths():
+    """
+    {effect URL: local path} for every effect in the current manifest.
+    """
+    root = effects_root()
+    prefix = effects_url_prefix()
+    return {
+        entry['file']: os.path.join(root, entry['file'][len(prefix):])
+        for entry in get_manifest().entries
+    }
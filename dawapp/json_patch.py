@@ -0,0 +1,164 @@
+"""
+RFC 6902 JSON Patch, as used by delta saves of project_json and by the
+revision history.
+
+apply_patch(document, operations) returns a patched deep copy; the
+original is never modified, so a failed patch leaves nothing half-applied.
+Supported ops: add, remove, replace, move, copy and test. make_patch()
+builds the operations between two documents (the same diff daw.js sends).
+"""
+import copy
+
+
+class JsonPatchError(ValueError):
+    """The patch is malformed or does not fit the document."""
+
+
+class JsonPatchTestFailed(JsonPatchError):
+    """A "test" operation did not match: the document is not what the client expected."""
+
+
+def parse_pointer(pointer):
+    """
+    Split an RFC 6901 JSON Pointer ("/tracks/0/clips/-") into its tokens.
+    """
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    if pointer == '':
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve(document, tokens):
+    """
+    The value the tokens point to.
+    """
+    value = document
+    for token in tokens:
+        if isinstance(value, dict):
+            if token not in value:
+                raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+            value = value[token]
+        elif isinstance(value, list):
+            value = value[_array_index(value, token)]
+        else:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+    return value
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, dict):
+        parent[key] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, key, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to a {type(parent).__name__}")
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JsonPatchError("Cannot remove the whole document")
+    parent = _resolve(document, tokens[:-1])
+    key = tokens[-1]
+    if isinstance(parent, dict):
+        if key not in parent:
+            raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+        return parent.pop(key)
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, key))
+    raise JsonPatchError(f"Path not found: /{'/'.join(tokens)}")
+
+
+def apply_patch(document, operations):
+    """
+    Apply a list of patch operations to a copy of document and return it.
+    Raises JsonPatchError (or JsonPatchTestFailed for a failed "test").
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("A patch is a list of operations")
+
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JsonPatchError(f"Invalid operation: {operation!r}")
+        op = operation['op']
+        tokens = parse_pointer(operation['path'])
+
+        if op in ('add', 'replace', 'test'):
+            if 'value' not in operation:
+                raise JsonPatchError(f"'{op}' needs a value")
+            value = copy.deepcopy(operation['value'])
+
+        if op == 'add':
+            document = _add(document, tokens, value)
+        elif op == 'remove':
+            _remove(document, tokens)
+        elif op == 'replace':
+            if tokens:
+                _resolve(document, tokens)  # must exist
+                _remove(document, tokens)
+            document = _add(document, tokens, value)
+        elif op in ('move', 'copy'):
+            from_tokens = parse_pointer(operation.get('from'))
+            if op == 'move' and tokens[:len(from_tokens)] == from_tokens and tokens != from_tokens:
+                raise JsonPatchError("Cannot move a value into itself")
+            if op == 'move':
+                value = _remove(document, from_tokens)
+            else:
+                value = copy.deepcopy(_resolve(document, from_tokens))
+            document = _add(document, tokens, value)
+        elif op == 'test':
+            if _resolve(document, tokens) != value:
+                raise JsonPatchTestFailed(f"Test failed at {operation['path']}")
+        else:
+            raise JsonPatchError(f"Unknown operation: {op!r}")
+    return document
+
+
+def _escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def make_patch(before, after, path='', operations=None):
+    """
+    Operations that turn before into after. Arrays are diffed index by
+    index, then trimmed or extended at the end.
+    """
+    if operations is None:
+        operations = []
+    if isinstance(before, list) and isinstance(after, list):
+        common = min(len(before), len(after))
+        for index in range(common):
+            make_patch(before[index], after[index], f'{path}/{index}', operations)
+        for index in range(len(before) - 1, common - 1, -1):
+            operations.append({'op': 'remove', 'path': f'{path}/{index}'})
+        for value in after[common:]:
+            operations.append({'op': 'add', 'path': f'{path}/-', 'value': value})
+    elif isinstance(before, dict) and isinstance(after, dict):
+        for key in before:
+            if key not in after:
+                operations.append({'op': 'remove', 'path': f'{path}/{_escape(key)}'})
+        for key, value in after.items():
+            if key in before:
+                make_patch(before[key], value, f'{path}/{_escape(key)}', operations)
+            else:
+                operations.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': value})
+    elif before != after or type(before) is not type(after):
+        operations.append({'op': 'replace', 'path': path, 'value': after})
+    return operations
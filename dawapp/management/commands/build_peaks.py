@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from dawapp import effects_manifest, peaks
+from dawapp.models import MediaFile
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.m4a')
+
+
+class Command(BaseCommand):
+    help = "Build waveform peak sidecars for the built-in effects and any uploads that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Rebuild every sidecar, not just missing or stale ones.")
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for local_path in self.source_paths():
+            try:
+                if options['force']:
+                    peaks.build(local_path)
+                else:
+                    peaks.ensure(local_path)
+                built += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Failed to build peaks for {local_path}: {e}")
+        self.stdout.write(f"Peaks up to date for {built} file(s), {failed} failed")
+
+    def source_paths(self):
+        effects_root = effects_manifest.effects_root()
+        if os.path.isdir(effects_root):
+            for name in sorted(os.listdir(effects_root)):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield os.path.join(effects_root, name)
+        else:
+            self.stderr.write(f"Effects directory does not exist: {effects_root}")
+
+        for media_file in MediaFile.objects.all().iterator():
+            if media_file.file and os.path.exists(media_file.file.path):
+                yield media_file.file.path
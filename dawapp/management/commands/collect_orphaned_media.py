@@ -0,0 +1,141 @@
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from dawapp.models import MediaFile, Project, ProjectClip, UploadSession
+from dawapp.peaks import SUFFIX as PEAKS_SUFFIX
+
+# Top-level MEDIA_ROOT folders the DAW writes to; everything else (the
+# built-in effects, other apps' uploads) is never touched. Nothing refers
+# to exports/ any more: export jobs used to copy their MP3 there
+MANAGED_DIR_RE = re.compile(r'^(user_\d+|blobs|exports)$')
+# Chunked-upload part files (UploadSession.part_path)
+PART_FILE_RE = re.compile(r'^\.([0-9a-f-]{36})\.part$')
+
+# Files checked against the database per round of queries
+BATCH_SIZE = 500
+
+
+def walk_files(root):
+    """
+    Yield a DirEntry for every file under root, one directory listing at
+    a time.
+    """
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except OSError:
+            continue
+
+
+def reference_key(name):
+    """
+    The stored file a media-relative name stands for: a peaks sidecar
+    belongs to its audio file.
+    """
+    return name[:-len(PEAKS_SUFFIX)] if name.endswith(PEAKS_SUFFIX) else name
+
+
+def referenced_names(keys):
+    """
+    The subset of keys (media-relative names) still in use: by a
+    MediaFile, a clip in any project or an upload in progress.
+    """
+    keys = list(keys)
+    found = set(MediaFile.objects.filter(file__in=keys).values_list('file', flat=True))
+
+    urls = {settings.MEDIA_URL + key: key for key in keys}
+    found.update(urls[url] for url in ProjectClip.objects.filter(file_url__in=list(urls)).values_list('file_url', flat=True))
+
+    session_ids = {}
+    for key in keys:
+        match = PART_FILE_RE.match(os.path.basename(key))
+        if match:
+            try:
+                session_ids[uuid.UUID(match.group(1))] = key
+            except ValueError:
+                pass
+    if session_ids:
+        active = UploadSession.objects.filter(pk__in=list(session_ids)).values_list('pk', flat=True)
+        found.update(session_ids[pk] for pk in active)
+    return found
+
+
+class Command(BaseCommand):
+    help = ("Report (with --dry-run) or delete files under MEDIA_ROOT that no MediaFile, "
+            "project clip or upload in progress refers to, once they are older than the grace period.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the orphaned files and how much space they use.")
+        parser.add_argument('--grace-hours', type=float, default=24.0,
+                            help="Leave files touched within this many hours alone (default 24).")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = time.time() - options['grace_hours'] * 3600
+        root = settings.MEDIA_ROOT
+
+        # Clip references come from ProjectClip; projects without rows may
+        # predate the table, so index them first rather than miss their clips
+        for project in Project.objects.annotate(clip_rows=Count('clips')).filter(clip_rows=0).iterator():
+            ProjectClip.sync(project)
+
+        self.scanned = self.orphans = self.orphan_bytes = 0
+        batch = {}  # reference key -> [(name, DirEntry, size)]
+        batch_files = 0
+        for top in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            if not MANAGED_DIR_RE.match(top) or not os.path.isdir(os.path.join(root, top)):
+                continue
+            for entry in walk_files(os.path.join(root, top)):
+                self.scanned += 1
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                # Blob reuse is recorded in the access time (see storage.py)
+                if max(st.st_mtime, st.st_atime) > cutoff:
+                    continue
+                name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                batch.setdefault(reference_key(name), []).append((name, entry, st.st_size))
+                batch_files += 1
+                if batch_files >= BATCH_SIZE:
+                    self.collect(batch, dry_run)
+                    batch = {}
+                    batch_files = 0
+        if batch:
+            self.collect(batch, dry_run)
+
+        action = "Found" if dry_run else "Deleted"
+        self.stdout.write(f"Scanned {self.scanned} file(s). {action} {self.orphans} orphaned file(s), "
+                          f"{self.orphan_bytes / 1e6:.1f} MB{' (dry run)' if dry_run else ''}")
+
+    def collect(self, batch, dry_run):
+        in_use = referenced_names(batch)
+        for key, files in batch.items():
+            if key in in_use:
+                continue
+            for name, entry, size in files:
+                if dry_run:
+                    self.stdout.write(f"Orphaned: {name} ({size} bytes)")
+                else:
+                    try:
+                        os.remove(entry.path)
+                    except OSError as e:
+                        self.stderr.write(f"Could not delete {name}: {e}")
+                        continue
+                    self.stdout.write(f"Deleted: {name}")
+                self.orphans += 1
+                self.orphan_bytes += size
@@ -0,0 +1,100 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dawapp import peaks
+from dawapp.cache_utils import content_hash
+from dawapp.models import MediaFile, Project
+from dawapp.storage import blob_digest, blob_extension, blob_name
+
+
+def rewrite_file_urls(data, urls):
+    """
+    Replace every "file" value found in urls (old URL -> new URL) anywhere
+    in a project's JSON. Returns True if anything changed.
+    """
+    changed = False
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key == 'file' and isinstance(value, str) and value in urls:
+                data[key] = urls[value]
+                changed = True
+            else:
+                changed = rewrite_file_urls(value, urls) or changed
+    elif isinstance(data, list):
+        for item in data:
+            changed = rewrite_file_urls(item, urls) or changed
+    return changed
+
+
+class Command(BaseCommand):
+    help = ("Move uploads stored before content addressing into the blob store, "
+            "sharing one blob between identical files, and point projects at the new URLs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report what would be merged and how much space it saves.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        storage = MediaFile._meta.get_field('file').storage
+
+        names = {}  # old name -> blob name
+        digests_seen = set()
+        saved_bytes = missing = 0
+        legacy = MediaFile.objects.exclude(file='').only('id', 'file').iterator()
+        for media_file in legacy:
+            name = media_file.file.name
+            if blob_digest(name) or name in names:
+                continue
+            local_path = storage.path(name)
+            if not os.path.exists(local_path):
+                missing += 1
+                self.stderr.write(f"Missing file for MediaFile {media_file.id}: {name}")
+                continue
+
+            digest = content_hash(local_path)
+            target = blob_name(digest, blob_extension(name))
+            if target in digests_seen or storage.exists(target):
+                saved_bytes += os.path.getsize(local_path)
+            digests_seen.add(target)
+            names[name] = target
+
+        self.stdout.write(f"{len(names)} legacy upload(s) -> {len(digests_seen)} blob(s), "
+                          f"{saved_bytes / 1e6:.1f} MB saved, {missing} missing")
+        if dry_run or not names:
+            return
+
+        # Store the blobs first, keeping the old files: until the rows and
+        # projects below are committed, the old names must keep working
+        for name, target in names.items():
+            local_path = storage.path(name)
+            stored = storage.save_local(local_path, name, digest=blob_digest(target), move=False)
+            try:
+                peaks.ensure(storage.path(stored))
+            except Exception as e:
+                self.stderr.write(f"Failed to build peaks for {stored}: {e}")
+
+        urls = {settings.MEDIA_URL + name: settings.MEDIA_URL + target for name, target in names.items()}
+        projects = 0
+        with transaction.atomic():
+            for name, target in names.items():
+                MediaFile.objects.filter(file=name).update(file=target)
+            for project in Project.objects.select_for_update().iterator():
+                if rewrite_file_urls(project.project_json, urls):
+                    project.save(update_fields=['project_json'])
+                    projects += 1
+
+        # Committed: the old copies are no longer referenced
+        for name in names:
+            local_path = storage.path(name)
+            peaks.remove(local_path)
+            try:
+                os.remove(local_path)
+            except OSError:
+                pass
+
+        self.stdout.write(f"Moved {len(names)} upload(s) into {len(digests_seen)} blob(s), "
+                          f"updated {projects} project(s)")
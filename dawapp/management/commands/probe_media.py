@@ -0,0 +1,27 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from dawapp.models import MediaFile
+
+
+class Command(BaseCommand):
+    help = "Fill in the audio metadata (duration, sample rate, ...) of uploads saved before it was probed at upload."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Re-probe every upload, not just those without metadata.")
+
+    def handle(self, *args, **options):
+        media_files = MediaFile.objects.all()
+        if not options['all']:
+            media_files = media_files.filter(duration__isnull=True)
+
+        probed = 0
+        for media_file in media_files.iterator():
+            if not media_file.file or not os.path.exists(media_file.file.path):
+                self.stderr.write(f"Missing file for MediaFile {media_file.pk}: {media_file.file}")
+                continue
+            media_file.update_metadata()
+            probed += 1
+        self.stdout.write(f"Probed {probed} upload(s)")
@@ -0,0 +1,126 @@
+import threading
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from dawapp import render_cache
+from dawapp.audio_utils import stream_mixdown
+from dawapp.models import ExportJob
+from dawapp.views import prepare_export_project
+
+# Seconds between heartbeat (and progress) writes while a job renders
+PROGRESS_INTERVAL = 1.0
+
+
+class Command(BaseCommand):
+    help = "Render queued project exports (POST /api/export/<pk>/) outside the web workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help="Render whatever is queued, then exit instead of polling.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Export worker started")
+        self.requeue_abandoned()
+        self.purge_finished()
+        while True:
+            job = self.claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                # Idle: pick up jobs left behind by workers that died since
+                self.requeue_abandoned()
+                self.purge_finished()
+                time.sleep(options['poll_interval'])
+                continue
+            self.run_job(job)
+
+    def requeue_abandoned(self):
+        requeued = ExportJob.requeue_abandoned()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} export(s) abandoned by a stopped worker")
+
+    def purge_finished(self):
+        purged = ExportJob.purge_finished()
+        if purged:
+            self.stdout.write(f"Deleted {purged} finished export(s) past DAW_EXPORT_JOB_MAX_AGE")
+
+    def claim_next_job(self):
+        """
+        Atomically move the oldest queued job to running.
+        The conditional UPDATE means two workers can never claim the same job.
+        """
+        queued = ExportJob.objects.filter(status=ExportJob.STATUS_QUEUED).values_list('pk', flat=True)[:10]
+        for job_id in queued:
+            claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_QUEUED).update(
+                status=ExportJob.STATUS_RUNNING,
+                started=timezone.now(),
+                heartbeat=timezone.now(),
+                attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return ExportJob.objects.select_related('project').get(pk=job_id)
+        return None
+
+    def run_job(self, job):
+        self.stdout.write(f"Rendering export {job.id} ({job.project})")
+        state = {'progress': 0.0}
+        stop = threading.Event()
+
+        def progress(frames_done, total_frames):
+            state['progress'] = frames_done / total_frames if total_frames else 1.0
+
+        def beat():
+            # Runs for the whole job, planning included, so a job is only
+            # ever seen as abandoned when this process is gone
+            try:
+                while not stop.wait(PROGRESS_INTERVAL):
+                    ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING).update(
+                        heartbeat=timezone.now(), progress=state['progress'],
+                    )
+            finally:
+                connection.close()
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        try:
+            temp_project = prepare_export_project(job.project)
+            if temp_project.unresolved:
+                ExportJob.objects.filter(pk=job.pk).update(unresolved=temp_project.unresolved)
+            key = render_cache.render_key(temp_project.project_json)
+            # The download is served from the render cache, so an unchanged
+            # project (already cached) needs no work and no extra copy
+            if not render_cache.lookup(job.project_id, key):
+                for _ in render_cache.store_chunks(job.project_id, key, stream_mixdown(temp_project, progress=progress)):
+                    pass
+        except Exception as e:
+            traceback.print_exc()
+            ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING).update(
+                status=ExportJob.STATUS_FAILED,
+                error=str(e),
+                finished=timezone.now(),
+            )
+            self.stderr.write(f"Export {job.id} failed: {e}")
+            return
+        finally:
+            stop.set()
+            heart.join()
+
+        # Conditional: the status view may have given up on the job already
+        finished = ExportJob.objects.filter(pk=job.pk, status=ExportJob.STATUS_RUNNING).update(
+            status=ExportJob.STATUS_DONE,
+            progress=1.0,
+            render_key=key,
+            finished=timezone.now(),
+        )
+        if not finished:
+            self.stderr.write(f"Export {job.id} was given up on before it finished")
+            return
+        job.project.mark_exported()
+        self.stdout.write(f"Export {job.id} done")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from dawapp.models import Project, ProjectClip
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProjectClip rows of every project from its project_json (e.g. for projects saved before the table existed)."
+
+    def handle(self, *args, **options):
+        synced = 0
+        for project in Project.objects.select_related('owner').iterator():
+            ProjectClip.sync(project)
+            synced += 1
+        self.stdout.write(f"Synced clips for {synced} project(s)")
@@ -0,0 +1,87 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from dawapp.json_patch import make_patch
+from dawapp.models import ProjectRevision
+
+
+class Command(BaseCommand):
+    help = ("Thin old project revisions: keep every revision for DAW_HISTORY_KEEP_ALL_DAYS, then the last "
+            "of each day up to DAW_HISTORY_DAILY_DAYS, then the last of each week. The latest is always kept.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many revisions would be removed.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        keep_all = timedelta(days=getattr(settings, 'DAW_HISTORY_KEEP_ALL_DAYS', 2))
+        daily = timedelta(days=getattr(settings, 'DAW_HISTORY_DAILY_DAYS', 30))
+
+        removed = projects = 0
+        project_ids = ProjectRevision.objects.order_by().values_list('project_id', flat=True).distinct()
+        for project_id in project_ids.iterator():
+            entries = list(
+                ProjectRevision.objects.filter(project_id=project_id)
+                .order_by('revision').only('id', 'revision', 'created', 'base_id')
+            )
+            keep = self.retained(entries, now, keep_all, daily)
+            doomed = [entry for entry in entries if entry.id not in keep]
+            if not doomed:
+                continue
+            if not options['dry_run']:
+                self.remove(entries, keep, doomed)
+            removed += len(doomed)
+            projects += 1
+
+        action = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(f"{action} {removed} revision(s) from {projects} project(s)")
+
+    def retained(self, entries, now, keep_all, daily):
+        """
+        Ids of the revisions to keep: recent ones, then the newest of each
+        day, then the newest of each week.
+        """
+        keep = {entries[-1].id}
+        buckets = set()
+        for entry in reversed(entries):
+            age = now - entry.created
+            if age <= keep_all:
+                keep.add(entry.id)
+                continue
+            created = timezone.localtime(entry.created)
+            bucket = created.date() if age <= daily else tuple(created.isocalendar())[:2]
+            if bucket not in buckets:
+                buckets.add(bucket)
+                keep.add(entry.id)
+        return keep
+
+    def remove(self, entries, keep, doomed):
+        # Kept deltas whose snapshot is going are rebased first: the oldest of
+        # them becomes a snapshot and the others are re-diffed against it, so
+        # every restore is still one snapshot plus at most one patch
+        orphaned = defaultdict(list)
+        for entry in entries:
+            if entry.id in keep and entry.base_id is not None and entry.base_id not in keep:
+                orphaned[entry.base_id].append(entry)
+
+        with transaction.atomic():
+            for kept in orphaned.values():
+                states = [
+                    ProjectRevision.objects.select_related('base').get(pk=entry.pk).state()
+                    for entry in kept
+                ]
+                snapshot = kept[0]
+                ProjectRevision.objects.filter(pk=snapshot.pk).update(
+                    base=None, data=ProjectRevision.pack(states[0]),
+                )
+                for entry, state in zip(kept[1:], states[1:]):
+                    ProjectRevision.objects.filter(pk=entry.pk).update(
+                        base=snapshot.pk, data=ProjectRevision.pack(make_patch(states[0], state)),
+                    )
+            ProjectRevision.objects.filter(pk__in=[entry.pk for entry in doomed]).delete()
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0004_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediafile',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='channels',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='codec',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='duration',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mediafile',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:42
+
+import dawapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0005_mediafile_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='unresolved',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='mediafile',
+            name='file',
+            field=models.FileField(db_index=True, upload_to=dawapp.models.user_upload_path),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:52
+
+import dawapp.models
+import dawapp.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0007_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mediafile',
+            name='file',
+            field=models.FileField(db_index=True, storage=dawapp.storage.ContentAddressedStorage(), upload_to=dawapp.models.user_upload_path),
+        ),
+    ]
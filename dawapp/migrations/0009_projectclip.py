@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0008_mediafile_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectClip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('track_index', models.PositiveSmallIntegerField()),
+                ('clip_index', models.PositiveIntegerField()),
+                ('file_url', models.CharField(db_index=True, max_length=500)),
+                ('effect_name', models.CharField(blank=True, db_index=True, max_length=200)),
+                ('start_time', models.FloatField(default=0.0)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('media_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='project_clips', to='dawapp.mediafile')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='clips', to='dawapp.project')),
+            ],
+            options={
+                'ordering': ['project', 'track_index', 'clip_index'],
+                'indexes': [models.Index(fields=['project', 'start_time'], name='projectclip_project_start')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'track_index', 'clip_index'), name='unique_project_clip')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0009_projectclip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+from dawapp.cache_utils import json_hash
+
+
+def fill_content_hashes(apps, schema_editor):
+    Project = apps.get_model('dawapp', 'Project')
+    for project in Project.objects.only('pk', 'title', 'project_json').iterator(chunk_size=200):
+        Project.objects.filter(pk=project.pk).update(
+            content_hash=json_hash({'title': project.title, 'project_json': project.project_json}),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0010_project_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(fill_content_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def _seconds(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return value if value >= 0 else 0.0
+
+
+def fill_summaries(apps, schema_editor):
+    Project = apps.get_model('dawapp', 'Project')
+    ExportJob = apps.get_model('dawapp', 'ExportJob')
+    for project in Project.objects.only('pk', 'project_json').iterator(chunk_size=200):
+        clip_count = 0
+        duration = 0.0
+        tracks = project.project_json.get('tracks') if isinstance(project.project_json, dict) else None
+        for track in tracks if isinstance(tracks, list) else []:
+            clips = track.get('clips') if isinstance(track, dict) else None
+            for clip in clips if isinstance(clips, list) else []:
+                if isinstance(clip, dict):
+                    clip_count += 1
+                    start = _seconds(clip.get('start_time', clip.get('startTime')))
+                    duration = max(duration, start + _seconds(clip.get('duration')))
+        last_export = (ExportJob.objects.filter(project_id=project.pk, status='done')
+                       .order_by('-finished').values_list('finished', flat=True).first())
+        Project.objects.filter(pk=project.pk).update(clip_count=clip_count, duration=duration, last_export=last_export)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0011_project_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='clip_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='duration',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='last_export',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['-updated', '-id'], name='project_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['owner', '-updated', '-id'], name='project_owner_updated'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
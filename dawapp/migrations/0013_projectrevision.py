@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0012_project_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('data', models.BinaryField()),
+                ('base', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='deltas', to='dawapp.projectrevision')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='dawapp.project')),
+            ],
+            options={
+                'ordering': ['project', '-revision'],
+                'constraints': [models.UniqueConstraint(fields=('project', 'revision'), name='unique_project_revision')],
+            },
+        ),
+    ]
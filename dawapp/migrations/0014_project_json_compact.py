@@ -0,0 +1,47 @@
+from django.db import migrations, transaction
+
+import dawapp.project_codec
+
+# Rows converted per transaction
+BATCH_SIZE = 200
+
+
+def copy_in_batches(apps, source, target):
+    Project = apps.get_model('dawapp', 'Project')
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Project.objects.filter(pk__gt=last_pk).order_by('pk').only('pk', source)[:BATCH_SIZE])
+            if not batch:
+                return
+            for project in batch:
+                setattr(project, target, getattr(project, source))
+            Project.objects.bulk_update(batch, [target])
+        last_pk = batch[-1].pk
+
+
+def pack_projects(apps, schema_editor):
+    copy_in_batches(apps, 'project_json', 'project_json_compact')
+
+
+def unpack_projects(apps, schema_editor):
+    copy_in_batches(apps, 'project_json_compact', 'project_json')
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own, so large tables aren't converted in
+    # one long transaction; 0015 then swaps the columns
+    atomic = False
+
+    dependencies = [
+        ('dawapp', '0013_projectrevision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='project_json_compact',
+            field=dawapp.project_codec.CompactJSONField(default=dict),
+        ),
+        migrations.RunPython(pack_projects, unpack_projects),
+    ]
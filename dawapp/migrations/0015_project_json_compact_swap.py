@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0014_project_json_compact'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='project',
+            name='project_json',
+        ),
+        migrations.RenameField(
+            model_name='project',
+            old_name='project_json_compact',
+            new_name='project_json',
+        ),
+    ]
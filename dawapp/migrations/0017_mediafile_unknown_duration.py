@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def forget_failed_probes(apps, schema_editor):
+    # Failed probes used to be stored as a 0 s duration with no format,
+    # which made every export skip the clip; they are unknown instead
+    MediaFile = apps.get_model('dawapp', 'MediaFile')
+    MediaFile.objects.filter(duration=0.0, codec='', sample_rate__isnull=True).update(duration=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0016_exportjob_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(forget_failed_probes, migrations.RunPython.noop),
+    ]
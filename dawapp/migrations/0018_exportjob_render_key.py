@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dawapp', '0017_mediafile_unknown_duration'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='exportjob',
+            name='file',
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='render_key',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
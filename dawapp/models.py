@@ -1,8 +1,22 @@
-from django.db import models
+import json
+import os
+import zlib
+
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 import uuid
+from datetime import timedelta
+
+from . import effects_manifest, peaks, render_cache
+from .audio_utils import probe_metadata
+from .cache_utils import json_hash
+from .json_patch import apply_patch, make_patch
+from .project_codec import CompactJSONField
+from .storage import media_storage
 
 def user_upload_path(instance, filename):
     """
@@ -18,21 +32,461 @@ class Project(models.Model):
     title = models.CharField(max_length=200)
     project_uuid = models.UUIDField(default=uuid.uuid4, editable=False)
     # JSON data representing the tracks, clips, positions, volume, etc.
-    project_json = models.JSONField(default=dict)
+    # Stored compressed (see project_codec.py); reads back as plain JSON
+    project_json = CompactJSONField(default=dict)
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
+    # Bumped by every save; delta saves are made against a known revision
+    revision = models.PositiveIntegerField(default=0)
+    # sha256 of the title and project_json, recomputed by every save
+    content_hash = models.CharField(max_length=64, blank=True)
+
+    # Summaries for listings, so they never need project_json: the clip
+    # count and duration are recomputed by every save, last_export is set
+    # by the exporters
+    clip_count = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0.0)  # seconds, end of the last clip
+    last_export = models.DateTimeField(null=True, blank=True)
+
+    SUMMARY_FIELDS = ['clip_count', 'duration', 'last_export']
+
+    class Meta:
+        indexes = [
+            # Listings page through projects newest first, overall or per owner
+            models.Index(fields=['-updated', '-id'], name='project_updated'),
+            models.Index(fields=['owner', '-updated', '-id'], name='project_owner_updated'),
+        ]
 
     def __str__(self):
         return f"{self.title} ({self.owner.username})"
 
+    def update_summary(self):
+        self.clip_count = 0
+        self.duration = 0.0
+        for _, _, clip in iter_clips(self.project_json):
+            self.clip_count += 1
+            start = _seconds(clip.get('start_time', clip.get('startTime'))) or 0.0
+            self.duration = max(self.duration, start + (_seconds(clip.get('duration')) or 0.0))
+
+    def mark_exported(self):
+        # A plain UPDATE: exporting isn't an edit, so no new revision
+        self.last_export = timezone.now()
+        Project.objects.filter(pk=self.pk).update(last_export=self.last_export)
+
+    @property
+    def etag(self):
+        return f'"{self.revision}-{self.content_hash[:16]}"'
+
+    def compute_content_hash(self):
+        return json_hash({'title': self.title, 'project_json': self.project_json})
+
+    def save(self, *args, **kwargs):
+        self.content_hash = self.compute_content_hash()
+        self.update_summary()
+        if self._state.adding:
+            self.revision = 1
+        else:
+            # Incremented in the database so concurrent saves can't both
+            # claim the same revision
+            self.revision = models.F('revision') + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'revision', 'content_hash', 'clip_count', 'duration'}
+        super().save(*args, **kwargs)
+        if isinstance(self.revision, models.expressions.Combinable):
+            self.refresh_from_db(fields=['revision'])
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'title', 'project_json'} & set(update_fields):
+            ProjectRevision.record(self)
+
 class MediaFile(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
-    file = models.FileField(upload_to=user_upload_path)
+    # Content-addressed (see storage.py): identical uploads share one blob and
+    # the name upload_to gives is ignored; filename is the user's name for it.
+    # Indexed: exports resolve clip URLs to uploads by this column, and it
+    # counts a blob's references
+    file = models.FileField(upload_to=user_upload_path, storage=media_storage, db_index=True)
     filename = models.CharField(max_length=200)
     uploaded = models.DateTimeField(auto_now_add=True)
 
+    # Probed once at upload with ffprobe (no decoding); null until then
+    duration = models.FloatField(null=True, blank=True)  # seconds
+    sample_rate = models.PositiveIntegerField(null=True, blank=True)
+    channels = models.PositiveSmallIntegerField(null=True, blank=True)
+    codec = models.CharField(max_length=32, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True)  # bits per second
+
+    METADATA_FIELDS = ['duration', 'sample_rate', 'channels', 'codec', 'bitrate']
+
     def __str__(self):
         return f"{self.filename} ({self.owner.username})"
+
+    def update_metadata(self):
+        """
+        Probe the stored file and save its audio metadata fields.
+        If ffprobe can't tell the duration it stays None (unknown), and the
+        mixer decodes the file instead of trusting the metadata.
+        """
+        for field, value in probe_metadata(self.file.path).items():
+            setattr(self, field, value)
+        self.save(update_fields=self.METADATA_FIELDS)
+
+    def metadata(self):
+        return {field: getattr(self, field) for field in self.METADATA_FIELDS}
+
+
+@receiver(post_delete, sender=MediaFile)
+def release_media_blob(sender, instance, **kwargs):
+    # Blobs are shared: delete the file only once no MediaFile names it
+    name = instance.file.name
+    if not name:
+        return
+
+    def release():
+        if MediaFile.objects.filter(file=name).exists():
+            return
+        storage = instance.file.storage
+        if getattr(storage, 'recently_reused', None) and storage.recently_reused(name):
+            return  # may be about to gain a reference; left to collect_orphaned_media
+        local_path = storage.path(name)
+        peaks.remove(local_path)
+        storage.delete(name)
+
+    transaction.on_commit(release)
+
+
+class UploadSession(models.Model):
+    """
+    A chunked, resumable upload in progress. Chunks are written straight
+    into a hidden part file in the owner's upload folder; finalizing checks
+    the checksum and renames it into place as a MediaFile.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=200)
+    size = models.BigIntegerField()  # total bytes expected
+    received = models.BigIntegerField(default=0)  # bytes written so far
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload of {self.filename} ({self.received}/{self.size})"
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.MEDIA_ROOT, user_upload_path(self, f'.{self.id}.part'))
+
+    def discard(self):
+        """
+        Delete the session and whatever was received.
+        """
+        try:
+            os.remove(self.part_path)
+        except OSError:
+            pass
+        self.delete()
+
+
+class ExportJob(models.Model):
+    """
+    A queued mixdown, rendered by the `run_export_worker` management command
+    instead of inside the web worker that received the request. The MP3 goes
+    into the render cache (see render_cache.py) and is downloaded from there;
+    finished jobs are deleted after DAW_EXPORT_JOB_MAX_AGE.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='export_jobs')
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    progress = models.FloatField(default=0.0)  # 0.0–1.0
+    error = models.TextField(blank=True)
+    # Clips left out of the mix because their file could not be found
+    unresolved = models.JSONField(default=list, blank=True)
+    # Render-cache key of the finished MP3
+    render_key = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    # Last sign of life from a worker: set when the job is claimed or put
+    # back in the queue, and refreshed while it renders
+    heartbeat = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    # Jobs whose worker died this many times are failed, not requeued
+    MAX_ATTEMPTS = 3
+
+    class Meta:
+        ordering = ['created']
+
+    def __str__(self):
+        return f"Export of {self.project.title} ({self.status})"
+
+    @staticmethod
+    def heartbeat_timeout():
+        return timedelta(seconds=getattr(settings, 'DAW_EXPORT_HEARTBEAT_TIMEOUT', 60))
+
+    @staticmethod
+    def queue_timeout():
+        return timedelta(seconds=getattr(settings, 'DAW_EXPORT_QUEUE_TIMEOUT', 300))
+
+    @staticmethod
+    def max_age():
+        return timedelta(seconds=getattr(settings, 'DAW_EXPORT_JOB_MAX_AGE', 24 * 60 * 60))
+
+    @classmethod
+    def purge_finished(cls):
+        """
+        Delete done and failed jobs older than DAW_EXPORT_JOB_MAX_AGE.
+        Returns the number deleted.
+        """
+        deleted, _ = cls.objects.filter(
+            status__in=[cls.STATUS_DONE, cls.STATUS_FAILED],
+            finished__lt=timezone.now() - cls.max_age(),
+        ).delete()
+        return deleted
+
+    @classmethod
+    def requeue_abandoned(cls):
+        """
+        Put running jobs whose worker stopped sending heartbeats back in the
+        queue, failing those that have used up their attempts.
+        Returns the number requeued.
+        """
+        now = timezone.now()
+        cutoff = now - cls.heartbeat_timeout()
+        abandoned = cls.objects.filter(status=cls.STATUS_RUNNING).filter(
+            models.Q(heartbeat__lt=cutoff) | models.Q(heartbeat__isnull=True, started__lt=cutoff)
+        )
+        abandoned.filter(attempts__gte=cls.MAX_ATTEMPTS).update(
+            status=cls.STATUS_FAILED,
+            error="The export worker stopped while rendering this job",
+            finished=now,
+        )
+        return abandoned.update(status=cls.STATUS_QUEUED, progress=0.0, started=None, heartbeat=now)
+
+    def fail_if_stalled(self):
+        """
+        Fail the job if no worker is handling it: still queued after
+        DAW_EXPORT_QUEUE_TIMEOUT, or running without a heartbeat for
+        DAW_EXPORT_HEARTBEAT_TIMEOUT. Lets the page stop polling.
+        """
+        now = timezone.now()
+        if self.status == self.STATUS_QUEUED and (self.heartbeat or self.created) < now - self.queue_timeout():
+            error = "No export worker picked up this job. Is run_export_worker running?"
+        elif self.status == self.STATUS_RUNNING and (self.heartbeat or self.started) < now - self.heartbeat_timeout():
+            error = "The export worker stopped while rendering this job"
+        else:
+            return
+        # Conditional, so a worker claiming or finishing the job meanwhile wins
+        if ExportJob.objects.filter(pk=self.pk, status=self.status).update(
+                status=self.STATUS_FAILED, error=error, finished=now):
+            self.status, self.error, self.finished = self.STATUS_FAILED, error, now
+
+
+class ProjectClip(models.Model):
+    """
+    One clip of a project, copied out of project_json whenever the project
+    is saved (see sync_project_clips), so questions like "which projects use
+    this upload?" or "how long is this project?" are indexed queries rather
+    than a parse of every project's JSON.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='clips')
+    track_index = models.PositiveSmallIntegerField()
+    clip_index = models.PositiveIntegerField()  # position within the track's clip list
+    # The clip's URL as stored in the JSON; an upload is linked by media_file,
+    # a built-in effect by effect_name
+    file_url = models.CharField(max_length=500, db_index=True)
+    media_file = models.ForeignKey(MediaFile, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='project_clips')
+    effect_name = models.CharField(max_length=200, blank=True, db_index=True)
+    start_time = models.FloatField(default=0.0)  # seconds
+    duration = models.FloatField(null=True, blank=True)  # seconds, null if unknown
+
+    class Meta:
+        ordering = ['project', 'track_index', 'clip_index']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'track_index', 'clip_index'], name='unique_project_clip'),
+        ]
+        indexes = [
+            # Project length: the latest clip end per project
+            models.Index(fields=['project', 'start_time'], name='projectclip_project_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.file_url} on track {self.track_index} of {self.project_id}"
+
+    @property
+    def end_time(self):
+        return self.start_time + (self.duration or 0.0)
+
+    @classmethod
+    def sync(cls, project):
+        """
+        Replace the project's rows with the clips in its project_json.
+        """
+        media_prefix = settings.MEDIA_URL
+        effects_prefix = effects_manifest.effects_url_prefix()
+
+        clips = []
+        upload_names = set()
+        for track_index, clip_index, clip in iter_clips(project.project_json):
+            file_url = str(clip.get('file') or '')[:500]
+            clips.append((track_index, clip_index, file_url, clip))
+            if file_url.startswith(media_prefix) and not file_url.startswith(effects_prefix):
+                upload_names.add(file_url[len(media_prefix):])
+
+        # One query for every upload; blobs may be shared, so prefer the
+        # project owner's own MediaFile
+        media_files = {}
+        if upload_names:
+            for media_file in MediaFile.objects.filter(file__in=upload_names).order_by('id'):
+                current = media_files.get(media_file.file.name)
+                if current is None or (media_file.owner_id == project.owner_id != current.owner_id):
+                    media_files[media_file.file.name] = media_file
+
+        rows = []
+        for track_index, clip_index, file_url, clip in clips:
+            media_file = None
+            effect_name = ''
+            if file_url.startswith(effects_prefix):
+                effect_name = os.path.splitext(file_url[len(effects_prefix):])[0][:200]
+            elif file_url.startswith(media_prefix):
+                media_file = media_files.get(file_url[len(media_prefix):])
+            rows.append(cls(
+                project=project,
+                track_index=track_index,
+                clip_index=clip_index,
+                file_url=file_url,
+                media_file=media_file,
+                effect_name=effect_name,
+                start_time=_seconds(clip.get('start_time', clip.get('startTime'))) or 0.0,
+                duration=_seconds(clip.get('duration')) or (media_file.duration if media_file else None),
+            ))
+
+        with transaction.atomic():
+            cls.objects.filter(project=project).delete()
+            cls.objects.bulk_create(rows)
+
+
+class ProjectRevision(models.Model):
+    """
+    A saved state (title and project_json) of a project, for undo across
+    sessions. Every few revisions a full snapshot is stored; the ones in
+    between are a JSON Patch against that snapshot (never against each
+    other), so restoring any revision is one decompress and at most one
+    patch, however long the history. Data is zlib-compressed JSON.
+    Old revisions are thinned by the `thin_project_history` command.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='history')
+    revision = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    # Snapshots have no base; deltas are a patch from their base snapshot
+    base = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='deltas')
+    content_hash = models.CharField(max_length=64)
+    data = models.BinaryField()
+
+    class Meta:
+        ordering = ['project', '-revision']
+        constraints = [
+            models.UniqueConstraint(fields=['project', 'revision'], name='unique_project_revision'),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id} r{self.revision} ({'snapshot' if self.is_snapshot else 'delta'})"
+
+    @property
+    def is_snapshot(self):
+        return self.base_id is None
+
+    @staticmethod
+    def pack(value):
+        return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def unpack(data):
+        return json.loads(zlib.decompress(bytes(data)))
+
+    def state(self):
+        """
+        {'title': ..., 'project_json': ...} as saved at this revision.
+        """
+        if self.is_snapshot:
+            return self.unpack(self.data)
+        return apply_patch(self.base.state(), self.unpack(self.data))
+
+    @classmethod
+    def record(cls, project):
+        """
+        Add the project's current state to its history (nothing if it
+        matches the latest recorded revision).
+        """
+        latest = cls.objects.filter(project=project).only('revision', 'content_hash').first()
+        if latest is not None and (latest.content_hash == project.content_hash or latest.revision >= project.revision):
+            return
+
+        state = {'title': project.title, 'project_json': project.project_json}
+        interval = getattr(settings, 'DAW_HISTORY_SNAPSHOT_INTERVAL', 20)
+        snapshot = cls.objects.filter(project=project, base__isnull=True).first()
+        base = None
+        data = cls.pack(state)
+        if snapshot is not None and project.revision - snapshot.revision < interval:
+            delta = cls.pack(make_patch(snapshot.state(), state))
+            # A delta that is nearly as big as the state starts a new snapshot
+            if len(delta) < len(data) // 2:
+                base, data = snapshot, delta
+
+        cls.objects.create(project=project, revision=project.revision, base=base,
+                           content_hash=project.content_hash, data=data)
+
+
+def iter_clips(project_json):
+    """
+    Yield (track_index, clip_index, clip) for every clip in a project's
+    JSON, skipping anything malformed.
+    """
+    tracks = project_json.get('tracks') if isinstance(project_json, dict) else None
+    for track_index, track in enumerate(tracks if isinstance(tracks, list) else []):
+        clips = track.get('clips') if isinstance(track, dict) else None
+        for clip_index, clip in enumerate(clips if isinstance(clips, list) else []):
+            if isinstance(clip, dict):
+                yield track_index, clip_index, clip
+
+
+def _seconds(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 else None
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def evict_project_renders(sender, instance, **kwargs):
+    # Any save may change the mix; drop cached renders so they can't go stale
+    render_cache.evict_project(instance.pk)
+
+
+@receiver(post_save, sender=Project)
+def sync_project_clips(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Covers every save path (API, create view, admin, commands); saves that
+    # don't touch project_json leave the clips as they are
+    if raw or (update_fields is not None and 'project_json' not in update_fields):
+        return
+    ProjectClip.sync(instance)
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     is_teacher = models.BooleanField(default=False)
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ProjectCursorPagination(CursorPagination):
+    """
+    Newest-updated first. Cursor pagination keeps each page an indexed range
+    scan (see Project.Meta.indexes), however deep the listing goes.
+    """
+    ordering = ('-updated', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
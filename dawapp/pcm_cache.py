@@ -0,0 +1,118 @@
+"""
+On-disk cache of decoded PCM for clip sources.
+
+Decoding an MP3 means spawning ffmpeg, and the same effect files and uploads
+are decoded again for every export. Decoded PCM is stored here as .npy files
+keyed by source path + size + mtime, and read back as memory-mapped arrays,
+so an unchanged source is never handed to ffmpeg twice.
+
+The cache is bounded by DAW_PCM_CACHE_MAX_BYTES; entries are touched on every
+hit and the least recently used ones are evicted first.
+"""
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .cache_utils import atomic_write, evict_lru
+
+# Bump when the on-disk layout changes so old entries are never misread
+CACHE_VERSION = 1
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+
+def cache_dir():
+    return getattr(settings, 'DAW_PCM_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'pcm'))
+
+
+def max_bytes():
+    return getattr(settings, 'DAW_PCM_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats():
+    """
+    Hit/miss/store/eviction counters for this process.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def source_key(local_path):
+    """
+    Cache key for a source file: changes whenever the file is replaced or edited.
+    """
+    st = os.stat(local_path)
+    ident = f"{CACHE_VERSION}|{os.path.abspath(local_path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(ident.encode('utf-8')).hexdigest()
+
+
+def _entry_paths(key):
+    base = os.path.join(cache_dir(), key[:2], key)
+    return base + '.npy', base + '.json'
+
+
+def lookup(local_path):
+    """
+    Return (pcm, meta) for an unchanged source, or None on a miss.
+    pcm is a read-only memory-mapped array shaped (frames, channels).
+    """
+    try:
+        npy_path, meta_path = _entry_paths(source_key(local_path))
+        with open(meta_path) as f:
+            meta = json.load(f)
+        pcm = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError):
+        _count('misses')
+        return None
+
+    # Touch the entry so eviction sees it as recently used
+    try:
+        os.utime(npy_path)
+    except OSError:
+        pass
+
+    _count('hits')
+    return pcm, meta
+
+
+def store(local_path, pcm, meta):
+    """
+    Save decoded PCM for a source and evict old entries if over the size cap.
+    Failures are logged and ignored: the cache is only an optimisation.
+    Returns True if the entry was written.
+    """
+    try:
+        npy_path, meta_path = _entry_paths(source_key(local_path))
+        os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+
+        # Write the array first: an entry only counts once its meta file exists
+        atomic_write(npy_path, lambda f: np.save(f, np.ascontiguousarray(pcm)))
+        meta = dict(meta, source=os.path.abspath(local_path))
+        atomic_write(meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+    except OSError as e:
+        print(f"PCM cache: failed to store {local_path}: {e}")
+        return False
+
+    _count('stores')
+    evict()
+    return True
+
+
+def evict(limit=None):
+    """
+    Delete least recently used entries until the cache fits within limit bytes.
+    """
+    limit = max_bytes() if limit is None else limit
+    evicted = evict_lru(cache_dir(), limit, '.npy', companions=('.json',))
+    if evicted:
+        _count('evictions', evicted)
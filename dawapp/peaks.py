@@ -0,0 +1,130 @@
+"""
+Multi-resolution waveform peaks for the timeline.
+
+Each audio file gets a sidecar next to it (<file>.peaks) holding min/max
+pairs at several zoom levels, so daw.js can size clips and draw waveforms
+without downloading the audio itself. Level 0 has one pair per
+BASE_SAMPLES_PER_PEAK frames and every further level is LEVEL_FACTOR times
+coarser, down to roughly MIN_PEAKS pairs.
+
+Sidecar layout (all little-endian):
+  header   8s magic b'DAWPEAK1', u32 frame_rate, u64 frames, u32 level count
+  levels   per level: u32 samples_per_peak, u32 peak count
+  data     per level, in order: int16 (min, max) pairs, mono, 16-bit scale
+"""
+import os
+import struct
+
+import numpy as np
+
+from .audio_utils import decode_source
+from .cache_utils import atomic_write
+
+MAGIC = b'DAWPEAK1'
+HEADER = struct.Struct('<8sIQI')
+LEVEL = struct.Struct('<II')
+
+BASE_SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+MIN_PEAKS = 64
+MAX_LEVELS = 8
+
+# Frames reduced per pass, so long (memory-mapped) sources are never
+# copied into memory whole
+BLOCK_FRAMES = BASE_SAMPLES_PER_PEAK * 4096
+
+SUFFIX = '.peaks'
+
+
+def sidecar_path(local_path):
+    return local_path + SUFFIX
+
+
+def _reduce(values, factor, how):
+    """Min or max over consecutive groups of factor values (last group may be short)."""
+    pad = -len(values) % factor
+    if pad:
+        values = np.concatenate([values, np.repeat(values[-1:], pad)])
+    return how(values.reshape(-1, factor), axis=1)
+
+
+def base_peaks(pcm, sample_width):
+    """
+    Level-0 (min, max) arrays for integer PCM shaped (frames, channels),
+    folded to mono and rescaled to 16 bits.
+    """
+    mins, maxs = [], []
+    for start in range(0, len(pcm), BLOCK_FRAMES):
+        block = np.asarray(pcm[start:start + BLOCK_FRAMES])
+        mins.append(_reduce(block.min(axis=1), BASE_SAMPLES_PER_PEAK, np.min))
+        maxs.append(_reduce(block.max(axis=1), BASE_SAMPLES_PER_PEAK, np.max))
+    if not mins:
+        return np.zeros(0, np.int16), np.zeros(0, np.int16)
+
+    lo = np.concatenate(mins).astype(np.int32)
+    hi = np.concatenate(maxs).astype(np.int32)
+    shift = (sample_width - 2) * 8
+    if shift > 0:
+        lo >>= shift
+        hi >>= shift
+    elif shift < 0:
+        lo <<= -shift
+        hi <<= -shift
+    return lo.astype(np.int16), hi.astype(np.int16)
+
+
+def pyramid(lo, hi):
+    """
+    Build every level from the base one.
+    Returns [(samples_per_peak, interleaved int16 min/max array)].
+    """
+    levels = []
+    samples_per_peak = BASE_SAMPLES_PER_PEAK
+    while True:
+        levels.append((samples_per_peak, np.stack([lo, hi], axis=1).ravel()))
+        if len(lo) <= MIN_PEAKS or len(levels) >= MAX_LEVELS:
+            return levels
+        lo = _reduce(lo, LEVEL_FACTOR, np.min)
+        hi = _reduce(hi, LEVEL_FACTOR, np.max)
+        samples_per_peak *= LEVEL_FACTOR
+
+
+def encode(frame_rate, frames, levels):
+    parts = [HEADER.pack(MAGIC, frame_rate, frames, len(levels))]
+    parts += [LEVEL.pack(samples_per_peak, len(data) // 2) for samples_per_peak, data in levels]
+    parts += [data.astype('<i2').tobytes() for _, data in levels]
+    return b''.join(parts)
+
+
+def build(local_path):
+    """
+    Decode a source (through the PCM cache) and write its peaks sidecar.
+    Returns the sidecar path.
+    """
+    decoded = decode_source(local_path)
+    lo, hi = base_peaks(decoded.pcm, decoded.sample_width)
+    data = encode(decoded.frame_rate, len(decoded.pcm), pyramid(lo, hi))
+    path = sidecar_path(local_path)
+    atomic_write(path, lambda f: f.write(data))
+    return path
+
+
+def ensure(local_path):
+    """
+    Return the sidecar path for a source, (re)building it if it is missing
+    or older than the source.
+    """
+    path = sidecar_path(local_path)
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(local_path).st_mtime_ns:
+            return path
+    except OSError:
+        pass
+    return build(local_path)
+
+
+def remove(local_path):
+    try:
+        os.remove(sidecar_path(local_path))
+    except OSError:
+        pass
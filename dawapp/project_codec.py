@@ -0,0 +1,141 @@
+"""
+Compact storage for project_json.
+
+Projects repeat the same keys ("instanceId", "filename", "effects", ...)
+and file URLs in every clip, so the stored form is:
+
+    <version byte> + zlib([strings, tree])
+
+where strings holds every distinct key and string value once and tree is
+the document with each of them replaced by its index in the table (as a
+string, so it can't be mistaken for a number). Clips saved by daw.js
+carry the start both as "startTime" and "start_time"; when the two are
+the same scalar only one is stored, under a "!"-prefixed key, and
+decoding puts both back.
+
+CompactJSONField stores values this way and reads them back as plain
+JSON, so everything using project.project_json (serializers, the DAW
+page, the exporters) sees the same dicts as before. The contents can't
+be queried in the database (no key lookups).
+"""
+import json
+import zlib
+
+from django.db import models
+
+VERSION = 1
+
+# Keys written twice with the same value; the first is kept
+ALIASES = {'startTime': 'start_time'}
+ALIAS_MARK = '!'
+
+
+class ProjectCodecError(ValueError):
+    """The stored bytes aren't a project encoding this version can read."""
+
+
+def _same(a, b):
+    # 1, 1.0 and True are equal but don't round-trip as each other. Lists
+    # and dicts aren't folded: decoding would share one object between keys
+    if isinstance(a, (list, dict)):
+        return False
+    return type(a) is type(b) and a == b
+
+
+def _pack_tree(value, strings, table):
+    def ref(string):
+        if string not in table:
+            table[string] = len(strings)
+            strings.append(string)
+        return str(table[string])
+
+    if isinstance(value, str):
+        return ref(value)
+    if isinstance(value, list):
+        return [_pack_tree(item, strings, table) for item in value]
+    if isinstance(value, dict):
+        folded = {
+            ALIASES[key] for key, item in value.items()
+            if ALIASES.get(key) in value and _same(value[ALIASES[key]], item)
+        }
+        packed = {}
+        for key, item in value.items():
+            if key in folded:
+                continue  # stored with the key it duplicates
+            if ALIASES.get(key) in folded:
+                packed[ALIAS_MARK + ref(key)] = _pack_tree(item, strings, table)
+            else:
+                packed[ref(key)] = _pack_tree(item, strings, table)
+        return packed
+    return value
+
+
+def _unpack_tree(value, strings):
+    if isinstance(value, str):
+        return strings[int(value)]
+    if isinstance(value, list):
+        return [_unpack_tree(item, strings) for item in value]
+    if isinstance(value, dict):
+        unpacked = {}
+        for key, item in value.items():
+            item = _unpack_tree(item, strings)
+            if key.startswith(ALIAS_MARK):
+                key = strings[int(key[len(ALIAS_MARK):])]
+                unpacked[key] = item
+                unpacked[ALIASES[key]] = item
+            else:
+                unpacked[strings[int(key)]] = item
+        return unpacked
+    return value
+
+
+def encode(value):
+    """
+    The compact bytes for a JSON value.
+    """
+    strings = []
+    tree = _pack_tree(value, strings, {})
+    body = json.dumps([strings, tree], separators=(',', ':'), ensure_ascii=False)
+    return bytes([VERSION]) + zlib.compress(body.encode('utf-8'))
+
+
+def decode(data):
+    """
+    The JSON value stored in data (bytes from encode()).
+    """
+    data = bytes(data)
+    if not data or data[0] != VERSION:
+        raise ProjectCodecError(f"Unknown project encoding version: {data[:1]!r}")
+    try:
+        strings, tree = json.loads(zlib.decompress(data[1:]).decode('utf-8'))
+        return _unpack_tree(tree, strings)
+    except (zlib.error, ValueError, TypeError, IndexError, KeyError) as e:
+        raise ProjectCodecError(f"Corrupt project encoding: {e}") from e
+
+
+class CompactJSONField(models.JSONField):
+    """
+    A JSONField stored as encode() bytes in a binary column.
+    """
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return connection.Database.Binary(encode(value))
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        if isinstance(value, str):
+            # Written as text before the column held the compact form
+            return json.loads(value)
+        return decode(value)
+
+    def get_transform(self, name):
+        # Skip JSONField's key transforms: the column isn't JSON
+        return super(models.JSONField, self).get_transform(name)
@@ -0,0 +1,152 @@
+"""
+Content-addressed cache of rendered project mixdowns.
+
+A render is keyed by a canonical hash of the project's JSON plus the identity
+(path, size, mtime) of every source file it references, so pressing Export on
+an unchanged project serves the stored MP3 instead of re-rendering it. The
+key doubles as the response ETag.
+
+Renders live under <DAW_RENDER_CACHE_DIR>/<project id>/<key>.mp3. A project's
+renders are dropped whenever it is saved or deleted, and the whole cache is
+held under DAW_RENDER_CACHE_MAX_BYTES by evicting least recently used files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from django.conf import settings
+
+from .audio_utils import MP3_PARAMETERS
+from .cache_utils import directory_size, evict_lru, source_identity
+
+# Bump to invalidate every stored render (e.g. when the mixing rules change)
+CACHE_VERSION = 2
+
+# Eviction trims the cache to this fraction of the cap, so the next few
+# stores don't each trigger another walk
+EVICT_TO = 0.9
+
+# Running estimate of the cache size, so a store only walks the cache once
+# it may be over the cap. Per process, and only ever high (renders dropped
+# by evict_project aren't subtracted), so it can't delay eviction by more
+# than what other processes wrote meanwhile.
+_size_lock = threading.Lock()
+_size_estimate = None
+
+
+def cache_dir():
+    return getattr(settings, 'DAW_RENDER_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'renders'))
+
+
+def max_bytes():
+    return getattr(settings, 'DAW_RENDER_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+
+
+def render_key(project_json):
+    """
+    Hash a resolved project (clips carrying 'local_path') into a render key.
+    """
+    local_paths = sorted({
+        clip['local_path']
+        for track in project_json.get('tracks', [])
+        for clip in track.get('clips', [])
+        if clip.get('local_path')
+    })
+    canonical = json.dumps({
+        'version': CACHE_VERSION,
+        'encoder': MP3_PARAMETERS,
+        'project': project_json,
+        'sources': [source_identity(path) for path in local_paths],
+    }, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def etag(key):
+    return f'"{key}"'
+
+
+def render_path(project_id, key):
+    return os.path.join(cache_dir(), str(project_id), key + '.mp3')
+
+
+def lookup(project_id, key):
+    """
+    Return the path of a stored render, or None.
+    """
+    path = render_path(project_id, key)
+    try:
+        # Touch the file so eviction sees it as recently used
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def store_chunks(project_id, key, chunks):
+    """
+    Pass chunks through unchanged while writing them to the cache.
+    The render is only kept if the stream is consumed to the end without
+    an error (stream_mixdown raises if the render or the encoder failed);
+    otherwise the partial file is deleted.
+    """
+    path = render_path(project_id, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, part_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    completed = False
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        completed = True
+    finally:
+        if completed:
+            os.replace(part_path, path)
+            account(os.path.getsize(path))
+        elif os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def store_file(project_id, key, fileobj):
+    """
+    Copy an already rendered MP3 (file-like, positioned at 0) into the cache.
+    """
+    for _ in store_chunks(project_id, key, iter(lambda: fileobj.read(64 * 1024), b'')):
+        pass
+
+
+def evict_project(project_id):
+    """
+    Drop every stored render of a project (called when it is saved or deleted).
+    """
+    shutil.rmtree(os.path.join(cache_dir(), str(project_id)), ignore_errors=True)
+
+
+def account(size):
+    """
+    Add a newly stored render to the size estimate, evicting once the
+    estimate goes over the cap.
+    """
+    global _size_estimate
+    limit = max_bytes()
+    with _size_lock:
+        if _size_estimate is None:
+            # First store in this process: the walk includes the new file
+            _size_estimate = directory_size(cache_dir(), '.mp3')
+        else:
+            _size_estimate += size
+        if _size_estimate > limit:
+            target = int(limit * EVICT_TO)
+            evict(target)
+            _size_estimate = target
+
+
+def evict(limit=None):
+    """
+    Delete least recently used renders until the cache fits within limit bytes.
+    """
+    limit = max_bytes() if limit is None else limit
+    evict_lru(cache_dir(), limit, '.mp3')
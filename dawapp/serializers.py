@@ -5,11 +5,22 @@ from .models import Project, MediaFile
 class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
-        fields = ['id', 'title', 'project_json', 'owner']
-        read_only_fields = ['owner']
+        fields = ['id', 'title', 'project_json', 'owner', 'revision']
+        read_only_fields = ['owner', 'revision']
+
+class ProjectSummarySerializer(serializers.ModelSerializer):
+    """
+    Listing fields only: built from a queryset that defers project_json.
+    """
+    owner_username = serializers.CharField(source='owner.username', read_only=True)
+
+    class Meta:
+        model = Project
+        fields = ['id', 'title', 'owner', 'owner_username', 'created', 'updated', 'revision'] + Project.SUMMARY_FIELDS
+        read_only_fields = fields
 
 class MediaFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = MediaFile
-        fields = ['id', 'name', 'file', 'owner']
-        read_only_fields = ['owner']
+        fields = ['id', 'filename', 'file', 'owner', 'uploaded'] + MediaFile.METADATA_FIELDS
+        read_only_fields = ['owner', 'uploaded'] + MediaFile.METADATA_FIELDS
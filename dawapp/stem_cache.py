@@ -0,0 +1,183 @@
+"""
+Per-track stem cache for incremental re-rendering.
+
+Each track of a mix is rendered once into a stem: its clips summed, effects
+applied and track gain baked in, as float32 samples in the mix format. The
+stem is keyed by a hash of the track's clip placements, effects, volume and
+source identities (plus the mix format), so after an edit only the tracks
+that actually changed are rendered again and an export is a cheap sum of
+memory-mapped stems.
+
+Bounded by DAW_STEM_CACHE_MAX_BYTES with least-recently-used eviction.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .cache_utils import evict_lru
+
+# Bump when the mixing or effects rules change so old stems are never reused
+CACHE_VERSION = 1
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def cache_dir():
+    return getattr(settings, 'DAW_STEM_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'stems'))
+
+
+def max_bytes():
+    return getattr(settings, 'DAW_STEM_CACHE_MAX_BYTES', 1024 * 1024 * 1024)
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def stats():
+    """
+    Stem hit/miss/eviction counters for this process.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def stem_key(mix_format, gain, clips):
+    """
+    Hash a track into a stem key.
+    clips is a list of (start_frame, source_identity, effects) tuples.
+    """
+    canonical = json.dumps({
+        'version': CACHE_VERSION,
+        'format': list(mix_format),
+        'gain': repr(gain),
+        'clips': [list(clip) for clip in clips],
+    }, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _stem_path(key):
+    return os.path.join(cache_dir(), key[:2], key + '.npy')
+
+
+def lookup(key):
+    """
+    Return a cached stem as a read-only memory-mapped (frames, channels)
+    float32 array, or None on a miss.
+    """
+    path = _stem_path(key)
+    try:
+        stem = np.load(path, mmap_mode='r')
+        os.utime(path)
+    except (OSError, ValueError):
+        _count('misses')
+        return None
+    _count('hits')
+    return stem
+
+
+def build(key, frames, channels, render):
+    """
+    Render a stem straight to disk and return it memory-mapped.
+    render(out) fills the writable (frames, channels) array in place; the
+    file is only published under its key once it is complete.
+    """
+    path = _stem_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    os.close(fd)
+    try:
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(frames, channels))
+        render(out)
+        out.flush()
+        del out
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    # Map it before evicting, so the new stem stays usable even if it goes first
+    stem = np.load(path, mmap_mode='r')
+    evict()
+    return stem
+
+
+class StemWriter:
+    """
+    Builds a stem from the blocks a streaming export renders anyway, so a
+    missing stem costs no extra rendering and doesn't hold up the stream.
+    Blocks must arrive in order; commit() publishes the stem once every
+    frame is written, discard() drops a partial one.
+    """
+
+    def __init__(self, key, frames, channels):
+        self.key = key
+        self.frames = frames
+        self.channels = channels
+        self.path = _stem_path(key)
+        self.tmp_path = None
+        self.out = None
+        self.written = 0
+        self.closed = False
+
+    def write(self, start, block):
+        """
+        Append block (frames from start) if it continues the stem;
+        anything out of order abandons it.
+        """
+        if self.closed or start >= self.frames:
+            return  # closed, or past the end of this track
+        if start != self.written:
+            self.discard()
+            return
+        if self.out is None:
+            # Opened on the first block, so a plan that is never rendered
+            # leaves nothing behind
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+            os.close(fd)
+            self.out = np.lib.format.open_memmap(
+                self.tmp_path, mode='w+', dtype=np.float32, shape=(self.frames, self.channels))
+        n = min(len(block), self.frames - start)
+        if n > 0:
+            self.out[start:start + n] = block[:n]
+            self.written += n
+
+    def commit(self):
+        """
+        Publish the stem under its key if it is complete, else discard it.
+        Returns True if it was published.
+        """
+        if self.out is None or self.written < self.frames:
+            self.discard()
+            return False
+        self.out.flush()
+        self.out = None
+        os.replace(self.tmp_path, self.path)
+        self.closed = True  # published; nothing more to write
+        evict()
+        return True
+
+    def discard(self):
+        self.closed = True
+        self.out = None
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def evict(limit=None):
+    """
+    Delete least recently used stems until the cache fits within limit bytes.
+    """
+    limit = max_bytes() if limit is None else limit
+    evicted = evict_lru(cache_dir(), limit, '.npy')
+    if evicted:
+        _count('evictions', evicted)
@@ -0,0 +1,163 @@
+"""
+Content-addressed storage for uploads (MediaFile.file).
+
+Every upload is stored once, under the sha256 of its bytes:
+
+  blobs/<first two hex digits>/<sha256><extension>
+
+The digest is computed while the upload is streamed to disk, so identical
+files uploaded by different students (or twice by the same one) share one
+blob, and the name a user gave the file lives only in MediaFile.filename.
+A blob's reference count is the number of MediaFile rows naming it
+(MediaFile.file is indexed); models.release_media_blob deletes the blob
+when the last one goes.
+
+Blobs never change once written, so anything keyed on the file (peaks
+sidecars, the PCM/stem/render caches) stays valid for as long as the blob
+exists.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = 'blobs'
+BLOB_NAME_RE = re.compile(r'^blobs/[0-9a-f]{2}/([0-9a-f]{64})(\.[a-z0-9]{1,10})?$')
+
+# A blob reused within this many seconds is not deleted when its last
+# reference goes: a new MediaFile may be about to point at it. Such blobs
+# are left to the orphaned-media collector.
+REUSE_GRACE_SECONDS = 60
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest, extension=''):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+def blob_digest(name):
+    """
+    The sha256 a blob name was derived from, or None for other names
+    (e.g. uploads stored before content addressing).
+    """
+    match = BLOB_NAME_RE.match(name or '')
+    return match.group(1) if match else None
+
+
+def blob_extension(name):
+    # Keep the extension so ffmpeg and browsers can tell the format
+    extension = os.path.splitext(name or '')[1].lower()
+    return extension if re.fullmatch(r'\.[a-z0-9]{1,10}', extension) else ''
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names every file after the hash of its content
+    and stores identical content once.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name is chosen by _save from the content, so the
+        # requested one never needs a collision suffix
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        tmp_path = self._temp_path()
+        try:
+            with open(tmp_path, 'wb') as f:
+                if hasattr(content, 'seek') and content.seekable():
+                    content.seek(0)
+                for chunk in content.chunks(COPY_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            return self._store(tmp_path, blob_name(digest.hexdigest(), blob_extension(name)))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def save_local(self, local_path, name, digest=None, move=True):
+        """
+        Store a file that is already on local disk and return its blob
+        name. digest is its sha256 if the caller already knows it. With
+        move=False the source is left in place (hard-linked if possible).
+        """
+        if digest is None:
+            hasher = hashlib.sha256()
+            with open(local_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+        target = blob_name(digest, blob_extension(name))
+
+        if os.path.exists(self.path(target)):
+            self._mark_reused(target)
+            if move:
+                os.remove(local_path)
+            return target
+
+        tmp_path = self._temp_path()
+        try:
+            if move:
+                os.replace(local_path, tmp_path)
+            else:
+                os.remove(tmp_path)
+                try:
+                    os.link(local_path, tmp_path)
+                except OSError:
+                    with open(local_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                        for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+                            dst.write(chunk)
+            return self._store(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def recently_reused(self, name):
+        try:
+            return time.time() - os.stat(self.path(name)).st_atime < REUSE_GRACE_SECONDS
+        except OSError:
+            return False
+
+    def _temp_path(self):
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        return tmp_path
+
+    def _store(self, tmp_path, target):
+        """
+        Move a fully written temp file into place as blob target, unless
+        that blob already exists (same content).
+        """
+        full_path = self.path(target)
+        if os.path.exists(full_path):
+            self._mark_reused(target)
+            return target
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        # mkstemp creates files readable by the owner only; blobs are served
+        os.chmod(tmp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+        os.replace(tmp_path, full_path)
+        return target
+
+    def _mark_reused(self, name):
+        # Record the reuse in the access time only: the modification time
+        # is what the peaks and PCM caches treat as the file's version
+        full_path = self.path(name)
+        try:
+            os.utime(full_path, ns=(time.time_ns(), os.stat(full_path).st_mtime_ns))
+        except OSError:
+            pass
+
+
+media_storage = ContentAddressedStorage()
@@ -1,3 +1,1529 @@
-from django.test import TestCase
+import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import wave
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from pydub import AudioSegment
+
+from . import audio_utils, dsp, effects_manifest, pcm_cache, peaks, render_cache, stem_cache, views
+from .audio_utils import decode_source, mix_to_segment, quantize, render_mix, render_window
+from .cache_utils import content_hash
+from .json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch, make_patch
+from .models import ExportJob, MediaFile, Project, ProjectClip, ProjectRevision, UploadSession
+from .project_codec import ProjectCodecError, decode, encode
+from .storage import blob_name, media_storage
+
+# Everything the tests write (uploads, caches) goes under one scratch folder
+TEST_ROOT = tempfile.mkdtemp(prefix='dawapp-tests-')
+
+test_settings = override_settings(
+    MEDIA_ROOT=os.path.join(TEST_ROOT, 'media'),
+    DAW_PCM_CACHE_DIR=os.path.join(TEST_ROOT, 'pcm'),
+    DAW_RENDER_CACHE_DIR=os.path.join(TEST_ROOT, 'renders'),
+    DAW_STEM_CACHE_DIR=os.path.join(TEST_ROOT, 'stems'),
+    DAW_DECODE_WORKERS=1,
+)
+
+
+def tearDownModule():
+    shutil.rmtree(TEST_ROOT, ignore_errors=True)
+
+
+def write_wav(path, samples, frame_rate):
+    """
+    Write float samples shaped (frames, channels) as 16-bit PCM.
+    """
+    pcm = np.round(samples * 32767).astype('<i2')
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(pcm.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(frame_rate)
+        f.writeframes(pcm.tobytes())
+    return path
+
+
+def overlay_mixdown(project):
+    """
+    The pydub overlay loop the mixer replaced, as a reference.
+    """
+    output = AudioSegment.silent(duration=0)
+    last_clip_end = 0
+    for track in project.project_json.get('tracks', []):
+        track_gain_db = -20 + (track.get('volume', 100) / 100.0 * 20)
+        for clip in track.get('clips', []):
+            clip_audio = AudioSegment.from_file(clip['local_path']).apply_gain(track_gain_db)
+            start_ms = int(clip.get('start_time', 0) * 1000)
+            clip_end = start_ms + len(clip_audio)
+            last_clip_end = max(last_clip_end, clip_end)
+            if clip_end > len(output):
+                output += AudioSegment.silent(duration=clip_end - len(output))
+            output = output.overlay(clip_audio, position=start_ms)
+    return output[:last_clip_end]
+
+
+def segment_pcm(segment):
+    return np.frombuffer(segment.raw_data, dtype=np.int16).astype(np.int32).reshape(-1, segment.channels)
+
+
+# -------------------------
+# Mixer
+# -------------------------
+@test_settings
+class MixerTests(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        rng = np.random.default_rng(0)
+        t = np.arange(44100) / 44100.0
+        sine = write_wav(os.path.join(self.folder, 'sine.wav'), 0.4 * np.sin(2 * np.pi * 440 * t)[:, None], 44100)
+        noise = write_wav(os.path.join(self.folder, 'noise.wav'), rng.uniform(-0.3, 0.3, (22050, 2)), 44100)
+        low = write_wav(os.path.join(self.folder, 'low.wav'), 0.5 * np.sin(2 * np.pi * 110 * t[:15435])[:, None], 22050)
+        self.project = SimpleNamespace(project_json={'tracks': [
+            {'volume': 80, 'clips': [
+                {'local_path': sine, 'start_time': 0.25},
+                {'local_path': low, 'start_time': 1.1},
+            ]},
+            {'volume': 50, 'clips': [{'local_path': noise, 'start_time': 0.5}]},
+            {'volume': 100, 'clips': [{'local_path': sine, 'start_time': 0.75}]},
+            {'volume': 100, 'clips': []},
+        ]})
+
+    def test_matches_overlay_reference(self):
+        expected = overlay_mixdown(self.project)
+        mixed = mix_to_segment(render_mix(self.project))
+
+        self.assertEqual(
+            (mixed.frame_rate, mixed.channels, mixed.sample_width),
+            (expected.frame_rate, expected.channels, expected.sample_width),
+        )
+        expected_pcm, mixed_pcm = segment_pcm(expected), segment_pcm(mixed)
+        self.assertEqual(mixed_pcm.shape, expected_pcm.shape)
+        # pydub rounds each clip to integers after its gain; the mixer
+        # rounds once at the end, so samples may differ by a few LSB
+        self.assertLessEqual(np.abs(mixed_pcm - expected_pcm).max(), 4)
+
+    def test_cached_stems_render_the_same_mix(self):
+        first = render_mix(self.project)
+        second = render_mix(self.project)  # every track read back from its stem
+        np.testing.assert_array_equal(first.samples, second.samples)
+
+
+class QuantizeTests(TestCase):
+    def test_full_scale_saturates(self):
+        samples = np.array([[1.0], [-1.0], [2.0], [-2.0], [0.5], [0.0]], dtype=np.float32)
+        self.assertEqual(
+            quantize(samples, 2).ravel().tolist(),
+            [32767, -32768, 32767, -32768, 16384, 0],
+        )
+        self.assertEqual(
+            quantize(samples, 4).ravel().tolist(),
+            [2 ** 31 - 1, -2 ** 31, 2 ** 31 - 1, -2 ** 31, 2 ** 30, 0],
+        )
+
+    def test_dtype_matches_sample_width(self):
+        samples = np.zeros((4, 2), dtype=np.float32)
+        self.assertEqual(quantize(samples, 1).dtype, np.int8)
+        self.assertEqual(quantize(samples, 2).dtype, np.int16)
+        self.assertEqual(quantize(samples, 4).dtype, np.int32)
+
+
+# -------------------------
+# Decoded-PCM cache
+# -------------------------
+class PCMCacheTests(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        self.settings_override = override_settings(DAW_PCM_CACHE_DIR=os.path.join(self.folder, 'pcm'))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.source = write_wav(os.path.join(self.folder, 'a.wav'), np.full((100, 1), 0.25), 8000)
+
+    def test_store_and_lookup(self):
+        self.assertIsNone(pcm_cache.lookup(self.source))
+        pcm = np.arange(200, dtype=np.int16).reshape(100, 2)
+        self.assertTrue(pcm_cache.store(self.source, pcm, {'frame_rate': 8000}))
+
+        cached, meta = pcm_cache.lookup(self.source)
+        np.testing.assert_array_equal(cached, pcm)
+        self.assertIsInstance(cached, np.memmap)
+        self.assertEqual(meta['frame_rate'], 8000)
+
+    def test_changed_source_misses(self):
+        decode_source(self.source)
+        self.assertIsNotNone(pcm_cache.lookup(self.source))
+        write_wav(self.source, np.full((300, 1), 0.5), 8000)
+        self.assertIsNone(pcm_cache.lookup(self.source))
+        self.assertEqual(len(decode_source(self.source).pcm), 300)
+
+    def test_decode_source_reads_back_the_cache(self):
+        first = decode_source(self.source)
+        hits = pcm_cache.stats()['hits']
+        second = decode_source(self.source)
+        self.assertEqual(pcm_cache.stats()['hits'], hits + 1)
+        np.testing.assert_array_equal(first.pcm, second.pcm)
+        self.assertEqual(second.frame_rate, 8000)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        sources = [write_wav(os.path.join(self.folder, f'{i}.wav'), np.zeros((1000, 1)), 8000) for i in range(3)]
+        pcm = np.zeros((1000, 1), dtype=np.int16)
+        for age, source in zip([300, 200, 100], sources):
+            pcm_cache.store(source, pcm, {})
+            npy_path, _ = pcm_cache._entry_paths(pcm_cache.source_key(source))
+            os.utime(npy_path, (time.time() - age, time.time() - age))
+        pcm_cache.lookup(sources[0])  # now the most recently used
+
+        entry_bytes = os.path.getsize(npy_path)
+        pcm_cache.evict(limit=2 * entry_bytes)
+        self.assertIsNotNone(pcm_cache.lookup(sources[0]))
+        self.assertIsNone(pcm_cache.lookup(sources[1]))
+        self.assertIsNotNone(pcm_cache.lookup(sources[2]))
+
+
+# -------------------------
+# Parallel decoding
+# -------------------------
+@override_settings(DAW_DECODE_WORKERS=2)
+class DecodePoolTests(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        self.settings_override = override_settings(DAW_PCM_CACHE_DIR=os.path.join(self.folder, 'pcm'))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.sources = [
+            write_wav(os.path.join(self.folder, f'{i}.wav'), np.full((100 * (i + 1), 1), 0.1), 8000)
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        if audio_utils._decode_pool is not None:
+            audio_utils.discard_decode_pool(audio_utils._decode_pool)
+
+    def test_decodes_in_the_pool(self):
+        sources = audio_utils.load_sources(self.sources)
+        self.assertEqual([len(sources[path].pcm) for path in self.sources], [100, 200, 300])
+
+    def test_recovers_from_a_dead_worker(self):
+        pool = audio_utils.get_decode_pool()
+        with self.assertRaises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+
+        # This request decodes inline; the next one gets a working pool
+        sources = audio_utils.load_sources(self.sources)
+        self.assertEqual([len(sources[path].pcm) for path in self.sources], [100, 200, 300])
+        self.assertIsNot(audio_utils.get_decode_pool(), pool)
+        self.assertEqual(audio_utils.get_decode_pool().submit(abs, -1).result(), 1)
+
+
+# -------------------------
+# Export jobs
+# -------------------------
+def effect_clip(name, start, **fields):
+    return dict({'file': f'/media/effects/{name}', 'filename': name, 'startTime': start, 'start_time': start}, **fields)
+
+
+@test_settings
+@override_settings(EFFECTS_ROOT=os.path.join(settings.BASE_DIR, 'media', 'effects'))
+class ExportJobTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('exporter')
+        self.client.force_login(self.owner)
+        self.project = Project.objects.create(owner=self.owner, title='Song', project_json={'tracks': [
+            {'volume': 80, 'clips': [effect_clip('Crackle.mp3', 0.5)]},
+        ]})
+        self.url = reverse('export_project', kwargs={'pk': self.project.pk})
+
+    def export(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+        call_command('run_export_worker', '--once', stdout=StringIO(), stderr=StringIO())
+        return self.client.get(response.json()['status_url']).json()
+
+    def test_download_is_served_from_the_render_cache(self):
+        job = self.export()
+        self.assertEqual(job['status'], 'done')
+
+        response = self.client.get(job['download_url'])
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content)
+        key = ExportJob.objects.get(pk=job['id']).render_key
+        self.assertEqual(response['ETag'], render_cache.etag(key))
+        with open(render_cache.render_path(self.project.pk, key), 'rb') as f:
+            self.assertEqual(f.read(), body)
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, 'exports')))
+        self.assertIsNotNone(Project.objects.get(pk=self.project.pk).last_export)
+
+        response = self.client.get(job['download_url'], HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unchanged_project_reuses_the_render(self):
+        first, second = self.export(), self.export()
+        jobs = ExportJob.objects.in_bulk([first['id'], second['id']])
+        self.assertEqual(len({job.render_key for job in jobs.values()}), 1)
+        project_renders = os.listdir(os.path.join(render_cache.cache_dir(), str(self.project.pk)))
+        self.assertEqual(len(project_renders), 1)
+
+    def test_evicted_render_is_gone(self):
+        job = self.export()
+        render_cache.evict_project(self.project.pk)
+        self.assertEqual(self.client.get(job['download_url']).status_code, 410)
+
+    def test_finished_jobs_expire(self):
+        job = self.export()
+        recent = self.export()
+        ExportJob.objects.filter(pk=job['id']).update(finished=timezone.now() - timedelta(days=2))
+        queued = ExportJob.objects.create(project=self.project, requested_by=self.owner)
+
+        self.assertEqual(ExportJob.purge_finished(), 1)
+        self.assertEqual(
+            set(ExportJob.objects.values_list('pk', flat=True)),
+            {uuid.UUID(recent['id']), queued.pk},
+        )
+
+    def test_job_nobody_picks_up_fails(self):
+        job = ExportJob.objects.create(project=self.project, requested_by=self.owner)
+        ExportJob.objects.filter(pk=job.pk).update(created=timezone.now() - timedelta(hours=1))
+        data = self.client.get(reverse('export_job_status', kwargs={'job_id': job.pk})).json()
+        self.assertEqual(data['status'], 'failed')
+        self.assertIn('run_export_worker', data['error'])
+
+
+# -------------------------
+# Render cache
+# -------------------------
+@test_settings
+@override_settings(EFFECTS_ROOT=os.path.join(settings.BASE_DIR, 'media', 'effects'))
+class RenderCacheTests(TestCase):
+    def setUp(self):
+        render_cache._size_estimate = None
+        shutil.rmtree(render_cache.cache_dir(), ignore_errors=True)
+        self.owner = User.objects.create_user('renderer')
+        self.client.force_login(self.owner)
+        self.project = Project.objects.create(owner=self.owner, title='Song', project_json={'tracks': [
+            {'volume': 80, 'clips': [effect_clip('Crackle.mp3', 0.5)]},
+        ]})
+        self.url = reverse('export_project', kwargs={'pk': self.project.pk})
+
+    def project_files(self):
+        folder = os.path.join(render_cache.cache_dir(), str(self.project.pk))
+        return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+    def test_completed_stream_is_kept(self):
+        chunks = list(render_cache.store_chunks(self.project.pk, 'abc', iter([b'one', b'two'])))
+        self.assertEqual(chunks, [b'one', b'two'])
+        path = render_cache.lookup(self.project.pk, 'abc')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'onetwo')
+        self.assertIsNone(render_cache.lookup(self.project.pk, 'other'))
+
+    def test_failed_or_abandoned_stream_is_dropped(self):
+        def failing():
+            yield b'one'
+            raise RuntimeError('render failed')
+
+        with self.assertRaises(RuntimeError):
+            list(render_cache.store_chunks(self.project.pk, 'failed', failing()))
+        abandoned = render_cache.store_chunks(self.project.pk, 'closed', iter([b'one', b'two']))
+        next(abandoned)
+        abandoned.close()
+        self.assertEqual(self.project_files(), [])
+
+    def test_truncated_render_is_not_cached(self):
+        # ffmpeg still exits cleanly on the truncated input; the stream must raise anyway
+        temp_project = views.prepare_export_project(self.project)
+        key = render_cache.render_key(temp_project.project_json)
+        with mock.patch.object(audio_utils, 'render_block', side_effect=MemoryError('out of memory')):
+            chunks = render_cache.store_chunks(self.project.pk, key, audio_utils.stream_mixdown(temp_project))
+            with self.assertRaises(MemoryError):
+                list(chunks)
+        self.assertIsNone(render_cache.lookup(self.project.pk, key))
+        self.assertEqual(self.project_files(), [])
+
+    @override_settings(DAW_RENDER_CACHE_MAX_BYTES=1000)
+    def test_least_recently_used_renders_are_evicted(self):
+        for key, size in (('old', 600), ('recent', 300)):
+            for _ in render_cache.store_chunks(self.project.pk, key, iter([b'x' * size])):
+                pass
+        past = time.time() - 60
+        os.utime(render_cache.render_path(self.project.pk, 'old'), (past, past))
+
+        for _ in render_cache.store_chunks(self.project.pk, 'new', iter([b'x' * 200])):
+            pass
+        self.assertEqual(self.project_files(), ['new.mp3', 'recent.mp3'])
+
+    def test_export_is_cached_and_revalidated(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        body = b''.join(first.streaming_content)
+        self.assertEqual(len(self.project_files()), 1)
+
+        with mock.patch.object(views, 'stream_mixdown') as stream_mixdown:
+            second = self.client.get(self.url)
+            self.assertEqual(b''.join(second.streaming_content), body)
+            self.assertEqual(second['ETag'], first['ETag'])
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        stream_mixdown.assert_not_called()
+
+    def test_render_evicted_after_lookup_is_rendered_again(self):
+        missing = os.path.join(TEST_ROOT, 'evicted.mp3')
+        with mock.patch.object(render_cache, 'lookup', side_effect=[missing, None]):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(b''.join(response.streaming_content)), 0)
+        self.assertEqual(len(self.project_files()), 1)
+
+
+# -------------------------
+# Clip effects
+# -------------------------
+class ClipEffectsTests(TestCase):
+    frame_rate = 8000
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.pcm = np.round(rng.uniform(-8000, 8000, (self.frame_rate, 2))).astype(np.int16)
+
+    def test_effect_flags(self):
+        for effects in (None, [], 'echo', {}, {'fadeIn': 0, 'echo': False}, {'fadeIn': 'soon'}, {'fadeOut': -1}):
+            self.assertFalse(dsp.has_effects(effects), effects)
+            self.assertEqual(dsp.tail_seconds(effects), 0.0)
+        self.assertTrue(dsp.has_effects({'fadeIn': '0.5'}))
+        self.assertTrue(dsp.has_effects({'radio1910': True}))
+        self.assertAlmostEqual(dsp.tail_seconds({'echo': True}), dsp.ECHO_REPEATS * dsp.ECHO_DELAY)
+        self.assertGreater(dsp.lookback_seconds({'echo': True, 'radio1910': True}), dsp.tail_seconds({'echo': True}))
+        self.assertEqual(dsp.lookback_seconds(['radio1910']), 0.0)
+
+    def test_fades(self):
+        chain = dsp.ClipEffects({'fadeIn': 0.25, 'fadeOut': 0.5}, self.pcm, self.frame_rate, 32768)
+        out = chain.render(0, chain.length)
+        self.assertEqual(chain.length, len(self.pcm))
+        np.testing.assert_array_equal(out[0], 0)
+        # Untouched between the fades, silent at the very end
+        middle = slice(self.frame_rate // 4, self.frame_rate // 2)
+        np.testing.assert_allclose(out[middle], self.pcm[middle], atol=1e-3)
+        self.assertLess(np.abs(out[-1]).max(), np.abs(self.pcm).max() / 1000)
+
+    def test_echo_rings_after_the_clip(self):
+        impulse = np.zeros((self.frame_rate // 10, 1), dtype=np.int16)
+        impulse[0] = 1000
+        chain = dsp.ClipEffects({'echo': True}, impulse, self.frame_rate, 32768)
+        self.assertEqual(chain.length, len(impulse) + dsp.ECHO_REPEATS * chain.echo_delay)
+        out = chain.render(0, chain.length)[:, 0]
+        repeats = np.nonzero(out)[0]
+        self.assertEqual(list(repeats), [k * chain.echo_delay for k in range(dsp.ECHO_REPEATS + 1)])
+        self.assertAlmostEqual(out[2 * chain.echo_delay], 1000 * dsp.ECHO_FEEDBACK, places=3)
+
+    def test_blocks_render_like_the_whole_clip(self):
+        effects = {'fadeIn': 0.1, 'fadeOut': 0.2, 'radio1910': True, 'echo': True}
+        chain = dsp.ClipEffects(effects, self.pcm, self.frame_rate, 32768)
+        whole = chain.render(0, chain.length)
+        blocks = np.concatenate([
+            chain.render(start, min(777, chain.length - start))
+            for start in range(0, chain.length, 777)
+        ])
+        np.testing.assert_allclose(blocks, whole, rtol=1e-4, atol=1e-2)
+        np.testing.assert_allclose(chain.render(4000, 500), whole[4000:4500], rtol=1e-4, atol=1e-2)
+
+    def test_radio_removes_low_frequencies(self):
+        t = np.arange(self.frame_rate) / self.frame_rate
+        hum = np.round(8000 * np.sin(2 * np.pi * 60 * t)[:, None]).astype(np.int16)
+        voice = np.round(8000 * np.sin(2 * np.pi * 1000 * t)[:, None]).astype(np.int16)
+        radio = {'radio1910': True}
+        # Drop the noise so only the filter is measured
+        with mock.patch.object(dsp, 'RADIO_NOISE_LEVEL', 0.0):
+            hum_out = dsp.ClipEffects(radio, hum, self.frame_rate, 32768).render(2000, 4000)
+            voice_out = dsp.ClipEffects(radio, voice, self.frame_rate, 32768).render(2000, 4000)
+        self.assertLess(np.abs(hum_out).max(), 8000 * 0.05)
+        self.assertGreater(np.abs(voice_out).max(), 8000 * 0.9)
+
+    @test_settings
+    def test_echo_tail_lengthens_the_mix(self):
+        folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        path = write_wav(os.path.join(folder, 'clip.wav'), self.pcm / 32768.0, self.frame_rate)
+        dry = SimpleNamespace(project_json={'tracks': [{'clips': [{'local_path': path, 'start_time': 0.5}]}]})
+        wet = SimpleNamespace(project_json={'tracks': [{'clips': [
+            {'local_path': path, 'start_time': 0.5, 'effects': {'echo': True}},
+        ]}]})
+        dry_mix, wet_mix = render_mix(dry), render_mix(wet)
+        rate = wet_mix.frame_rate
+        self.assertEqual(len(wet_mix.samples), len(dry_mix.samples) + round(dsp.tail_seconds({'echo': True}) * rate))
+        # Identical until the first repeat comes in
+        first_repeat = int((0.5 + dsp.ECHO_DELAY) * rate)
+        np.testing.assert_allclose(wet_mix.samples[:first_repeat], dry_mix.samples[:first_repeat], atol=1e-6)
+
+
+# -------------------------
+# Stem cache
+# -------------------------
+@test_settings
+class StemCacheTests(TestCase):
+    def setUp(self):
+        shutil.rmtree(stem_cache.cache_dir(), ignore_errors=True)
+        self.folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        t = np.arange(22050) / 22050.0
+        self.sine = write_wav(os.path.join(self.folder, 'sine.wav'), 0.4 * np.sin(2 * np.pi * 440 * t)[:, None], 22050)
+        self.project = SimpleNamespace(project_json={'tracks': [
+            {'volume': 80, 'clips': [{'local_path': self.sine, 'start_time': 0.25}]},
+            {'volume': 50, 'clips': [{'local_path': self.sine, 'start_time': 0.5, 'effects': {'echo': True}}]},
+        ]})
+
+    def stem_files(self):
+        return [name for _, _, names in os.walk(stem_cache.cache_dir()) for name in names]
+
+    def test_writer_publishes_complete_stems_only(self):
+        block = np.ones((100, 2), dtype=np.float32)
+        writer = stem_cache.StemWriter('a' * 64, 250, 2)
+        for start in (0, 100, 200):
+            writer.write(start, block * start)
+        self.assertTrue(writer.commit())
+        stem = stem_cache.lookup('a' * 64)
+        self.assertEqual(stem.shape, (250, 2))
+        self.assertEqual(stem[-1, 0], 200)
+
+        incomplete = stem_cache.StemWriter('b' * 64, 250, 2)
+        incomplete.write(0, block)
+        self.assertFalse(incomplete.commit())
+        out_of_order = stem_cache.StemWriter('c' * 64, 250, 2)
+        out_of_order.write(0, block)
+        out_of_order.write(150, block)
+        out_of_order.write(100, block)
+        self.assertFalse(out_of_order.commit())
+        self.assertIsNone(stem_cache.lookup('b' * 64))
+        self.assertIsNone(stem_cache.lookup('c' * 64))
+        self.assertEqual(len(self.stem_files()), 1)
+
+    def test_failed_build_leaves_nothing(self):
+        def render(out):
+            raise RuntimeError('render failed')
+
+        with self.assertRaises(RuntimeError):
+            stem_cache.build('d' * 64, 100, 2, render)
+        self.assertEqual(self.stem_files(), [])
+
+    def test_only_changed_tracks_are_rendered_again(self):
+        first = render_mix(self.project)
+        self.assertEqual(len(self.stem_files()), 2)
+
+        before = stem_cache.stats()
+        self.project.project_json['tracks'][0]['volume'] = 100
+        second = render_mix(self.project)
+        after = stem_cache.stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (1, 1))
+        self.assertEqual(len(self.stem_files()), 3)
+        self.assertGreater(np.abs(second.samples).max(), np.abs(first.samples).max())
+
+    def test_streaming_export_fills_the_stems(self):
+        chunks = b''.join(audio_utils.stream_mixdown(self.project))
+        self.assertGreater(len(chunks), 0)
+        self.assertEqual(len(self.stem_files()), 2)
+
+        before = stem_cache.stats()
+        plan = audio_utils.plan_mix(self.project)
+        self.assertEqual(stem_cache.stats()['hits'] - before['hits'], 2)
+        # Stems hold the whole track, echo tail included
+        self.assertEqual([len(track.stem) for track in plan.tracks], [track.frames for track in plan.tracks])
+
+
+# -------------------------
+# Preview windows
+# -------------------------
+@test_settings
+@override_settings(EFFECTS_ROOT=os.path.join(settings.BASE_DIR, 'media', 'effects'))
+class PreviewTests(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        t = np.arange(44100) / 44100.0
+        sine = write_wav(os.path.join(self.folder, 'sine.wav'), 0.4 * np.sin(2 * np.pi * 440 * t)[:, None], 44100)
+        self.mix_project = SimpleNamespace(project_json={'tracks': [
+            {'volume': 80, 'clips': [{'local_path': sine, 'start_time': 0.25}]},
+            {'volume': 50, 'clips': [
+                {'local_path': sine, 'start_time': 2.0, 'effects': {'echo': True, 'fadeIn': 0.1}},
+            ]},
+        ]})
+
+        self.owner = User.objects.create_user('previewer')
+        self.client.force_login(self.owner)
+        self.project = Project.objects.create(owner=self.owner, title='Song', project_json={'tracks': [
+            {'volume': 80, 'clips': [effect_clip('Crackle.mp3', 0.5)]},
+        ]})
+        self.url = reverse('export_project', kwargs={'pk': self.project.pk})
+
+    def test_window_matches_the_full_mix(self):
+        full = render_mix(self.mix_project)
+        rate = full.frame_rate
+        for start, end in ((0.0, 0.5), (1.0, 2.5), (2.2, 3.1), (3.0, 10.0)):
+            window = render_window(self.mix_project, start, end)
+            expected = full.samples[int(start * rate):int(end * rate)]
+            np.testing.assert_allclose(window.samples, expected, rtol=1e-4, atol=1e-2, err_msg=f'{start}-{end}')
+
+    def test_preview_is_a_wav_of_the_window(self):
+        response = self.client.get(self.url, {'start': 0.5, 'end': 1.5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'audio/wav')
+        with wave.open(BytesIO(b''.join(response.streaming_content))) as f:
+            self.assertAlmostEqual(f.getnframes() / f.getframerate(), 1.0, places=2)
+
+    def test_rejects_bad_windows(self):
+        for params in (
+            {'end': 'soon'},
+            {'start': 1},
+            {'start': 'nan', 'end': 2},
+            {'start': 0, 'end': 'inf'},
+            {'start': '-inf', 'end': 1},
+            {'start': 2, 'end': 1},
+            {'start': -1, 'end': 1},
+            {'start': 0, 'end': 61},
+        ):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+    @override_settings(DAW_PREVIEW_MAX_SECONDS=0.5)
+    def test_window_length_is_capped(self):
+        self.assertEqual(self.client.get(self.url, {'start': 0, 'end': 1}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': 0.5, 'end': 1}).status_code, 200)
+
+
+# -------------------------
+# Waveform peaks
+# -------------------------
+def read_peaks(data):
+    """
+    Parse a peaks sidecar into (frame_rate, frames, [(samples_per_peak, mins, maxs)]).
+    """
+    magic, frame_rate, frames, count = peaks.HEADER.unpack_from(data)
+    assert magic == peaks.MAGIC
+    offset = peaks.HEADER.size
+    headers = []
+    for _ in range(count):
+        headers.append(peaks.LEVEL.unpack_from(data, offset))
+        offset += peaks.LEVEL.size
+    levels = []
+    for samples_per_peak, n in headers:
+        pairs = np.frombuffer(data, '<i2', n * 2, offset).reshape(-1, 2)
+        levels.append((samples_per_peak, pairs[:, 0], pairs[:, 1]))
+        offset += n * 4
+    assert offset == len(data)
+    return frame_rate, frames, levels
+
+
+@test_settings
+class PeaksTests(TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(dir=TEST_ROOT)
+        rng = np.random.default_rng(2)
+        self.samples = rng.uniform(-0.5, 0.5, (300000, 2))
+        self.path = write_wav(os.path.join(self.folder, 'noise.wav'), self.samples, 44100)
+
+    def test_sidecar_levels(self):
+        with open(peaks.build(self.path), 'rb') as f:
+            frame_rate, frames, levels = read_peaks(f.read())
+        self.assertEqual((frame_rate, frames), (44100, len(self.samples)))
+
+        pcm = np.round(self.samples * 32767).astype(np.int16)
+        size = peaks.BASE_SAMPLES_PER_PEAK
+        for samples_per_peak, mins, maxs in levels:
+            self.assertEqual(samples_per_peak, size)
+            self.assertEqual(len(mins), -(-len(pcm) // size))
+            # Every pair covers its frames on both channels
+            for i in (0, len(mins) // 2, len(mins) - 1):
+                window = pcm[i * size:(i + 1) * size]
+                self.assertEqual((mins[i], maxs[i]), (window.min(), window.max()))
+            size *= peaks.LEVEL_FACTOR
+        self.assertLessEqual(len(levels[-1][1]), peaks.MIN_PEAKS)
+        self.assertGreater(len(levels[-2][1]), peaks.MIN_PEAKS)
+
+    def test_ensure_rebuilds_stale_sidecars(self):
+        path = peaks.ensure(self.path)
+        with open(path, 'rb') as f:
+            first = f.read()
+        self.assertEqual(peaks.ensure(self.path), path)
+
+        write_wav(self.path, self.samples[:1000] * 0.1, 44100)
+        later = os.stat(path).st_mtime_ns + 10 ** 9
+        os.utime(self.path, ns=(later, later))
+        with open(peaks.ensure(self.path), 'rb') as f:
+            rebuilt = f.read()
+        self.assertNotEqual(rebuilt, first)
+        self.assertEqual(read_peaks(rebuilt)[1], 1000)
+
+        peaks.remove(self.path)
+        self.assertFalse(os.path.exists(path))
+
+    def test_served_for_an_upload(self):
+        owner = User.objects.create_user('peaker')
+        with open(self.path, 'rb') as f:
+            upload = MediaFile.objects.create(owner=owner, filename='noise.wav', file=ContentFile(f.read(), 'noise.wav'))
+        url = views.peaks_url(upload.file.url)
+
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(owner)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(read_peaks(b''.join(response.streaming_content))[1], len(self.samples))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(views.peaks_url('/media/user_1/missing.wav')).status_code, 404)
+
+
+# -------------------------
+# Effects manifest
+# -------------------------
+@test_settings
+class EffectsManifestTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(dir=TEST_ROOT)
+        library = os.path.join(settings.BASE_DIR, 'media', 'effects')
+        for name in ('Crackle.mp3', 'Fanfare.mp3'):
+            shutil.copy(os.path.join(library, name), self.root)
+        with open(os.path.join(self.root, 'notes.txt'), 'w') as f:
+            f.write('not an effect')
+        self.library = os.path.join(library, 'Music Box.mp3')
+        self.settings_override = override_settings(EFFECTS_ROOT=self.root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.client.force_login(User.objects.create_user('listener'))
+        self.url = reverse('effects_list')
+
+    def add_effect(self, name):
+        shutil.copy(self.library, os.path.join(self.root, name))
+        # Make sure the directory mtime moves even on coarse-grained filesystems
+        later = os.stat(self.root).st_mtime_ns + 10 ** 9
+        os.utime(self.root, ns=(later, later))
+
+    def test_lists_effects_and_revalidates(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        entries = response.json()
+        self.assertEqual([entry['name'] for entry in entries], ['Crackle', 'Fanfare'])
+        crackle = os.path.join(self.root, 'Crackle.mp3')
+        self.assertEqual(entries[0]['file'], '/media/effects/Crackle.mp3')
+        self.assertEqual(entries[0]['size'], os.path.getsize(crackle))
+        self.assertEqual(entries[0]['hash'], content_hash(crackle))
+        self.assertGreater(entries[0]['duration'], 0)
+        self.assertEqual(entries[0]['peaks_url'], views.peaks_url('/media/effects/Crackle.mp3'))
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.add_effect('Music Box.mp3')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 3)
+
+    def test_rebuild_only_probes_new_files(self):
+        effects_manifest.get_manifest()
+        with mock.patch.object(effects_manifest, 'probe_duration', return_value=1.5) as probe:
+            self.assertEqual(len(effects_manifest.get_manifest().entries), 2)
+            probe.assert_not_called()
+            self.add_effect('Zither.mp3')
+            self.assertEqual(len(effects_manifest.get_manifest().entries), 3)
+        probe.assert_called_once_with(os.path.join(self.root, 'Zither.mp3'))
+
+    def test_paths_follow_the_root(self):
+        self.assertEqual(effects_manifest.effect_paths(), {
+            '/media/effects/Crackle.mp3': os.path.join(self.root, 'Crackle.mp3'),
+            '/media/effects/Fanfare.mp3': os.path.join(self.root, 'Fanfare.mp3'),
+        })
+        with override_settings(EFFECTS_ROOT=os.path.join(self.root, 'missing')):
+            self.assertEqual(effects_manifest.effect_paths(), {})
+        other = tempfile.mkdtemp(dir=TEST_ROOT)
+        with override_settings(EFFECTS_ROOT=other):
+            self.assertEqual(effects_manifest.get_manifest().entries, [])
+
+
+# -------------------------
+# Clip file resolution
+# -------------------------
+@test_settings
+@override_settings(EFFECTS_ROOT=os.path.join(settings.BASE_DIR, 'media', 'effects'))
+class ResolveClipFilesTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('resolver')
+        self.uploads = [
+            MediaFile.objects.create(
+                owner=self.owner, filename=f'take{i}.wav', file=ContentFile(f'take {i}'.encode(), f'take{i}.wav'),
+                duration=1.0 + i if i % 2 else None,
+            )
+            for i in range(5)
+        ]
+        effects_manifest.get_manifest()  # built once per process, not per export
+
+    def test_resolves_every_clip_in_one_query(self):
+        clips = [{'file': upload.file.url} for upload in self.uploads] * 3
+        clips += [effect_clip('Crackle.mp3', 0), effect_clip('Nope.mp3', 0), {'file': 'https://example.com/a.mp3'}]
+        clips.append({'file': '/media/user_9/gone.wav', 'name': 'Gone'})
+        with self.assertNumQueries(1):
+            resolved = views.resolve_clip_files(clips)
+
+        for upload in self.uploads:
+            self.assertEqual(resolved.paths[upload.file.url], upload.file.path)
+        self.assertEqual(
+            resolved.paths['/media/effects/Crackle.mp3'],
+            os.path.join(settings.EFFECTS_ROOT, 'Crackle.mp3'),
+        )
+        # Only uploads with probed metadata carry it
+        self.assertEqual(set(resolved.source_info), {self.uploads[1].file.url, self.uploads[3].file.url})
+        self.assertEqual(resolved.source_info[self.uploads[3].file.url]['duration'], 4.0)
+        self.assertEqual(
+            [(item['filename'], item['reason']) for item in resolved.unresolved],
+            [('Nope.mp3', 'Effect not found'), ('https://example.com/a.mp3', 'Unknown file location'),
+             ('Gone', 'Upload not found')],
+        )
+
+    def test_effects_only_project_needs_no_query(self):
+        with self.assertNumQueries(0):
+            resolved = views.resolve_clip_files([effect_clip('Crackle.mp3', 0), effect_clip('Fanfare.mp3', 1)])
+        self.assertEqual(len(resolved.paths), 2)
+        self.assertEqual(resolved.unresolved, [])
+
+    def test_prepare_export_project_injects_paths(self):
+        project = Project.objects.create(owner=self.owner, title='Song', project_json={'tracks': [
+            {'clips': [{'file': self.uploads[1].file.url}, effect_clip('Crackle.mp3', 0)]},
+            {'clips': [{'file': '/media/user_9/gone.wav'}]},
+        ]})
+        temp_project = views.prepare_export_project(project)
+        first, second = temp_project.project_json['tracks'][0]['clips']
+        self.assertEqual(first['local_path'], self.uploads[1].file.path)
+        self.assertEqual(first['source_info']['duration'], 2.0)
+        self.assertNotIn('source_info', second)
+        self.assertIsNone(temp_project.project_json['tracks'][1]['clips'][0]['local_path'])
+        self.assertEqual(len(temp_project.unresolved), 1)
+
+
+# -------------------------
+# Chunked uploads
+# -------------------------
+@test_settings
+class ChunkedUploadTests(TestCase):
+    data = bytes(range(256)) * 40  # 10240 bytes
+
+    def setUp(self):
+        self.owner = User.objects.create_user('uploader')
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse('chunked_upload_init'), {'filename': 'take.wav', 'size': len(self.data)},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.session = response.json()
+
+    def put(self, start, end, total=None, body=None):
+        return self.client.put(
+            self.session['chunk_url'],
+            self.data[start:end + 1] if body is None else body,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{total or len(self.data)}',
+        )
+
+    def test_offsets_and_resume(self):
+        self.assertEqual(self.session['offset'], 0)
+        response = self.put(0, 4095)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], 4096)
+
+        # A retried chunk and a gap both report where to resume from
+        for start, end in [(0, 4095), (5000, 6000)]:
+            response = self.put(start, end)
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.json()['offset'], 4096)
+
+        self.assertEqual(self.put(4096, 4200, total=99).status_code, 416)
+        self.assertEqual(self.put(4096, 4200, body=b'short').status_code, 400)
+
+        # Resuming: the client asks where the server is and carries on
+        self.assertEqual(self.client.get(self.session['chunk_url']).json()['offset'], 4096)
+        self.assertEqual(self.put(4096, len(self.data) - 1).json()['offset'], len(self.data))
+
+        session = UploadSession.objects.get(pk=self.session['upload_id'])
+        with open(session.part_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_finalize(self):
+        finalize = self.session['finalize_url']
+        checksum = hashlib.sha256(self.data).hexdigest()
+        self.put(0, 4095)
+        response = self.client.post(finalize, {'sha256': checksum}, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+        self.put(4096, len(self.data) - 1)
+        response = self.client.post(finalize, {'sha256': checksum}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        media_file = MediaFile.objects.get(owner=self.owner)
+        self.assertEqual(media_file.filename, 'take.wav')
+        with media_file.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_checksum_mismatch_discards_upload(self):
+        self.put(0, len(self.data) - 1)
+        response = self.client.post(self.session['finalize_url'], {'sha256': '0' * 64}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(MediaFile.objects.exists())
+
+    def init(self, size=100, filename='next.wav'):
+        return self.client.post(
+            reverse('chunked_upload_init'), {'filename': filename, 'size': size}, content_type='application/json',
+        )
+
+    @override_settings(DAW_UPLOAD_MAX_BYTES=20000)
+    def test_size_is_capped(self):
+        self.assertEqual(self.init(size=20001).status_code, 413)
+        self.assertEqual(self.init(size=20000).status_code, 201)
+
+    @override_settings(DAW_UPLOAD_SESSIONS_PER_USER=2)
+    def test_open_sessions_are_capped(self):
+        second = self.init()
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(self.init().status_code, 429)
+
+        # Aborted and stale sessions free their slot
+        self.client.delete(second.json()['chunk_url'])
+        self.assertEqual(self.init().status_code, 201)
+        UploadSession.objects.filter(owner=self.owner).update(updated=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.init().status_code, 201)
+        self.assertEqual(UploadSession.objects.filter(owner=self.owner).count(), 1)
+
+
+# -------------------------
+# Content-addressed uploads
+# -------------------------
+@test_settings
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('student')
+        self.other = User.objects.create_user('classmate')
+
+    def upload(self, owner, data, filename='take.WAV'):
+        return MediaFile.objects.create(owner=owner, filename=filename, file=ContentFile(data, filename))
+
+    def age(self, media_file):
+        # Past the reuse grace period, as if uploaded a while ago
+        path = media_file.file.path
+        past = time.time() - 3600
+        os.utime(path, (past, os.stat(path).st_mtime))
+
+    def test_identical_uploads_share_a_blob(self):
+        first = self.upload(self.owner, b'same audio')
+        second = self.upload(self.other, b'same audio', 'copy.wav')
+        different = self.upload(self.other, b'other audio')
+
+        self.assertEqual(first.file.name, blob_name(hashlib.sha256(b'same audio').hexdigest(), '.wav'))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertNotEqual(different.file.name, first.file.name)
+        with second.file.open('rb') as f:
+            self.assertEqual(f.read(), b'same audio')
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        first = self.upload(self.owner, b'same audio')
+        second = self.upload(self.other, b'same audio')
+        path = first.file.path
+        self.age(first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_recently_reused_blob_is_left_to_the_collector(self):
+        first = self.upload(self.owner, b'same audio')
+        self.upload(self.other, b'same audio').delete()  # reuses, then drops, the blob
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(first.file.path))
+
+    def test_save_local(self):
+        folder = tempfile.mkdtemp(dir=settings.MEDIA_ROOT)
+        source = os.path.join(folder, 'take.mp3')
+        with open(source, 'wb') as f:
+            f.write(b'local audio')
+
+        kept = media_storage.save_local(source, 'take.mp3', move=False)
+        self.assertTrue(os.path.exists(source))
+        moved = media_storage.save_local(source, 'take.mp3')
+        self.assertEqual(moved, kept)
+        self.assertFalse(os.path.exists(source))
+        with media_storage.open(kept) as f:
+            self.assertEqual(f.read(), b'local audio')
+
+
+@test_settings
+class DedupeMediaTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('student')
+        self.legacy = {}
+        for name, data in (('user_1/a.wav', b'same audio'), ('user_2/b.wav', b'same audio'), ('user_2/c.wav', b'other')):
+            path = media_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            media_file = MediaFile.objects.create(owner=self.owner, filename=os.path.basename(name))
+            MediaFile.objects.filter(pk=media_file.pk).update(file=name)
+            self.legacy[name] = media_file.pk
+        self.project = Project.objects.create(owner=self.owner, title='Old', project_json={'tracks': [
+            {'clips': [{'file': '/media/user_1/a.wav'}, {'file': '/media/user_2/c.wav'}]},
+            {'clips': [{'file': '/media/effects/Crackle.mp3'}]},
+        ]})
+
+    def dedupe(self, *args):
+        out = StringIO()
+        call_command('dedupe_media', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_dry_run_changes_nothing(self):
+        self.assertIn('3 legacy upload(s) -> 2 blob(s)', self.dedupe('--dry-run'))
+        self.assertEqual(
+            set(MediaFile.objects.values_list('file', flat=True)),
+            set(self.legacy),
+        )
+
+    def test_moves_uploads_into_blobs(self):
+        self.dedupe()
+        names = dict(MediaFile.objects.values_list('pk', 'file'))
+        same = blob_name(hashlib.sha256(b'same audio').hexdigest(), '.wav')
+        other = blob_name(hashlib.sha256(b'other').hexdigest(), '.wav')
+        self.assertEqual(names[self.legacy['user_1/a.wav']], same)
+        self.assertEqual(names[self.legacy['user_2/b.wav']], same)
+        self.assertEqual(names[self.legacy['user_2/c.wav']], other)
+        for name in self.legacy:
+            self.assertFalse(os.path.exists(media_storage.path(name)))
+
+        clips = Project.objects.get(pk=self.project.pk).project_json['tracks']
+        self.assertEqual([clip['file'] for clip in clips[0]['clips']], ['/media/' + same, '/media/' + other])
+        self.assertEqual(clips[1]['clips'][0]['file'], '/media/effects/Crackle.mp3')
+
+        # Running it again finds nothing left to move
+        self.assertIn('0 legacy upload(s)', self.dedupe())
+
+
+# -------------------------
+# Clip index
+# -------------------------
+@test_settings
+class ProjectClipTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('student')
+        self.other = User.objects.create_user('classmate')
+        # Both own the same blob; the project owner's row is the one linked
+        self.theirs = MediaFile.objects.create(owner=self.other, filename='a.wav', file=ContentFile(b'audio', 'a.wav'))
+        self.mine = MediaFile.objects.create(
+            owner=self.owner, filename='a.wav', file=ContentFile(b'audio', 'a.wav'), duration=3.0,
+        )
+        self.project = Project.objects.create(owner=self.owner, title='Song', project_json={'tracks': [
+            {'clips': [
+                {'file': self.mine.file.url, 'startTime': 1.5},
+                effect_clip('Crackle.mp3', 2, duration=4),
+            ]},
+            'not a track',
+            {'clips': [None, {'file': '/media/user_9/gone.wav', 'start_time': 'soon', 'duration': -1}]},
+        ]})
+
+    def rows(self, project=None):
+        return [
+            (clip.track_index, clip.clip_index, clip.media_file_id, clip.effect_name, clip.start_time, clip.duration)
+            for clip in (project or self.project).clips.all()
+        ]
+
+    def test_saving_indexes_the_clips(self):
+        self.assertEqual(self.rows(), [
+            (0, 0, self.mine.pk, '', 1.5, 3.0),
+            (0, 1, None, 'Crackle', 2.0, 4.0),
+            (2, 1, None, '', 0.0, None),
+        ])
+        self.assertEqual(max(clip.end_time for clip in self.project.clips.all()), 6.0)
+        self.assertEqual(set(self.mine.project_clips.values_list('project', flat=True)), {self.project.pk})
+
+    def test_only_project_json_saves_resync(self):
+        self.project.project_json = {'tracks': [{'clips': [effect_clip('Fanfare.mp3', 0)]}]}
+        self.project.title = 'Renamed'
+        self.project.save(update_fields=['title'])
+        self.assertEqual(len(self.rows()), 3)
+
+        self.project.save()
+        self.assertEqual(self.rows(), [(0, 0, None, 'Fanfare', 0.0, None)])
+        self.project.delete()
+        self.assertFalse(ProjectClip.objects.exists())
+
+    def test_sync_command_rebuilds_every_project(self):
+        ProjectClip.objects.all().delete()
+        Project.objects.filter(pk=self.project.pk).update(project_json={'tracks': []})
+        second = Project.objects.create(owner=self.other, title='Other', project_json={'tracks': [
+            {'clips': [{'file': self.mine.file.url}]},
+        ]})
+        out = StringIO()
+        call_command('sync_project_clips', stdout=out)
+        self.assertIn('2 project(s)', out.getvalue())
+        self.assertEqual(self.rows(), [])
+        # Linked to the other owner's own row for the shared blob
+        self.assertEqual(self.rows(second), [(0, 0, self.theirs.pk, '', 0.0, None)])
+
+
+# -------------------------
+# Orphaned media collection
+# -------------------------
+@test_settings
+class CollectOrphanedMediaTests(TestCase):
+    def setUp(self):
+        self.settings_override = override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=TEST_ROOT))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+        self.owner = User.objects.create_user('student')
+        folder = f'user_{self.owner.pk}'
+        upload = MediaFile.objects.create(owner=self.owner, filename='a.wav', file=ContentFile(b'kept', 'a.wav'))
+        session = UploadSession.objects.create(owner=self.owner, filename='big.wav', size=10)
+        Project.objects.create(owner=self.owner, title='Song', project_json={'tracks': [
+            {'clips': [{'file': f'/media/{folder}/legacy.wav'}]},
+        ]})
+        # Saved before the clip index existed: no ProjectClip rows
+        unindexed = Project.objects.create(owner=self.owner, title='Old', project_json={})
+        Project.objects.filter(pk=unindexed.pk).update(project_json={'tracks': [
+            {'clips': [{'file': f'/media/{folder}/older.wav'}]},
+        ]})
+
+        self.kept = [
+            upload.file.name, upload.file.name + '.peaks',
+            f'{folder}/legacy.wav', f'{folder}/older.wav',
+            os.path.relpath(session.part_path, settings.MEDIA_ROOT),
+            'effects/Unlisted.mp3',  # not a folder the DAW manages
+        ]
+        self.orphaned = [
+            'blobs/00/' + '0' * 64 + '.wav', 'blobs/00/' + '0' * 64 + '.wav.peaks',
+            f'{folder}/.{uuid.uuid4()}.part',  # upload abandoned long ago
+            f'{folder}/deleted.wav',
+            'exports/old-export.mp3',
+        ]
+        past = time.time() - 48 * 3600
+        for name in self.kept + self.orphaned:
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(b'data')
+            os.utime(path, (past, past))
+        # Orphaned, but too recent to collect
+        self.recent = f'{folder}/just-uploaded.wav'
+        with open(os.path.join(settings.MEDIA_ROOT, self.recent), 'wb') as f:
+            f.write(b'new')
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_orphaned_media', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def remaining(self):
+        root = settings.MEDIA_ROOT
+        return sorted(
+            os.path.relpath(os.path.join(folder, name), root)
+            for folder, _, names in os.walk(root) for name in names
+        )
+
+    def test_dry_run_lists_orphans(self):
+        before = self.remaining()
+        out = self.collect('--dry-run')
+        for name in self.orphaned:
+            self.assertIn(f'Orphaned: {name}', out)
+        self.assertIn(f'Found {len(self.orphaned)} orphaned file(s)', out)
+        self.assertEqual(self.remaining(), before)
+
+    def test_deletes_only_unreferenced_files(self):
+        self.collect()
+        self.assertEqual(self.remaining(), sorted(self.kept + [self.recent]))
+
+        # A shorter grace period takes the recent file too
+        self.collect('--grace-hours', '0')
+        self.assertNotIn(self.recent, self.remaining())
+
+
+# -------------------------
+# JSON Patch
+# -------------------------
+class JsonPatchTests(TestCase):
+    def document(self):
+        return {
+            'title': 'T',
+            'tracks': [
+                {'volume': 80, 'clips': [{'startTime': 1, 'effects': {'echo': False}}]},
+                {'volume': 50, 'clips': []},
+            ],
+        }
+
+    def test_apply_operations(self):
+        document = self.document()
+        patched = apply_patch(document, [
+            {'op': 'replace', 'path': '/tracks/0/clips/0/startTime', 'value': 4},
+            {'op': 'add', 'path': '/tracks/1/clips/-', 'value': {'startTime': 2}},
+            {'op': 'copy', 'from': '/tracks/0/volume', 'path': '/tracks/1/volume'},
+            {'op': 'move', 'from': '/title', 'path': '/name'},
+            {'op': 'remove', 'path': '/tracks/0/clips/0/effects'},
+            {'op': 'test', 'path': '/tracks/1/volume', 'value': 80},
+        ])
+        self.assertEqual(patched, {
+            'name': 'T',
+            'tracks': [
+                {'volume': 80, 'clips': [{'startTime': 4}]},
+                {'volume': 80, 'clips': [{'startTime': 2}]},
+            ],
+        })
+        self.assertEqual(document, self.document())  # the original is untouched
+
+    def test_failed_test_leaves_document_alone(self):
+        document = self.document()
+        with self.assertRaises(JsonPatchTestFailed):
+            apply_patch(document, [
+                {'op': 'replace', 'path': '/title', 'value': 'U'},
+                {'op': 'test', 'path': '/tracks/0/volume', 'value': 100},
+            ])
+        self.assertEqual(document, self.document())
+
+    def test_invalid_patches(self):
+        for operations in [
+            {'op': 'add'},
+            [{'op': 'add', 'path': 'title', 'value': 1}],
+            [{'op': 'add', 'path': '/tracks/3', 'value': 1}],
+            [{'op': 'replace', 'path': '/missing', 'value': 1}],
+            [{'op': 'remove', 'path': '/tracks/01'}],
+            [{'op': 'move', 'from': '/tracks', 'path': '/tracks/0/x'}],
+            [{'op': 'frobnicate', 'path': '/title'}],
+        ]:
+            with self.subTest(operations=operations), self.assertRaises(JsonPatchError):
+                apply_patch(self.document(), operations)
+
+    def test_make_patch_round_trips(self):
+        before = self.document()
+        afters = [
+            self.document(),
+            {**self.document(), 'title': 'Renamed'},
+            {'title': 'T', 'tracks': []},
+            {'title': 'T', 'tracks': self.document()['tracks'] * 3},
+            {'title': 'T', 'tracks': {'not': 'a list'}},
+            {'title': 'T', 'a/b': {'c~d': 1}, 'tracks': [{'volume': 80.0, 'clips': [None, True]}]},
+            {'title': 1},
+            {'title': 1.0},
+            {'title': True},
+        ]
+        for after in afters:
+            with self.subTest(after=after):
+                result = apply_patch(before, make_patch(before, after))
+                # Dumped, so 1, 1.0 and True don't compare equal
+                self.assertEqual(json.dumps(result, sort_keys=True), json.dumps(after, sort_keys=True))
+
+    def test_make_patch_of_equal_documents_is_empty(self):
+        self.assertEqual(make_patch(self.document(), self.document()), [])
+
+
+@test_settings
+class DeltaSaveTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('patcher')
+        self.client.force_login(self.owner)
+        self.project = Project.objects.create(owner=self.owner, title='T', project_json={'tracks': [
+            {'clips': [effect_clip('Crackle.mp3', 1)]},
+        ]})
+        self.url = reverse('projects-delta', kwargs={'pk': self.project.pk})
+
+    def delta(self, *operations, revision=1):
+        return self.client.post(self.url, {'revision': revision, 'patch': list(operations)}, content_type='application/json')
+
+    def clip(self):
+        return Project.objects.get(pk=self.project.pk).project_json['tracks'][0]['clips'][0]
+
+    def test_applies_the_patch(self):
+        response = self.delta(
+            {'op': 'replace', 'path': '/tracks/0/clips/0/startTime', 'value': 4},
+            {'op': 'replace', 'path': '/tracks/0/clips/0/start_time', 'value': 4},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['revision'], 2)
+        self.assertEqual((self.clip()['startTime'], self.clip()['start_time']), (4, 4))
+
+        self.assertEqual(self.delta({'op': 'remove', 'path': '/tracks/0'}).status_code, 409)
+        self.assertEqual(self.delta({'op': 'test', 'path': '/tracks/0/clips/0/startTime', 'value': 1}, revision=2)
+                         .status_code, 409)
+        self.assertEqual(self.delta({'op': 'remove', 'path': '/nope'}, revision=2).status_code, 400)
+
+    def test_aliases_must_change_together(self):
+        for operations in [
+            [{'op': 'replace', 'path': '/tracks/0/clips/0/startTime', 'value': 4}],
+            [{'op': 'copy', 'from': '/tracks/0/clips/0', 'path': '/tracks/0/clips/0'},
+             {'op': 'replace', 'path': '/tracks/0/clips/1/start_time', 'value': 5}],
+            [{'op': 'add', 'path': '/tracks/-', 'value': {'clips': [effect_clip('Crackle.mp3', 2, startTime=3)]}}],
+        ]:
+            with self.subTest(operations=operations):
+                response = self.delta(*operations)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('start_time', response.json()['error'])
+        self.assertEqual(self.clip()['start_time'], 1)
+
+        # Whole clips carrying both spellings, and removals, are fine
+        response = self.delta(
+            {'op': 'add', 'path': '/tracks/0/clips/-', 'value': effect_clip('Fanfare.mp3', 2)},
+            {'op': 'remove', 'path': '/tracks/0/clips/0/start_time'},
+        )
+        self.assertEqual(response.status_code, 200)
+        # ...and so is filling in the missing spelling (what daw.js sends for such a clip)
+        response = self.delta({'op': 'add', 'path': '/tracks/0/clips/0/start_time', 'value': 1}, revision=2)
+        self.assertEqual(response.status_code, 200)
+
+
+# -------------------------
+# Conditional project writes
+# -------------------------
+@test_settings
+class ProjectETagTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('etag')
+        self.client.force_login(self.owner)
+        self.project = Project.objects.create(owner=self.owner, title='T', project_json={'tracks': []})
+        self.url = reverse('projects-detail', kwargs={'pk': self.project.pk})
+
+    def test_get_returns_etag_and_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.project.etag)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.project.etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_match_is_refused(self):
+        stale = self.project.etag
+        response = self.client.patch(self.url, {'title': 'First'}, content_type='application/json', HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 200)
+        current = response['ETag']
+        self.assertNotEqual(current, stale)
+
+        response = self.client.patch(self.url, {'title': 'Second'}, content_type='application/json', HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response['ETag'], current)
+        self.assertEqual(response.json()['revision'], 2)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).title, 'First')
+
+    def test_writes_without_if_match_or_with_star(self):
+        response = self.client.patch(self.url, {'title': 'A'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(self.url, {'title': 'B'}, content_type='application/json', HTTP_IF_MATCH='*')
+        self.assertEqual(response.status_code, 200)
+
+    def test_delta_and_delete_check_if_match(self):
+        stale = self.project.etag
+        self.client.patch(self.url, {'title': 'Changed'}, content_type='application/json')
+
+        response = self.client.post(
+            reverse('projects-delta', kwargs={'pk': self.project.pk}),
+            {'revision': 2, 'patch': [{'op': 'add', 'path': '/tracks/-', 'value': {'clips': []}}]},
+            content_type='application/json', HTTP_IF_MATCH=stale,
+        )
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).project_json, {'tracks': []})
+
+        response = self.client.delete(self.url, HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        self.assertTrue(Project.objects.filter(pk=self.project.pk).exists())
+
+
+# -------------------------
+# Project listing
+# -------------------------
+@test_settings
+class ProjectListTests(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user('student')
+        self.other = User.objects.create_user('classmate')
+        self.teacher = User.objects.create_user('teacher')
+        self.teacher.profile.is_teacher = True
+        self.teacher.profile.save()
+
+        start = timezone.now() - timedelta(days=30)
+        self.projects = []
+        for i in range(7):
+            owner = self.student if i % 3 else self.other
+            project = Project.objects.create(owner=owner, title=f'P{i}', project_json={'tracks': []})
+            # Two projects share a timestamp: the id breaks the tie
+            Project.objects.filter(pk=project.pk).update(updated=start + timedelta(days=min(i, 5)))
+            self.projects.append(project)
+        self.url = reverse('projects-list')
+
+    def walk(self, **params):
+        ids = []
+        response = self.client.get(self.url, {'page_size': 2, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            ids += [item['id'] for item in page['results']]
+            if not page['next']:
+                return ids
+            response = self.client.get(page['next'])
+
+    def newest_first(self, projects):
+        return [project.pk for project in sorted(projects, key=lambda p: (min(self.projects.index(p), 5), p.pk),
+                                                 reverse=True)]
+
+    def test_pages_cover_every_project_once(self):
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.walk(), self.newest_first(self.projects))
+
+        page = self.client.get(self.url).json()
+        self.assertEqual(len(page['results']), 7)
+        self.assertNotIn('project_json', page['results'][0])
+        self.assertIn('owner_username', page['results'][0])
+
+    def test_students_list_their_own_projects(self):
+        self.client.force_login(self.student)
+        own = [project for project in self.projects if project.owner == self.student]
+        self.assertEqual(self.walk(), self.newest_first(own))
+
+    def test_filters(self):
+        self.client.force_login(self.teacher)
+        others = [project for project in self.projects if project.owner == self.other]
+        self.assertEqual(self.walk(owner=self.other.pk), self.newest_first(others))
+
+        cutoff = Project.objects.get(pk=self.projects[2].pk).updated
+        newer = self.walk(updated_after=cutoff.isoformat())
+        self.assertEqual(newer, self.newest_first(self.projects[3:]))
+        older = self.walk(updated_before=cutoff.isoformat())
+        self.assertEqual(older, self.newest_first(self.projects[:2]))
+
+        for params in ({'owner': 'me'}, {'updated_after': 'yesterday'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    def test_updates_while_paging_are_not_repeated(self):
+        self.client.force_login(self.teacher)
+        first = self.client.get(self.url, {'page_size': 3}).json()
+        # An already-listed project is saved again and jumps to the front
+        Project.objects.get(pk=first['results'][0]['id']).save()
+        rest = self.client.get(first['next']).json()['results']
+        seen = [item['id'] for item in first['results'] + rest]
+        self.assertEqual(len(seen), len(set(seen)))
+
+
+# -------------------------
+# Revision history
+# -------------------------
+@test_settings
+@override_settings(DAW_HISTORY_SNAPSHOT_INTERVAL=3, DAW_HISTORY_KEEP_ALL_DAYS=2, DAW_HISTORY_DAILY_DAYS=30)
+class ThinProjectHistoryTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('history')
+        self.client.force_login(self.owner)
+        # Big enough that a one-value change is stored as a delta
+        clips = [{'file': f'/media/effects/{i}.mp3', 'startTime': i, 'start_time': i} for i in range(40)]
+        self.project = Project.objects.create(owner=self.owner, title='T', project_json={'tracks': [{'clips': clips}]})
+        self.states = {1: self.state()}
+        for revision in range(2, 8):
+            self.project.project_json['tracks'][0]['clips'][revision]['startTime'] = revision * 100
+            self.project.save()
+            self.states[revision] = self.state()
+
+    def state(self):
+        return {'title': self.project.title, 'project_json': copy.deepcopy(self.project.project_json)}
+
+    def entries(self):
+        return {
+            entry.revision: entry
+            for entry in ProjectRevision.objects.filter(project=self.project).select_related('base')
+        }
+
+    def backdate(self, revision, when):
+        ProjectRevision.objects.filter(project=self.project, revision=revision).update(created=when)
+
+    def test_restores_after_rebasing(self):
+        entries = self.entries()
+        self.assertEqual(sorted(entries), list(range(1, 8)))
+        self.assertEqual(
+            [revision for revision, entry in sorted(entries.items()) if entry.is_snapshot], [1, 4, 7],
+        )
+
+        # r1 and r2 on one day, r3 the next: r1 goes, and both of its
+        # remaining deltas lose their snapshot
+        ten_days_ago = timezone.localtime() - timedelta(days=10)
+        self.backdate(1, ten_days_ago.replace(hour=10))
+        self.backdate(2, ten_days_ago.replace(hour=11))
+        self.backdate(3, (ten_days_ago + timedelta(days=1)).replace(hour=10))
+
+        out = StringIO()
+        call_command('thin_project_history', stdout=out)
+        self.assertIn('Removed 1 revision(s) from 1 project(s)', out.getvalue())
+
+        entries = self.entries()
+        self.assertEqual(sorted(entries), list(range(2, 8)))
+        self.assertTrue(entries[2].is_snapshot)
+        self.assertEqual(entries[3].base_id, entries[2].pk)
+        for revision, entry in entries.items():
+            with self.subTest(revision=revision):
+                self.assertEqual(entry.state(), self.states[revision])
+
+        response = self.client.post(reverse('projects-restore', kwargs={'pk': self.project.pk, 'revision': 3}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['revision'], 8)
+        self.assertEqual(Project.objects.get(pk=self.project.pk).project_json, self.states[3]['project_json'])
+
+    def test_dry_run_removes_nothing(self):
+        self.backdate(1, timezone.now() - timedelta(days=10, hours=1))
+        self.backdate(2, timezone.now() - timedelta(days=10))
+        out = StringIO()
+        call_command('thin_project_history', '--dry-run', stdout=out)
+        self.assertIn('Would remove', out.getvalue())
+        self.assertEqual(len(self.entries()), 7)
+
+
+# -------------------------
+# Compact project_json storage
+# -------------------------
+class ProjectCodecTests(TestCase):
+    def test_round_trip(self):
+        for value in [
+            {},
+            {'tracks': []},
+            {'a': 1, 'b': 1.0, 'c': True, 'd': None, 'e': '1', 'f': ['x', 'x', 2], 'g': 'naïve ✓'},
+            {'0': '0', '1': {'0': ['1']}},
+            {'tracks': [{'clips': [
+                {'startTime': 1.5, 'start_time': 1.5, 'file': '/media/a.mp3'},
+                {'startTime': 2, 'start_time': 2.0, 'file': '/media/a.mp3'},
+                {'startTime': 3},
+                {'start_time': 3},
+            ]}]},
+        ]:
+            with self.subTest(value=value):
+                decoded = decode(encode(value))
+                self.assertEqual(decoded, value)
+                self.assertEqual(repr(decoded), repr(value))  # 1, 1.0 and True kept apart
+
+    def test_folded_aliases_are_not_shared(self):
+        value = {'startTime': [1], 'start_time': [1], 'clip': {'startTime': {'s': 1}, 'start_time': {'s': 1}}}
+        decoded = decode(encode(value))
+        self.assertEqual(decoded, value)
+        decoded['startTime'].append(2)
+        decoded['clip']['startTime']['s'] = 5
+        self.assertEqual(decoded['start_time'], [1])
+        self.assertEqual(decoded['clip']['start_time'], {'s': 1})
+
+    def test_corrupt_data(self):
+        for data in [b'', b'\x00abc', bytes([1]) + b'not zlib']:
+            with self.subTest(data=data), self.assertRaises(ProjectCodecError):
+                decode(data)
+
+    def test_field_round_trip(self):
+        owner = User.objects.create_user('codec')
+        project_json = {'tracks': [{'volume': 80, 'clips': [{'startTime': 1.25, 'start_time': 1.25}]}]}
+        project = Project.objects.create(owner=owner, title='T', project_json=project_json)
+        self.assertEqual(Project.objects.get(pk=project.pk).project_json, project_json)
+
+    def test_field_reads_text_written_before_compaction(self):
+        field = Project._meta.get_field('project_json')
+        self.assertEqual(field.from_db_value('{"tracks": []}', None, None), {'tracks': []})
+        self.assertIsNone(field.from_db_value(None, None, None))
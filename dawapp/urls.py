@@ -13,9 +13,15 @@ urlpatterns = [
     path('', include(router.urls)),
     path('project/<int:pk>/', views.ProjectDAWView.as_view(), name='project_daw'),
     path('export/<int:pk>/', views.export_project, name='export_project'),
+    path('export/jobs/<uuid:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/jobs/<uuid:job_id>/download/', views.export_job_download, name='export_job_download'),
     path('project/new/', views.CreateProjectView.as_view(), name='create_project'),
     path('effects/', effects_list, name='effects_list'),
     path('media/upload/', upload_file, name='upload_file'),
+    path('media/upload/chunked/', views.chunked_upload_init, name='chunked_upload_init'),
+    path('media/upload/chunked/<uuid:upload_id>/', views.chunked_upload, name='chunked_upload'),
+    path('media/upload/chunked/<uuid:upload_id>/finalize/', views.chunked_upload_finalize, name='chunked_upload_finalize'),
     path('media/uploads/', user_uploads, name='user_uploads'),
+    path('media/peaks/', views.media_peaks, name='media_peaks'),
     path('media/delete/<int:pk>/', delete_upload, name='delete_upload'),
 ]
@@ -1,7 +1,19 @@
 import json
-from rest_framework import viewsets, permissions
-from .models import Project, MediaFile
-from .serializers import ProjectSerializer, MediaFileSerializer
+import math
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from .models import Project, ProjectRevision, MediaFile, ExportJob, UploadSession, user_upload_path
+from .serializers import ProjectSerializer, ProjectSummarySerializer, MediaFileSerializer
+from .pagination import ProjectCursorPagination
 from .permissions import IsOwnerOrTeacherReadOnly
 from django.contrib.auth.views import LogoutView as DjangoLogoutView
 from django.contrib.auth.decorators import login_required
@@ -9,15 +21,24 @@ from django.views.generic import TemplateView
 from django.utils.decorators import method_decorator
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .audio_utils import mixdown_project
-from django.http import FileResponse
+from .audio_utils import export_mix, mixdown_project, render_window, stream_mixdown
+from . import effects_manifest, peaks, render_cache
+from .json_patch import JsonPatchError, JsonPatchTestFailed, apply_patch
+from .project_codec import ALIASES
+from .cache_utils import content_hash
+from django.http import FileResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.http import content_disposition_header, parse_etags, urlencode
 from django.views.generic.edit import CreateView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
+from django.db import transaction
+from django.utils import timezone as django_timezone
 
 from django.conf import settings
-from pathlib import Path
+from django.views.decorators.http import condition
+from datetime import datetime, timezone
 
 
 # -------------------------
@@ -26,6 +47,8 @@ from pathlib import Path
 class ProjectViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrTeacherReadOnly]
+    # Only the list view is paginated (detail views use get_object below)
+    pagination_class = ProjectCursorPagination
 
     # NOTE on Querysets:
     # 1. get_queryset is used for list views (GET /api/projects/).
@@ -39,9 +62,35 @@ class ProjectViewSet(viewsets.ModelViewSet):
         """
         user = self.request.user
         if hasattr(user, 'profile') and user.profile.is_teacher:
-            return Project.objects.all()
-        # Students only see their own projects in the list
-        return Project.objects.filter(owner=user)
+            queryset = Project.objects.all()
+        else:
+            # Students only see their own projects in the list
+            queryset = Project.objects.filter(owner=user)
+
+        # The listing shows summaries only: never load the project_json blobs
+        queryset = queryset.select_related('owner').defer('project_json')
+
+        # ?owner=<user id>&updated_after=<ISO datetime>&updated_before=<ISO datetime>
+        params = self.request.query_params
+        if params.get('owner'):
+            try:
+                queryset = queryset.filter(owner_id=int(params['owner']))
+            except ValueError:
+                raise ValidationError({'owner': 'Must be a user id'})
+        for param, lookup in (('updated_after', 'updated__gt'), ('updated_before', 'updated__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: 'Must be an ISO 8601 datetime'})
+                if django_timezone.is_naive(value):
+                    value = django_timezone.make_aware(value)
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProjectSummarySerializer
+        return ProjectSerializer
 
     def get_object(self):
         """
@@ -62,6 +111,153 @@ class ProjectViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
+    # Conditional requests: every project carries an ETag (revision plus
+    # content hash). GET with If-None-Match gets 304 when nothing changed;
+    # writes with If-Match get 412 instead of overwriting a newer save.
+    def retrieve(self, request, *args, **kwargs):
+        project = self.get_object()
+        if project.etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(self.get_serializer(project).data)
+        response['ETag'] = project.etag
+        return response
+
+    def update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            project = self.lock_object()
+            failed = precondition_failed(request, project)
+            if failed:
+                return failed
+            response = super().update(request, *args, **kwargs)
+        project.refresh_from_db(fields=['revision', 'content_hash'])
+        response['ETag'] = project.etag
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            failed = precondition_failed(request, self.lock_object())
+            if failed:
+                return failed
+            return super().destroy(request, *args, **kwargs)
+
+    def lock_object(self):
+        """
+        get_object() with the row locked until the end of the transaction,
+        so a precondition check and the write that follows see the same
+        revision.
+        """
+        project = self.get_object()  # permission check
+        return Project.objects.select_for_update().get(pk=project.pk)
+
+    @action(detail=True, methods=['post'])
+    def delta(self, request, pk=None):
+        """
+        Delta save (POST /api/projects/<id>/delta/): apply RFC 6902 patch
+        operations to project_json, e.g.
+        {"revision": 7, "patch": [{"op": "replace", "path": "/tracks/0/clips/2/startTime", "value": 4},
+                                  {"op": "replace", "path": "/tracks/0/clips/2/start_time", "value": 4}]}.
+        The patch must be made against the current revision (409 otherwise)
+        and only the patched JSON is written. Aliased keys (startTime and
+        start_time) must be changed together (400 otherwise).
+        """
+        try:
+            base_revision = int(request.data['revision'])
+            operations = request.data['patch']
+        except (KeyError, TypeError, ValueError):
+            return Response({'error': 'revision and patch are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            project = self.lock_object()
+            failed = precondition_failed(request, project)
+            if failed:
+                return failed
+            if project.revision != base_revision:
+                return Response({'error': 'Project was changed since that revision', 'revision': project.revision},
+                                status=status.HTTP_409_CONFLICT)
+            try:
+                project_json = apply_patch(project.project_json, operations)
+            except JsonPatchTestFailed as e:
+                return Response({'error': str(e), 'revision': project.revision}, status=status.HTTP_409_CONFLICT)
+            except JsonPatchError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if not isinstance(project_json, dict):
+                return Response({'error': 'project_json must be an object'}, status=status.HTTP_400_BAD_REQUEST)
+            # daw.js reads startTime and the mixer start_time: a patch may not
+            # set one without the other (compared by count, as indexes shift)
+            if count_alias_mismatches(project_json) > count_alias_mismatches(project.project_json):
+                return Response({'error': 'startTime and start_time must be changed together'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            # An empty (or no-op) patch changes nothing, so nothing is written
+            if project_json != project.project_json:
+                project.project_json = project_json
+                project.save(update_fields=['project_json', 'updated'])
+
+        return Response({'id': project.pk, 'revision': project.revision}, headers={'ETag': project.etag})
+
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """
+        Saved revisions of the project, newest first (without their data).
+        """
+        project = self.get_object()
+        revisions = ProjectRevision.objects.filter(project=project).values('revision', 'created', 'base_id')
+        return Response([
+            {'revision': entry['revision'], 'created': entry['created'], 'snapshot': entry['base_id'] is None}
+            for entry in revisions
+        ])
+
+    @action(detail=True, methods=['post'], url_path=r'history/(?P<revision>[0-9]+)/restore')
+    def restore(self, request, pk=None, revision=None):
+        """
+        Make an earlier revision current again. The restore is saved as a
+        new revision, so it can itself be undone.
+        """
+        with transaction.atomic():
+            project = self.lock_object()
+            failed = precondition_failed(request, project)
+            if failed:
+                return failed
+            entry = get_object_or_404(ProjectRevision.objects.select_related('base'), project=project, revision=revision)
+            state = entry.state()
+            project.title = state['title']
+            project.project_json = state['project_json']
+            project.save()
+        return Response(ProjectSerializer(project).data, headers={'ETag': project.etag})
+
+
+def count_alias_mismatches(value):
+    """
+    How many objects in value hold two aliased keys (see project_codec.ALIASES,
+    e.g. startTime and start_time) with different values.
+    """
+    if isinstance(value, list):
+        return sum(count_alias_mismatches(item) for item in value)
+    if isinstance(value, dict):
+        mismatched = any(key in value and alias in value and value[key] != value[alias]
+                         for key, alias in ALIASES.items())
+        return mismatched + sum(count_alias_mismatches(item) for item in value.values())
+    return 0
+
+
+def precondition_failed(request, project):
+    """
+    A 412 response if the request's If-Match doesn't name the project's
+    current ETag, else None (also when there is no If-Match).
+    """
+    if_match = request.headers.get('If-Match')
+    if if_match is None:
+        return None
+    etags = parse_etags(if_match)
+    if '*' in etags or project.etag in etags:
+        return None
+    return Response(
+        {'error': 'Project was changed since it was loaded', 'revision': project.revision},
+        status=status.HTTP_412_PRECONDITION_FAILED,
+        headers={'ETag': project.etag},
+    )
+
 
 class MediaFileViewSet(viewsets.ModelViewSet):
     serializer_class = MediaFileSerializer
@@ -124,7 +320,8 @@ class DashboardView(LoginRequiredMixin, TemplateView):
 
         if context['is_teacher']:
             # Group projects by student
-            projects = Project.objects.select_related('owner').all()
+            # Titles and summaries only; project_json is never needed here
+            projects = Project.objects.select_related('owner').defer('project_json').order_by('-updated', '-id')
             student_projects = defaultdict(list)
             for project in projects:
                 student_projects[project.owner].append(project)
@@ -132,7 +329,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             # Convert to a sorted list of tuples for easier template iteration
             context['student_projects'] = sorted(student_projects.items(), key=lambda x: x[0].username)
         else:
-            context['projects'] = Project.objects.filter(owner=user)
+            context['projects'] = Project.objects.filter(owner=user).defer('project_json').order_by('-updated', '-id')
 
         return context
 
@@ -207,60 +404,261 @@ from .models import Project
 
 # dawapp/views.py (Updated export_project function)
 
-def export_project(request, pk):
-    project = get_object_or_404(Project, pk=pk)
-
+def prepare_export_project(project):
+    """
+    Resolve every clip's public URL to a local path and wrap the result
+    in a TempProject that the mixdown utilities can render.
+    """
     # 1. Prepare data and resolve local paths
     project_data_with_paths = project.project_json.copy()
 
-    for track in project_data_with_paths.get('tracks', []):
-        for clip in track.get('clips', []):
-            # Resolve the public URL (clip['file']) to a local filesystem path
-            local_path = resolve_clip_file_path(clip)
-            # CRITICAL: Inject the local path for the mixdown utility to use
-            clip['local_path'] = local_path
+    clips = [clip for track in project_data_with_paths.get('tracks', []) for clip in track.get('clips', [])]
+    resolved = resolve_clip_files(clips)
+    for clip in clips:
+        # CRITICAL: Inject the local path for the mixdown utility to use
+        clip['local_path'] = resolved.paths.get(clip.get('file', ''))
+        # Metadata probed at upload lets the mixer validate uploads without
+        # decoding them (built-in effects have none)
+        if clip.get('file') in resolved.source_info:
+            clip['source_info'] = resolved.source_info[clip['file']]
 
     # 2. Create a temporary project object to pass the modified JSON
-    temp_project = TempProject(project_data_with_paths)
+    return TempProject(project_data_with_paths, resolved.unresolved)
+
+
+def can_access_project(user, project):
+    return getattr(getattr(user, 'profile', None), 'is_teacher', False) or project.owner == user
+
+
+def export_project(request, pk):
+    project = get_object_or_404(Project, pk=pk)
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+    if not can_access_project(request.user, project):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+
+    # POST queues the render for the export worker instead of doing it here
+    if request.method == 'POST':
+        return enqueue_export(request, project)
+
+    temp_project = prepare_export_project(project)
+
+    # ?start=…&end=… (seconds) renders just that window as a quick preview
+    if 'start' in request.GET or 'end' in request.GET:
+        return export_preview(request, project, temp_project)
+
+    # Unchanged projects (same JSON, same source files) are served from the render cache
+    key = render_cache.render_key(temp_project.project_json)
+    etag = render_cache.etag(key)
+    response = None
+    if etag in parse_etags(request.headers.get('If-None-Match', '')) and render_cache.lookup(project.pk, key):
+        response = HttpResponseNotModified()
+    else:
+        # A render evicted (by another export) after its lookup is a miss
+        # like any other and is rendered again below
+        cached_file = open_cached_render(project.pk, key)
+        if cached_file is not None:
+            project.mark_exported()
+            response = FileResponse(
+                cached_file,
+                as_attachment=True,
+                filename=f"{project.title}.mp3",
+                content_type="audio/mpeg"
+            )
+    if response is not None:
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Unresolved-Clips'] = len(temp_project.unresolved)
+        return response
 
     # 3. Call the mixdown utility
     try:
-        # mixdown_project now receives the temporary object with 'local_path' defined
-        mp3_io = mixdown_project(temp_project)
-
-        # 4. Return the final file response
-        return FileResponse(
-            mp3_io,
-            as_attachment=True,
-            filename=f"{project.title}.mp3",
-            content_type="audio/mpeg"
-        )
+        # ?stream=0 falls back to rendering the whole MP3 before responding
+        if request.GET.get('stream') == '0':
+            # mixdown_project now receives the temporary object with 'local_path' defined
+            mp3_io = mixdown_project(temp_project)
+            render_cache.store_file(project.pk, key, mp3_io)
+            mp3_io.seek(0)
+            project.mark_exported()
+
+            # 4. Return the final file response
+            response = FileResponse(
+                mp3_io,
+                as_attachment=True,
+                filename=f"{project.title}.mp3",
+                content_type="audio/mpeg"
+            )
+        else:
+            # 4. Stream the MP3 while it is being rendered and encoded block by block
+            chunks = render_cache.store_chunks(project.pk, key, stream_mixdown(temp_project))
+            response = StreamingHttpResponse(mark_exported_when_sent(project, chunks), content_type="audio/mpeg")
+            response['Content-Disposition'] = content_disposition_header(True, f"{project.title}.mp3")
+
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        response['X-Unresolved-Clips'] = len(temp_project.unresolved)
+        return response
     except Exception as e:
         import traceback
         traceback.print_exc()
         from django.http import HttpResponse
         return HttpResponse(f"Export failed: {str(e)}. Check server logs for file path errors.", status=500)
+
+
+def mark_exported_when_sent(project, chunks):
+    """
+    Pass chunks through, marking the project exported only once the whole
+    render has been sent (not if it fails or the client goes away).
+    """
+    yield from chunks
+    project.mark_exported()
+
+
+def export_preview(request, project, temp_project):
+    """
+    Render a short time window of a project as WAV (default) or MP3 (?format=mp3).
+    """
+    try:
+        start = float(request.GET.get('start', 0))
+        end = float(request.GET['end'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'start and end must be numbers of seconds'}, status=400)
+    # float() also accepts 'nan' and 'inf'
+    if not (math.isfinite(start) and math.isfinite(end)):
+        return JsonResponse({'error': 'start and end must be numbers of seconds'}, status=400)
+    if start < 0 or end <= start:
+        return JsonResponse({'error': 'end must be after start, and start must not be negative'}, status=400)
+    max_seconds = getattr(settings, 'DAW_PREVIEW_MAX_SECONDS', 60)
+    if end - start > max_seconds:
+        return JsonResponse({'error': f'Previews can be at most {max_seconds:g} seconds long'}, status=400)
+
+    audio_format = 'mp3' if request.GET.get('format') == 'mp3' else 'wav'
+    try:
+        audio_io = export_mix(render_window(temp_project, start, end), audio_format)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        from django.http import HttpResponse
+        return HttpResponse(f"Preview failed: {str(e)}. Check server logs for file path errors.", status=500)
+
+    response = FileResponse(
+        audio_io,
+        filename=f"{project.title} ({start:g}-{end:g}s).{audio_format}",
+        content_type="audio/mpeg" if audio_format == 'mp3' else "audio/wav"
+    )
+    response['X-Unresolved-Clips'] = len(temp_project.unresolved)
+    return response
+
+
+# -------------------------
+# Export jobs (rendered by `manage.py run_export_worker`)
+# -------------------------
+def export_job_data(job):
+    data = {
+        'id': str(job.id),
+        'project': job.project_id,
+        'status': job.status,
+        'progress': round(job.progress, 3),
+        'status_url': reverse('export_job_status', kwargs={'job_id': job.id}),
+        'download_url': None,
+        'unresolved': job.unresolved,
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        data['download_url'] = reverse('export_job_download', kwargs={'job_id': job.id})
+    if job.status == ExportJob.STATUS_FAILED:
+        data['error'] = job.error
+    return data
+
+
+def enqueue_export(request, project):
+    # Access was checked by export_project
+    job = ExportJob.objects.create(project=project, requested_by=request.user)
+    return JsonResponse(export_job_data(job), status=202)
+
+
+def get_export_job(request, job_id):
+    job = get_object_or_404(ExportJob.objects.select_related('project'), pk=job_id)
+    if not can_access_project(request.user, job.project):
+        from django.core.exceptions import PermissionDenied
+        raise PermissionDenied("You do not have access to this export.")
+    return job
+
+
+@login_required
+def export_job_status(request, job_id):
+    """Report queued/running/done/failed plus render progress for an export job."""
+    job = get_export_job(request, job_id)
+    job.fail_if_stalled()
+    return JsonResponse(export_job_data(job))
+
+
+@login_required
+def export_job_download(request, job_id):
+    """Serve the MP3 rendered by a finished export job, straight from the render cache."""
+    job = get_export_job(request, job_id)
+    if job.status != ExportJob.STATUS_DONE or not job.render_key:
+        return JsonResponse({'error': 'Export is not ready', 'status': job.status}, status=409)
+
+    etag = render_cache.etag(job.render_key)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        cached_file = open_cached_render(job.project_id, job.render_key)
+        if cached_file is None:
+            # Evicted, or dropped because the project was saved since
+            return JsonResponse({'error': 'This export is no longer available, please export again'}, status=410)
+        response = FileResponse(
+            cached_file,
+            as_attachment=True,
+            filename=f"{job.project.title}.mp3",
+            content_type="audio/mpeg"
+        )
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def open_cached_render(project_id, key):
+    """
+    The stored render opened for reading, or None if it isn't cached. The
+    cache can evict it at any moment, so a file gone by the time it is
+    opened counts as a miss.
+    """
+    path = render_cache.lookup(project_id, key)
+    if path is None:
+        return None
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        return None
+
+
 # ------------------------
 # List available sound clips
 # ------------------------
 
 
-def effects_list(request):
-    # Hardcode path to effects
-    effects_dir = Path(settings.BASE_DIR) / "media" / "effects"  # <-- Correct folder
-    clips = []
-
-    if effects_dir.exists():
-        for file in effects_dir.glob("*.mp3"):
-            clips.append({
-                "name": file.stem,
-                "file": f"/media/effects/{file.name}"  # matches MEDIA_URL
-            })
+def effects_manifest_etag(request):
+    return effects_manifest.get_manifest().version
+
+
+def effects_manifest_last_modified(request):
+    return datetime.fromtimestamp(effects_manifest.get_manifest().last_modified, tz=timezone.utc)
 
-    else:
-        print("Effects directory does not exist:", effects_dir)
 
-    return JsonResponse(clips, safe=False)
+@condition(etag_func=effects_manifest_etag, last_modified_func=effects_manifest_last_modified)
+def effects_list(request):
+    """
+    The built-in effects with duration, size and content hash.
+    Served from the in-memory manifest; unchanged libraries get a 304.
+    """
+    clips = [
+        dict(entry, peaks_url=peaks_url(entry['file']))
+        for entry in effects_manifest.get_manifest().entries
+    ]
+    response = JsonResponse(clips, safe=False)
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 
 from django.views import View
@@ -291,6 +689,68 @@ class DeleteProjectView(LoginRequiredMixin, View):
 ###------------------------
 # File upload function
 ### ------------------------
+UPLOAD_LIMIT_ERROR = 'Upload limit reached. Delete your existing file first.'
+
+
+def upload_limit_reached(user):
+    """
+    Students may keep one upload at a time; teachers are not limited.
+    """
+    if getattr(getattr(user, 'profile', None), 'is_teacher', False):
+        return False
+    existing = MediaFile.objects.filter(owner=user).count()
+    print(f"Existing uploads: {existing}")
+    return existing >= 1
+
+
+def finish_upload(media_file):
+    """
+    Post-process a newly stored upload and return the JSON describing it.
+    """
+    # Probe duration/format once here instead of on every export
+    media_file.update_metadata()
+
+    # Build the waveform peaks now so the timeline never has to fetch the audio
+    file_path = media_file.file.path
+    try:
+        peaks.build(file_path)
+    except Exception as e:
+        print(f"DEBUG WARNING: Could not build peaks for {file_path}: {e}")
+
+    return {
+        'id': media_file.id,
+        'filename': media_file.filename,
+        'file_url': media_file.file.url,
+        'peaks_url': peaks_url(media_file.file.url),
+        **media_file.metadata(),
+    }
+
+
+def create_media_file_from_path(owner, filename, local_path, digest=None):
+    """
+    Create a MediaFile by renaming local_path (already on the media disk)
+    into storage, so the data is not copied. digest is the file's sha256
+    if the caller already computed it.
+    """
+    media_file = MediaFile(owner=owner, filename=filename)
+    media_file.file.name = media_file.file.storage.save_local(local_path, filename, digest=digest)
+    media_file.save()
+    return media_file
+
+
+def upload_part_path(owner, suffix='part'):
+    """
+    A hidden scratch path in the owner's upload folder (same filesystem as
+    the finished upload, so it can be renamed into place).
+    """
+    part_path = os.path.join(
+        settings.MEDIA_ROOT,
+        user_upload_path(MediaFile(owner=owner), f'.{uuid.uuid4()}.{suffix}'),
+    )
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    return part_path
+
+
 @login_required
 @csrf_exempt
 def upload_file(request):
@@ -313,12 +773,8 @@ def upload_file(request):
         return JsonResponse({'error': 'No file uploaded'}, status=400)
 
     # Check if student already has an upload (limit 1)
-    is_teacher = getattr(getattr(request.user, 'profile', None), 'is_teacher', False)
-    if not is_teacher:
-        existing = MediaFile.objects.filter(owner=request.user).count()
-        print(f"Existing uploads: {existing}")
-        if existing >= 1:
-            return JsonResponse({'error': 'Upload limit reached. Delete your existing file first.'}, status=400)
+    if upload_limit_reached(request.user):
+        return JsonResponse({'error': UPLOAD_LIMIT_ERROR}, status=400)
 
     filename = request.POST.get('filename', uploaded_file.name)
     print(f"Filename: {filename}")
@@ -347,11 +803,7 @@ def upload_file(request):
         else:
             print(f"DEBUG WARNING: File NOT found at {file_path}")
 
-        return JsonResponse({
-            'id': media_file.id,
-            'filename': media_file.filename,
-            'file_url': media_file.file.url,
-        })
+        return JsonResponse(finish_upload(media_file))
 
     except Exception as e:
         import traceback
@@ -388,10 +840,201 @@ def user_uploads(request):
         'filename': f.filename,
         'file_url': f.file.url,
         'owner': f.owner.username,
+        'peaks_url': peaks_url(f.file.url),
+        **f.metadata(),
     } for f in files]
 
     return JsonResponse(data, safe=False)
 
+
+# --------------------------
+# Chunked (resumable) uploads
+# --------------------------
+# 1. POST media/upload/chunked/ {filename, size} starts an UploadSession
+# 2. PUT media/upload/chunked/<id>/ with Content-Range: bytes start-end/size
+#    appends a chunk (GET reports the offset to resume from, DELETE aborts)
+# 3. POST media/upload/chunked/<id>/finalize/ {sha256} creates the MediaFile
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+UPLOAD_COPY_BYTES = 64 * 1024
+# Chunk bodies up to this size are received in memory, larger ones in a temp file
+UPLOAD_SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def upload_session_data(session):
+    return {
+        'upload_id': str(session.id),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.received,
+        'chunk_size': getattr(settings, 'DAW_UPLOAD_CHUNK_BYTES', 4 * 1024 * 1024),
+        'chunk_url': reverse('chunked_upload', kwargs={'upload_id': session.id}),
+        'finalize_url': reverse('chunked_upload_finalize', kwargs={'upload_id': session.id}),
+    }
+
+
+def discard_stale_upload_sessions(user):
+    max_age = getattr(settings, 'DAW_UPLOAD_SESSION_MAX_AGE', 24 * 60 * 60)
+    cutoff = django_timezone.now() - timedelta(seconds=max_age)
+    for session in UploadSession.objects.filter(owner=user, updated__lt=cutoff):
+        session.discard()
+
+
+@login_required
+def chunked_upload_init(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        filename = str(data['filename'])[:200]
+        size = int(data['size'])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'filename and size are required'}, status=400)
+    if not filename or size <= 0:
+        return JsonResponse({'error': 'filename and size are required'}, status=400)
+    max_bytes = getattr(settings, 'DAW_UPLOAD_MAX_BYTES', 200 * 1024 * 1024)
+    if size > max_bytes:
+        return JsonResponse({'error': f'Uploads are limited to {max_bytes} bytes'}, status=413)
+
+    # Fail early rather than after the whole file has been sent
+    if upload_limit_reached(request.user):
+        return JsonResponse({'error': UPLOAD_LIMIT_ERROR}, status=400)
+
+    discard_stale_upload_sessions(request.user)
+    sessions_per_user = getattr(settings, 'DAW_UPLOAD_SESSIONS_PER_USER', 3)
+    if UploadSession.objects.filter(owner=request.user).count() >= sessions_per_user:
+        return JsonResponse({'error': f'At most {sessions_per_user} uploads at a time'}, status=429)
+    session = UploadSession.objects.create(owner=request.user, filename=filename, size=size)
+    os.makedirs(os.path.dirname(session.part_path), exist_ok=True)
+    open(session.part_path, 'wb').close()
+    return JsonResponse(upload_session_data(session), status=201)
+
+
+@login_required
+def chunked_upload(request, upload_id):
+    if request.method == 'GET':
+        session = get_object_or_404(UploadSession, pk=upload_id, owner=request.user)
+        return JsonResponse(upload_session_data(session))
+
+    if request.method == 'DELETE':
+        get_object_or_404(UploadSession, pk=upload_id, owner=request.user).discard()
+        return JsonResponse({'success': True})
+
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    match = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+    if not match:
+        return JsonResponse({'error': 'Content-Range: bytes <start>-<end>/<size> is required'}, status=400)
+    start, end, total = (int(value) for value in match.groups())
+
+    session = get_object_or_404(UploadSession, pk=upload_id, owner=request.user)
+    if total != session.size or end < start or end >= total:
+        return JsonResponse({'error': 'Invalid Content-Range', **upload_session_data(session)}, status=416)
+    if start != session.received:
+        # Resume from where the server actually is
+        return JsonResponse({'error': 'Chunk does not start at the current offset', **upload_session_data(session)}, status=409)
+
+    # Receive the whole body before taking the row lock, so a slow client
+    # never holds a lock (or a transaction) while it sends
+    length = end - start + 1
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES) as spool:
+        written = 0
+        while written < length:
+            chunk = request.read(min(UPLOAD_COPY_BYTES, length - written))
+            if not chunk:
+                break
+            spool.write(chunk)
+            written += len(chunk)
+        if written != length:
+            return JsonResponse({'error': 'Chunk body is shorter than its Content-Range', **upload_session_data(session)}, status=400)
+        spool.seek(0)
+
+        # The row lock serialises chunks of the same upload; only the offset
+        # check and a local copy happen under it
+        with transaction.atomic():
+            session = get_object_or_404(UploadSession.objects.select_for_update(), pk=upload_id, owner=request.user)
+            if start != session.received:
+                # Another request moved the offset while this one was sending
+                return JsonResponse({'error': 'Chunk does not start at the current offset', **upload_session_data(session)}, status=409)
+
+            # Anything past the offset (a chunk cut off earlier) is overwritten
+            with open(session.part_path, 'r+b') as f:
+                f.seek(start)
+                f.truncate()
+                shutil.copyfileobj(spool, f, UPLOAD_COPY_BYTES)
+
+            session.received = start + length
+            session.save(update_fields=['received', 'updated'])
+
+    return JsonResponse(upload_session_data(session))
+
+
+@login_required
+def chunked_upload_finalize(request, upload_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    try:
+        checksum = str(json.loads(request.body)['sha256']).lower()
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'sha256 is required'}, status=400)
+
+    with transaction.atomic():
+        session = get_object_or_404(UploadSession.objects.select_for_update(), pk=upload_id, owner=request.user)
+        if session.received != session.size:
+            return JsonResponse({'error': 'Upload is incomplete', **upload_session_data(session)}, status=409)
+
+        if content_hash(session.part_path) != checksum:
+            session.discard()
+            return JsonResponse({'error': 'Checksum mismatch, please upload the file again'}, status=400)
+
+        if upload_limit_reached(request.user):
+            return JsonResponse({'error': UPLOAD_LIMIT_ERROR}, status=400)
+
+        # Rename the part file into place: the data is never copied again
+        media_file = create_media_file_from_path(request.user, session.filename, session.part_path, digest=checksum)
+        session.delete()
+
+    print(f"Created MediaFile from chunked upload: {media_file.id}")
+    return JsonResponse(finish_upload(media_file))
+
+
+# --------------------------
+# Waveform peaks
+# --------------------------
+def peaks_url(file_url):
+    return reverse('media_peaks') + '?' + urlencode({'file': file_url})
+
+
+def media_peaks(request):
+    """
+    Serve the peak-pyramid sidecar (see peaks.py) for a clip file URL,
+    building it first if it is missing or stale.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Not authenticated'}, status=401)
+
+    local_path = resolve_clip_file_path({'file': request.GET.get('file', '')})
+    if not local_path:
+        return JsonResponse({'error': 'File not found'}, status=404)
+
+    try:
+        path = peaks.ensure(local_path)
+    except Exception as e:
+        print(f"ERROR: Could not build peaks for {local_path}: {e}")
+        return JsonResponse({'error': 'Could not read audio file'}, status=422)
+
+    st = os.stat(path)
+    etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='application/octet-stream')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 # --------------------------
 # Delete a current user upload
 # --------------------------
@@ -412,7 +1055,7 @@ def delete_upload(request, pk):
     if media_file.owner != request.user:
         return JsonResponse({'error': 'Permission denied'}, status=403)
 
-    media_file.file.delete(save=False)
+    # The stored blob (and its peaks) goes once no other MediaFile shares it
     media_file.delete()
     return JsonResponse({'success': True})
 
@@ -435,8 +1078,10 @@ import os
 
 # Define a temporary class to wrap the resolved JSON for mixdown_project
 class TempProject:
-    def __init__(self, json_data):
+    def __init__(self, json_data, unresolved=None):
         self.project_json = json_data
+        # Clips whose file could not be found (see resolve_clip_files)
+        self.unresolved = unresolved or []
 
 # dawapp/views.py (Inside resolve_clip_file_path)
 
@@ -448,45 +1093,62 @@ from .models import MediaFile # Assuming this is your model for user uploads
 from .models import MediaFile
 
 
-# Define the custom effects root (Absolute path to the directory containing your built-in effects MP3s)
-EFFECTS_ROOT = '/home/podcastmaker/mysite/media/effects'
-
-def resolve_clip_file_path(clip_data):
-    file_url = clip_data.get('file', '')
-
-    # --- Case 1: Built-in Effects (Must be checked first) ---
-    EFFECTS_URL_PREFIX = settings.MEDIA_URL + 'effects/' # '/media/effects/'
+# Result of resolving a batch of clip URLs: paths maps each resolvable URL
+# to its local path, source_info maps upload URLs to their probed metadata,
+# and unresolved lists the clips that could not be found
+ResolvedClips = namedtuple('ResolvedClips', ['paths', 'source_info', 'unresolved'])
 
-    if file_url.startswith(EFFECTS_URL_PREFIX):
 
-        # 1. Strip the '/media/effects/' prefix to get the filename
-        relative_path = file_url.replace(EFFECTS_URL_PREFIX, '', 1)
-
-        # 2. Join the ABSOLUTE server path (EFFECTS_ROOT) with the filename
-        local_path = os.path.join(EFFECTS_ROOT, relative_path)
-
-        # 3. CRITICAL: Verify the file exists at this path
-        if os.path.exists(local_path):
-             return local_path
-        else:
-             print(f"ERROR: Effect file NOT FOUND at: {local_path}")
-             return None
-
-    # --- Case 2: User Uploaded Files (Handle if the user adds a file later) ---
-    if file_url.startswith(settings.MEDIA_URL):
-        try:
-            # Gets the relative path (e.g., 'user_6/filename.mp3')
-            relative_path = file_url.replace(settings.MEDIA_URL, '', 1)
-
-            # This relies on your file paths being clean now (user_6/...)
-            media_file = MediaFile.objects.get(file=relative_path)
+def resolve_clip_files(clips):
+    """
+    Resolve the file URLs of many clips at once: built-in effects are
+    checked against the cached effects manifest and uploads are looked up
+    with a single query, whatever the number of clips.
+    """
+    effects_prefix = effects_manifest.effects_url_prefix()  # '/media/effects/'
+    effect_paths = None
+    paths = {}
+    source_info = {}
+    unresolved = []
+    upload_urls = {}  # relative path (e.g. 'user_6/filename.mp3') -> URL
+
+    for file_url in dict.fromkeys(clip.get('file', '') for clip in clips):
+        # --- Case 1: Built-in Effects (Must be checked first) ---
+        if file_url.startswith(effects_prefix):
+            if effect_paths is None:
+                effect_paths = effects_manifest.effect_paths()
+            if file_url in effect_paths:
+                paths[file_url] = effect_paths[file_url]
+        # --- Case 2: User Uploaded Files ---
+        elif file_url.startswith(settings.MEDIA_URL):
+            upload_urls[file_url[len(settings.MEDIA_URL):]] = file_url
+
+    if upload_urls:
+        for media_file in MediaFile.objects.filter(file__in=list(upload_urls)):
+            file_url = upload_urls[media_file.file.name]
+            paths[file_url] = media_file.file.path
+            if media_file.duration is not None:
+                source_info[file_url] = media_file.metadata()
+
+    for clip in clips:
+        file_url = clip.get('file', '')
+        if file_url not in paths:
+            if file_url.startswith(effects_prefix):
+                reason = 'Effect not found'
+            elif file_url.startswith(settings.MEDIA_URL):
+                reason = 'Upload not found'
+            else:
+                reason = 'Unknown file location'
+            print(f"ERROR: {reason} for URL: {file_url}")
+            unresolved.append({
+                'filename': clip.get('filename') or clip.get('name') or file_url,
+                'file': file_url,
+                'reason': reason,
+            })
 
-            # Returns the absolute local path
-            return media_file.file.path
+    return ResolvedClips(paths, source_info, unresolved)
 
-        except MediaFile.DoesNotExist:
-            print(f"ERROR: MediaFile not found in database for URL: {file_url}")
-            return None
 
-    return None
+def resolve_clip_file_path(clip_data):
+    return resolve_clip_files([clip_data]).paths.get(clip_data.get('file', ''))
 # --- End of helper functions ---
\ No newline at end of file
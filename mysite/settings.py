@@ -179,3 +179,53 @@ CSRF_TRUSTED_ORIGINS = [
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 SECURE_SSL_REDIRECT = True
+
+# Decoded-PCM cache used by the exporter (kept outside MEDIA_ROOT so it is never served)
+DAW_PCM_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'pcm')
+DAW_PCM_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+# Worker processes used to decode clip sources in parallel during export
+DAW_DECODE_WORKERS = 4
+# Frames rendered per block when streaming an export into the MP3 encoder
+DAW_EXPORT_BLOCK_FRAMES = 64 * 1024
+# Longest window (seconds) export ?start=…&end=… renders as a preview
+DAW_PREVIEW_MAX_SECONDS = 60
+# Export jobs: a running job without a worker heartbeat for this long is
+# requeued (or reported failed), and a job nobody claims within
+# DAW_EXPORT_QUEUE_TIMEOUT is reported failed (seconds)
+DAW_EXPORT_HEARTBEAT_TIMEOUT = 60
+DAW_EXPORT_QUEUE_TIMEOUT = 300
+# The DAW's Export button queues a job, so `python manage.py run_export_worker`
+# must be running alongside the web server (without it, jobs fail after
+# DAW_EXPORT_QUEUE_TIMEOUT). Finished jobs are deleted after this many seconds;
+# their MP3 lives in the render cache below
+DAW_EXPORT_JOB_MAX_AGE = 24 * 60 * 60
+# Cache of finished mixdowns, keyed by project content + source file identities
+DAW_RENDER_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'renders')
+DAW_RENDER_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+# Per-track stems, so re-exports only re-render the tracks that changed
+DAW_STEM_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'stems')
+DAW_STEM_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+# Chunked uploads: suggested chunk size, and how long an unfinished upload can be resumed
+DAW_UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024  # 4 MB
+DAW_UPLOAD_SESSION_MAX_AGE = 24 * 60 * 60  # seconds
+DAW_UPLOAD_MAX_BYTES = 200 * 1024 * 1024  # 200 MB per file
+DAW_UPLOAD_SESSIONS_PER_USER = 3  # unfinished uploads a user can have open
+# Recorder MP3 conversion: concurrent ffmpeg encoders per process, how many
+# requests may wait for one, and for how long (seconds)
+AUDIO_RECORDER_TRANSCODE_WORKERS = 2
+AUDIO_RECORDER_TRANSCODE_QUEUE = 8
+AUDIO_RECORDER_TRANSCODE_TIMEOUT = 30
+# Live recording sessions (chunks uploaded and decoded while recording)
+AUDIO_RECORDER_LIVE_DIR = os.path.join(BASE_DIR, 'cache', 'live')
+AUDIO_RECORDER_LIVE_DECODERS = 16  # long-running decoders per process
+AUDIO_RECORDER_LIVE_IDLE_TIMEOUT = 60  # seconds without chunks before a decoder gives up
+AUDIO_RECORDER_LIVE_MAX_AGE = 24 * 60 * 60  # seconds before abandoned takes are deleted
+AUDIO_RECORDER_LIVE_SESSIONS_PER_USER = 3  # takes a user can be recording at once
+AUDIO_RECORDER_LIVE_MAX_CHUNK_BYTES = 2 * 1024 * 1024  # 2 MB per uploaded chunk
+AUDIO_RECORDER_LIVE_MAX_TAKE_BYTES = 100 * 1024 * 1024  # 100 MB per take
+# Project revision history: a full snapshot every N revisions, deltas in between
+DAW_HISTORY_SNAPSHOT_INTERVAL = 20
+# thin_project_history keeps every revision for this many days, then one per
+# day up to DAW_HISTORY_DAILY_DAYS, then one per week
+DAW_HISTORY_KEEP_ALL_DAYS = 2
+DAW_HISTORY_DAILY_DAYS = 30
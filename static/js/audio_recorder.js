@@ -5,10 +5,20 @@ let recordedBlob;
 let audioBuffer;
 let previousBuffer = null;
 
+// Live takes: each recording is uploaded and decoded on the server while it
+// is recorded. liveSegments describes audioBuffer as pieces of those takes
+// ({ take, start, end } in seconds); if any of them failed to upload,
+// Download falls back to sending the whole WAV.
+const LIVE_TIMESLICE_MS = 1000;
+let liveTake = null;
+let liveSegments = [];
+let previousSegments = null;
+
 const startBtn = document.getElementById('startBtn');
 const stopBtn = document.getElementById('stopBtn');
 const startOverBtn = document.getElementById('startOverBtn');
 const downloadBtn = document.getElementById('downloadBtn');
+const saveBtn = document.getElementById('saveBtn');
 const preview = document.getElementById('preview');
 
 const applyClipBtn = document.getElementById('applyClipBtn');
@@ -62,8 +72,12 @@ startBtn.onclick = async () => {
     mediaRecorder = new MediaRecorder(stream);
     audioChunks = [];
 
-    mediaRecorder.ondataavailable = e => audioChunks.push(e.data);
-    mediaRecorder.start();
+    liveTake = startLiveTake();
+    mediaRecorder.ondataavailable = e => {
+        audioChunks.push(e.data);
+        sendLiveChunk(liveTake, e.data);
+    };
+    mediaRecorder.start(LIVE_TIMESLICE_MS);
 
     // Start timer
     recordingStartTime = Date.now();
@@ -125,8 +139,14 @@ stopBtn.onclick = async () => {
         await audioContext.resume();
     }
 
+    const take = liveTake;
+    liveTake = null;
+    finishLiveTake(take);
+
     const arrayBuffer = await recordedBlob.arrayBuffer();
     const newAudioBuffer = await audioContext.decodeAudioData(arrayBuffer);
+
+    liveSegments = [...liveSegments, { take, start: 0, end: newAudioBuffer.duration }];
     
     // --- FIX: Normalize the new buffer's amplitude to prevent loudness spikes ---
     normalizeAudioBuffer(newAudioBuffer); 
@@ -177,6 +197,7 @@ stopBtn.onclick = async () => {
     // Enable buttons
     applyClipBtn.disabled = false;
     downloadBtn.disabled = false;
+    saveBtn.disabled = false;
 
     // Render waveform and update handles
     renderWaveform();
@@ -200,6 +221,8 @@ startOverBtn.onclick = () => {
     audioBuffer = null;
     previousBuffer = null;
     recordedBlob = null;
+    liveSegments = [];
+    previousSegments = null;
 
     clipStart = 0;
     clipEnd = 0;
@@ -212,6 +235,7 @@ startOverBtn.onclick = () => {
     applyClipBtn.disabled = true;
     undoBtn.disabled = true;
     downloadBtn.disabled = true;
+    saveBtn.disabled = true;
 
     ctx.clearRect(0, 0, waveformCanvas.width, waveformCanvas.height);
 
@@ -229,6 +253,8 @@ applyClipBtn.onclick = () => {
     if (!audioBuffer || clipStart >= clipEnd) return;
 
     previousBuffer = audioBuffer;
+    previousSegments = liveSegments;
+    liveSegments = clipSegments(liveSegments, clipStart, clipEnd);
 
     const length = Math.floor((clipEnd - clipStart) * audioBuffer.sampleRate);
     const newBuffer = audioContext.createBuffer(
@@ -266,6 +292,8 @@ undoBtn.onclick = () => {
 
     audioBuffer = previousBuffer;
     previousBuffer = null;
+    liveSegments = previousSegments;
+    previousSegments = null;
 
     clipStart = 0;
     clipEnd = audioBuffer.duration;
@@ -285,14 +313,19 @@ undoBtn.onclick = () => {
 downloadBtn.onclick = async () => {
     if (!audioBuffer) return;
 
-    const wavBlob = audioBufferToWavBlob(audioBuffer);
-    const formData = new FormData();
-    formData.append('audio', wavBlob, 'recording.wav');
-
-    const response = await fetch('/audio/convert/', {
-        method: 'POST',
-        body: formData,
-    });
+    // Takes that were uploaded while recording only need encoding;
+    // otherwise send the whole WAV
+    let response = await renderLiveSegments(liveSegments);
+    if (!response || (!response.ok && response.status !== 503)) {
+        const wavBlob = audioBufferToWavBlob(audioBuffer);
+
+        // Send the WAV as the raw request body: the server pipes it straight into the encoder
+        response = await fetch('/audio/convert/', {
+            method: 'POST',
+            headers: { 'Content-Type': 'audio/wav' },
+            body: wavBlob,
+        });
+    }
 
     if (response.ok) {
         const mp3Blob = await response.blob();
@@ -334,11 +367,62 @@ downloadBtn.onclick = async () => {
         setTimeout(() => {
             URL.revokeObjectURL(url);
         }, 100);
+    } else if (response.status === 503) {
+        alert('The converter is busy right now. Please try again in a moment.');
     } else {
         alert('Error converting audio.');
     }
 };
 
+// ---------------------------
+// Save MP3 straight to the user's uploads (usable in the DAW without downloading)
+// ---------------------------
+saveBtn.onclick = async () => {
+    if (!audioBuffer) return;
+    saveBtn.disabled = true;
+
+    const filename = `recording_${new Date().toISOString().slice(0, 19).replace(/[-:T]/g, '')}.mp3`;
+    const url = `/audio/save/?filename=${encodeURIComponent(filename)}`;
+
+    // Same choice as Download: the live takes if they all made it, else the WAV
+    let response = null;
+    if (liveSegments.length) {
+        const finished = await Promise.all(liveSegments.map(segment => segment.take.done));
+        if (!finished.includes(false)) {
+            response = await fetch(url, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+                body: JSON.stringify({
+                    takes: liveSegments.map(segment => ({ id: segment.take.id, start: segment.start, end: segment.end }))
+                })
+            }).catch(() => null);
+        }
+    }
+    if (!response || response.status === 404) {
+        response = await fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'audio/wav', 'X-CSRFToken': getCookie('csrftoken') },
+            body: audioBufferToWavBlob(audioBuffer),
+        }).catch(() => null);
+    }
+
+    saveBtn.disabled = false;
+    if (!response) {
+        alert('Could not save the recording. Please check your connection.');
+        return;
+    }
+    const data = await response.json().catch(() => ({}));
+    if (response.ok) {
+        alert(`Saved as ${data.filename}. It is now in your files in the DAW.`);
+    } else if (response.status === 401) {
+        alert('Please log in to save recordings to your files.');
+    } else if (response.status === 503) {
+        alert('The converter is busy right now. Please try again in a moment.');
+    } else {
+        alert(data.error || 'Error saving audio.');
+    }
+};
+
 // ---------------------------
 // Waveform Rendering
 // ---------------------------
@@ -444,6 +528,111 @@ document.addEventListener('touchend', () => {
     draggingHandle = null;
 });
 
+// ---------------------------
+// Live takes
+// ---------------------------
+function getCookie(name) {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let cookie of cookies) {
+            cookie = cookie.trim();
+            if (cookie.startsWith(name + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+function startLiveTake() {
+    const take = { offset: 0, failed: false };
+    take.ready = fetch('/audio/live/', {
+        method: 'POST',
+        headers: { 'X-CSRFToken': getCookie('csrftoken') }
+    })
+        .then(resp => resp.ok ? resp.json() : Promise.reject(resp))
+        .then(data => { take.id = data.session_id; take.chunkUrl = data.chunk_url; take.finishUrl = data.finish_url; })
+        .catch(err => { console.log('Live upload unavailable:', err); take.failed = true; });
+    take.queue = take.ready;
+    return take;
+}
+
+function sendLiveChunk(take, blob) {
+    if (!take || !blob.size) return;
+    // Chunks go up strictly in order, one at a time
+    take.queue = take.queue.then(async () => {
+        if (take.failed) return;
+        for (let attempt = 0; attempt < 3; attempt++) {
+            try {
+                const resp = await fetch(`${take.chunkUrl}?offset=${take.offset}`, {
+                    method: 'POST',
+                    headers: { 'X-CSRFToken': getCookie('csrftoken') },
+                    body: blob
+                });
+                if (resp.ok) {
+                    take.offset = (await resp.json()).offset;
+                    return;
+                }
+                if (resp.status !== 409) break;
+                // The server has a different offset: resending can't fix a gap
+                if ((await resp.json()).offset !== take.offset + blob.size) break;
+                take.offset += blob.size;
+                return;
+            } catch (err) {
+                await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+            }
+        }
+        take.failed = true;
+    });
+}
+
+function finishLiveTake(take) {
+    take.done = take.queue.then(async () => {
+        if (take.failed) return false;
+        const resp = await fetch(take.finishUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+            body: JSON.stringify({ size: take.offset })
+        }).catch(() => null);
+        return !!(resp && resp.ok);
+    });
+}
+
+// Keep only [start, end) (seconds) of the audio the segments describe
+function clipSegments(segments, start, end) {
+    const clipped = [];
+    let position = 0;
+    for (const segment of segments) {
+        const length = segment.end - segment.start;
+        const from = Math.max(start, position);
+        const to = Math.min(end, position + length);
+        if (to > from) {
+            clipped.push({
+                take: segment.take,
+                start: segment.start + (from - position),
+                end: segment.start + (to - position)
+            });
+        }
+        position += length;
+    }
+    return clipped;
+}
+
+async function renderLiveSegments(segments) {
+    if (!segments || !segments.length) return null;
+    const finished = await Promise.all(segments.map(segment => segment.take.done));
+    if (finished.includes(false)) return null;
+    return fetch('/audio/live/render/', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken') },
+        body: JSON.stringify({
+            takes: segments.map(segment => ({ id: segment.take.id, start: segment.start, end: segment.end }))
+        })
+    }).catch(() => null);
+}
+
 // ---------------------------
 // Helper: Normalization (Volume Consistency Fix)
 // ---------------------------
@@ -42,6 +42,12 @@ document.addEventListener("DOMContentLoaded", () => {
             : [{ clips: [] }, { clips: [] }, { clips: [] }, { clips: [] }]
     };
 
+    // What the server last stored, so Save can send just the difference
+    // (a JSON Patch against that revision) instead of the whole project
+    let savedRevision = windowData.revision ?? null;
+    let savedEtag = windowData.etag || null;
+    let savedJson = JSON.parse(JSON.stringify(windowData.project_json || {}));
+
     const MAX_DURATION = 120; // seconds
     const TIMELINE_WIDTH = 1000; // px
     const GRID_INTERVAL = 1; // seconds
@@ -105,6 +111,76 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     }
 
+    // -----------------------------
+    // Waveform peaks
+    // -----------------------------
+    // One fetch per file; see dawapp/peaks.py for the sidecar layout
+    const peaksCache = new Map();
+
+    function loadPeaks(fileUrl) {
+        if (!peaksCache.has(fileUrl)) {
+            const request = fetch('/api/media/peaks/?file=' + encodeURIComponent(fileUrl))
+                .then(res => {
+                    if (!res.ok) throw new Error('Peaks request failed: ' + res.status);
+                    return res.arrayBuffer();
+                })
+                .then(parsePeaks)
+                .catch(err => {
+                    peaksCache.delete(fileUrl);
+                    throw err;
+                });
+            peaksCache.set(fileUrl, request);
+        }
+        return peaksCache.get(fileUrl);
+    }
+
+    function parsePeaks(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 8));
+        if (magic !== 'DAWPEAK1') throw new Error('Not a peaks file');
+        const frameRate = view.getUint32(8, true);
+        const frames = Number(view.getBigUint64(12, true));
+        const levelCount = view.getUint32(20, true);
+
+        const levels = [];
+        let dataOffset = 24 + levelCount * 8;
+        for (let i = 0; i < levelCount; i++) {
+            const samplesPerPeak = view.getUint32(24 + i * 8, true);
+            const count = view.getUint32(28 + i * 8, true);
+            // Copy out: data offsets are not guaranteed to be 2-byte aligned for Int16Array views
+            const data = new Int16Array(buffer.slice(dataOffset, dataOffset + count * 4));
+            levels.push({ samplesPerPeak, count, data });
+            dataOffset += count * 4;
+        }
+        return { frameRate, frames, duration: frames / frameRate, levels };
+    }
+
+    function drawWaveform(canvas, peaks, width, height) {
+        canvas.width = Math.max(1, Math.round(width));
+        canvas.height = Math.max(1, Math.round(height));
+        // Coarsest level that still has at least one peak per pixel
+        let level = peaks.levels[0];
+        for (const candidate of peaks.levels) {
+            if (candidate.count >= canvas.width) level = candidate;
+        }
+        const ctx = canvas.getContext('2d');
+        const mid = canvas.height / 2;
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        ctx.fillStyle = 'rgba(255, 255, 255, 0.45)';
+        for (let x = 0; x < canvas.width; x++) {
+            const from = Math.floor(x * level.count / canvas.width);
+            const to = Math.max(from + 1, Math.floor((x + 1) * level.count / canvas.width));
+            let lo = 0, hi = 0;
+            for (let i = from; i < to && i < level.count; i++) {
+                lo = Math.min(lo, level.data[i * 2]);
+                hi = Math.max(hi, level.data[i * 2 + 1]);
+            }
+            const top = mid - (hi / 32768) * mid;
+            const bottom = mid - (lo / 32768) * mid;
+            ctx.fillRect(x, top, 1, Math.max(1, bottom - top));
+        }
+    }
+
     // -----------------------------
     // Clip element
     // -----------------------------
@@ -145,14 +221,33 @@ document.addEventListener("DOMContentLoaded", () => {
         clipEl.style.left = clipStart * timelineScale + 'px';
         clipEl.style.width = ((clip.duration ?? 0.1) * timelineScale) + 'px';
 
-        // Load audio metadata for accurate duration
-        const audio = new Audio(clip.file);
-        audio.addEventListener('loadedmetadata', () => {
+        // Peaks give the exact duration and a waveform without downloading the audio
+        loadPeaks(clip.file).then(peaks => {
             if (!clip.duration || clip.duration === 5) {
-                clip.duration = audio.duration;
+                clip.duration = peaks.duration;
                 clipEl.dataset.clip = JSON.stringify(clip);
                 clipEl.style.width = clip.duration * timelineScale + 'px';
             }
+            const canvas = document.createElement('canvas');
+            canvas.style.position = 'absolute';
+            canvas.style.left = '0';
+            canvas.style.top = '0';
+            canvas.style.width = '100%';
+            canvas.style.height = '100%';
+            canvas.style.pointerEvents = 'none';
+            clipEl.appendChild(canvas);
+            drawWaveform(canvas, peaks, clip.duration * timelineScale, clipEl.offsetHeight);
+        }).catch(err => {
+            console.warn('No peaks for', clip.file, err);
+            // Fall back to loading audio metadata for the duration
+            const audio = new Audio(clip.file);
+            audio.addEventListener('loadedmetadata', () => {
+                if (!clip.duration || clip.duration === 5) {
+                    clip.duration = audio.duration;
+                    clipEl.dataset.clip = JSON.stringify(clip);
+                    clipEl.style.width = clip.duration * timelineScale + 'px';
+                }
+            });
         });
 
         // ---------------- Drag / Click management ----------------
@@ -676,7 +771,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     clipEl.style.cssText = 'flex:1;margin:0;';
                     clipEl.textContent = file.filename;
                     clipEl.draggable = true;
-                    clipEl.dataset.clip = JSON.stringify({ filename: file.filename, file: file.file_url, duration: 5 });
+                    clipEl.dataset.clip = JSON.stringify({ filename: file.filename, file: file.file_url, duration: file.duration || 5 });
 
                     clipEl.addEventListener('dragstart', e => {
                         e.dataTransfer.setData('clip', clipEl.dataset.clip);
@@ -753,24 +848,99 @@ document.addEventListener("DOMContentLoaded", () => {
         const files = Array.from(e.dataTransfer.files);
         files.forEach(file => {
             if (!['audio/mpeg', 'audio/mp3'].includes(file.type)) { alert('Only MP3 files supported.'); return; }
-            const formData = new FormData();
-            formData.append('file', file);
-            formData.append('filename', file.name);
-            formData.append('project_id', projectData.id);
-            fetch('/api/media/upload/', {
-                method: 'POST',
-                headers: { 'X-CSRFToken': getCookie('csrftoken') },
-                body: formData
-            })
-            .then(resp => resp.ok ? resp.json() : Promise.reject(resp))
-            .then(data => {
-                console.log('Uploaded file:', data);
-                loadUserUploads();
-            })
-            .catch(err => { console.error(err); alert('Upload failed'); });
+            // Chunked uploads need SubtleCrypto for the checksum (HTTPS only)
+            const upload = window.crypto && crypto.subtle ? uploadChunked(file) : uploadWhole(file);
+            upload
+                .then(data => {
+                    console.log('Uploaded file:', data);
+                    loadUserUploads();
+                })
+                .catch(err => { console.error(err); alert(err.message || 'Upload failed'); });
         });
     });
 
+    function uploadWhole(file) {
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('filename', file.name);
+        formData.append('project_id', projectData.id);
+        return fetch('/api/media/upload/', {
+            method: 'POST',
+            headers: { 'X-CSRFToken': getCookie('csrftoken') },
+            body: formData
+        })
+        .then(resp => resp.ok ? resp.json() : Promise.reject(resp));
+    }
+
+    // -----------------------------
+    // Chunked, resumable uploads
+    // -----------------------------
+    const CHUNK_RETRIES = 5;
+
+    function jsonRequest(url, method, body) {
+        return fetch(url, {
+            method,
+            headers: { 'X-CSRFToken': getCookie('csrftoken'), 'Content-Type': 'application/json' },
+            body: body === undefined ? undefined : JSON.stringify(body)
+        }).then(resp => resp.json().then(data => {
+            if (!resp.ok) {
+                const err = new Error(data.error || 'Upload failed');
+                err.status = resp.status;
+                err.data = data;
+                throw err;
+            }
+            return data;
+        }));
+    }
+
+    async function uploadChunked(file) {
+        // Remember the session so a reload (or a dropped connection) resumes it
+        const resumeKey = `daw-upload:${file.name}:${file.size}:${file.lastModified}`;
+        let session = null;
+        const savedId = localStorage.getItem(resumeKey);
+        if (savedId) {
+            session = await jsonRequest(`/api/media/upload/chunked/${savedId}/`, 'GET').catch(() => null);
+        }
+        if (!session) {
+            session = await jsonRequest('/api/media/upload/chunked/', 'POST', { filename: file.name, size: file.size });
+            localStorage.setItem(resumeKey, session.upload_id);
+        }
+
+        let offset = session.offset;
+        let failures = 0;
+        while (offset < file.size) {
+            const end = Math.min(offset + session.chunk_size, file.size);
+            try {
+                const resp = await fetch(session.chunk_url, {
+                    method: 'PUT',
+                    headers: {
+                        'X-CSRFToken': getCookie('csrftoken'),
+                        'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`
+                    },
+                    body: file.slice(offset, end)
+                });
+                const data = await resp.json();
+                // 409 carries the server's offset: just carry on from there
+                if (!resp.ok && resp.status !== 409) throw new Error(data.error || 'Chunk failed');
+                offset = data.offset;
+                failures = 0;
+            } catch (err) {
+                if (++failures > CHUNK_RETRIES) throw err;
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                const status = await jsonRequest(session.chunk_url, 'GET').catch(() => null);
+                if (status) offset = status.offset;
+            }
+        }
+
+        const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        const sha256 = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        try {
+            return await jsonRequest(session.finalize_url, 'POST', { sha256 });
+        } finally {
+            localStorage.removeItem(resumeKey);
+        }
+    }
+
      // -----------------------------
     // Playback Helpers
     // -----------------------------
@@ -917,28 +1087,18 @@ document.addEventListener("DOMContentLoaded", () => {
                 });
             });
 
-            const payload = {
-                id: projectData.id,
-                title: projectData.title || "Untitled Project",
-                project_json: { tracks: projectData.tracks }
-            };
-
-            fetch(`/api/projects/${projectData.id}/`, {
-                method: 'PUT',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCookie('csrftoken')
-                },
-                body: JSON.stringify(payload)
-            })
-            .then(resp => resp.ok ? resp.json() : Promise.reject(resp))
+            saveProject(JSON.parse(JSON.stringify({ tracks: projectData.tracks })))
             .then(data => {
                 console.log("Project saved:", data);
                 alert("Project saved successfully.");
             })
             .catch(err => {
                 console.error(err);
-                alert("Save failed");
+                if (err instanceof Response && err.status === 412) {
+                    alert("This project was saved somewhere else (another tab?) since you opened it. Reload the page to get the latest version.");
+                } else {
+                    alert("Save failed");
+                }
             });
         });
         saveButton.dataset.listenerAttached = "true";
@@ -946,17 +1106,129 @@ document.addEventListener("DOMContentLoaded", () => {
 
 
 
+    async function saveProject(projectJson) {
+        const headers = {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCookie('csrftoken')
+        };
+
+        // Delta save: only the operations that turn the saved JSON into this one
+        if (savedRevision !== null) {
+            const resp = await fetch(`/api/projects/${projectData.id}/delta/`, {
+                method: 'POST',
+                headers,
+                body: JSON.stringify({ revision: savedRevision, patch: jsonDiff(savedJson, projectJson) })
+            });
+            if (resp.ok) {
+                const data = await resp.json();
+                savedRevision = data.revision;
+                savedEtag = resp.headers.get('ETag') || savedEtag;
+                savedJson = projectJson;
+                return data;
+            }
+            // 409: saved elsewhere since this page loaded; 400: patch didn't fit.
+            // Either way, fall back to saving the whole project
+            if (resp.status !== 409 && resp.status !== 400) throw resp;
+        }
+
+        // If-Match: refuse (412) rather than overwrite a newer save from another tab
+        const resp = await fetch(`/api/projects/${projectData.id}/`, {
+            method: 'PUT',
+            headers: savedEtag ? { ...headers, 'If-Match': savedEtag } : headers,
+            body: JSON.stringify({
+                id: projectData.id,
+                title: projectData.title || "Untitled Project",
+                project_json: projectJson
+            })
+        });
+        if (!resp.ok) throw resp;
+        const data = await resp.json();
+        savedRevision = data.revision ?? null;
+        savedEtag = resp.headers.get('ETag') || null;
+        savedJson = projectJson;
+        return data;
+    }
+
+    // RFC 6902 operations turning `before` into `after` (plain JSON values)
+    function jsonDiff(before, after, path = '', ops = []) {
+        const isObject = v => v !== null && typeof v === 'object' && !Array.isArray(v);
+        const escape = key => String(key).replace(/~/g, '~0').replace(/\//g, '~1');
+
+        if (Array.isArray(before) && Array.isArray(after)) {
+            const common = Math.min(before.length, after.length);
+            for (let i = 0; i < common; i++) jsonDiff(before[i], after[i], `${path}/${i}`, ops);
+            for (let i = before.length - 1; i >= common; i--) ops.push({ op: 'remove', path: `${path}/${i}` });
+            for (let i = common; i < after.length; i++) ops.push({ op: 'add', path: `${path}/-`, value: after[i] });
+        } else if (isObject(before) && isObject(after)) {
+            Object.keys(before).forEach(key => {
+                if (!(key in after)) ops.push({ op: 'remove', path: `${path}/${escape(key)}` });
+            });
+            Object.keys(after).forEach(key => {
+                if (key in before) jsonDiff(before[key], after[key], `${path}/${escape(key)}`, ops);
+                else ops.push({ op: 'add', path: `${path}/${escape(key)}`, value: after[key] });
+            });
+        } else if (JSON.stringify(before) !== JSON.stringify(after)) {
+            ops.push({ op: 'replace', path, value: after });
+        }
+        return ops;
+    }
+
     // -----------------------------
     // Export Project
     // -----------------------------
-    document.getElementById('export-project').addEventListener('click', () => {
-        const exportUrl = `/api/export/${projectData.id}/`;
-        const a = document.createElement('a');
-        a.href = exportUrl;
-        a.download = (projectData.title || 'Untitled Project') + ".mp3";
-        document.body.appendChild(a);
-        a.click();
-        document.body.removeChild(a);
+    // Queue the render on the export worker, poll its status, then download
+    const exportButton = document.getElementById('export-project');
+    exportButton.addEventListener('click', () => {
+        const buttonText = exportButton.textContent;
+        exportButton.disabled = true;
+
+        const finish = () => {
+            exportButton.disabled = false;
+            exportButton.textContent = buttonText;
+        };
+
+        const poll = (statusUrl) => {
+            fetch(statusUrl)
+                .then(resp => resp.ok ? resp.json() : Promise.reject(resp))
+                .then(job => {
+                    if (job.status === 'done') {
+                        const a = document.createElement('a');
+                        a.href = job.download_url;
+                        a.download = (projectData.title || 'Untitled Project') + ".mp3";
+                        document.body.appendChild(a);
+                        a.click();
+                        document.body.removeChild(a);
+                        finish();
+                        if (job.unresolved && job.unresolved.length) {
+                            const missing = job.unresolved.map(c => `${c.filename} (${c.reason})`).join('\n');
+                            alert("These clips could not be found and were left out of the export:\n" + missing);
+                        }
+                    } else if (job.status === 'failed') {
+                        alert("Export failed: " + (job.error || "unknown error"));
+                        finish();
+                    } else {
+                        exportButton.textContent = `Exporting ${Math.round(job.progress * 100)}%`;
+                        setTimeout(() => poll(statusUrl), 1000);
+                    }
+                })
+                .catch(err => {
+                    console.error(err);
+                    alert("Export failed");
+                    finish();
+                });
+        };
+
+        fetch(`/api/export/${projectData.id}/`, {
+            method: 'POST',
+            headers: { 'X-CSRFToken': getCookie('csrftoken') }
+        })
+        .then(resp => resp.ok ? resp.json() : Promise.reject(resp))
+        .then(job => poll(job.status_url))
+        .catch(err => {
+            console.error(err);
+            alert("Export failed");
+            finish();
+        });
     });
 
     // -----------------------------